@@ -1,22 +1,54 @@
+import time
+_T0 = time.perf_counter()  # prima degli import pesanti: misura dell'avvio
+
+import logging
 import sys
-from PyQt6 import QtWidgets
+from PyQt6 import QtWidgets, QtCore
 from app_frantoio.util.config import load_config
-from app_frantoio.core.auth import AuthClient
-from app_frantoio.core.fb_client import FirebaseRestClient
-from app_frantoio.core.sqlite_client import SQLiteClient
-from app_frantoio.core.repository import HybridRepository
+from app_frantoio.core.bootstrap import make_auth, make_repository, make_transport, setup_metrics
+from app_frantoio.core.fb_stream import FirebaseStream
 from app_frantoio.ui.main_window import MainWindow, LoginDialog
 from app_frantoio.ui.main_window import _app_icon
 
+log = logging.getLogger("app_frantoio")
+
+def _check_startup(what: str, budget_ms: float, t0: float = _T0):
+    """Registra il tempo trascorso da t0; warning oltre il budget."""
+    ms = (time.perf_counter() - t0) * 1000
+    if budget_ms and ms > budget_ms:
+        log.warning("%s dopo %.0f ms (budget %.0f ms)", what, ms, budget_ms)
+    else:
+        log.info("%s dopo %.0f ms", what, ms)
+    return ms
+
+class _AuthBridge(QtCore.QObject):
+    """Porta nel thread della GUI l'errore del rinnovo automatico del token."""
+    expired = QtCore.pyqtSignal(object)
+
+def _login(auth, parent=None) -> bool:
+    """Dialog di login finché riesce; False se l'utente annulla."""
+    dlg = LoginDialog(parent)
+    while True:
+        if dlg.exec() != QtWidgets.QDialog.DialogCode.Accepted:
+            return False
+        email, password = dlg.get_credentials()
+        if not email or not password:
+            QtWidgets.QMessageBox.warning(parent, "Errore", "Inserisci email e password.")
+            continue
+        try:
+            auth.sign_in_password(email, password)
+            return True
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(parent, "Login fallito", str(e))
+
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     cfg = load_config()
     api_key = cfg.get("api_key", "").strip()
     db_url = cfg.get("database_url", "").strip()
     collection = cfg.get("collection", "molitura")
-    archive_db = cfg.get("archive_db", "frantoio_archive.db")
-    hybrid_days = int(cfg.get("hybrid_days", 7))
-    retention_days = int(cfg.get("retention_days", 7))
-    
+    budget_ms = float(cfg.get("startup_budget_ms", 0) or 0)
+
     app = QtWidgets.QApplication(sys.argv)
     QtWidgets.QApplication.setWindowIcon(_app_icon())
 
@@ -25,34 +57,49 @@ def main():
                                        "Imposta 'api_key' e 'database_url' in config.json")
         sys.exit(1)
 
-    # Login email/password
-    auth = AuthClient(api_key)
-    dlg = LoginDialog()
-    while True:
-        result = dlg.exec()
-        if result == QtWidgets.QDialog.DialogCode.Accepted:
-            email, password = dlg.get_credentials()
-            if not email or not password:
-                QtWidgets.QMessageBox.warning(None, "Errore", "Inserisci email e password.")
-                continue
-            try:
-                auth.sign_in_password(email, password)
-                break
-            except Exception as e:
-                QtWidgets.QMessageBox.warning(None, "Login fallito", str(e))
-                continue
-        else:
+    setup_metrics(cfg)
+    http = make_transport(cfg)
+
+    # Login email/password, saltato se c'è una sessione salvata ancora valida
+    auth = make_auth(cfg, http)
+    if auth.try_restore():
+        _check_startup("Sessione ripresa", budget_ms)
+    else:
+        QtCore.QTimer.singleShot(0, lambda: _check_startup("Login pronto", budget_ms))
+        if not _login(auth):
             sys.exit(0)
+    auth.start_auto_refresh()
+    t_login = time.perf_counter()
 
     # Clienti
-    fb = FirebaseRestClient(db_url, collection, get_token_callable=lambda: auth.id_token)
-    sql = SQLiteClient(archive_db)
-    repo = HybridRepository(fb, sql, hybrid_days, retention_days)
+    repo = make_repository(cfg, auth, http)
+    if cfg.get("streaming"):
+        repo.attach_stream(FirebaseStream(db_url, collection,
+                                          get_token_callable=auth.get_token,
+                                          refresh_token_callable=auth.refresh_id_token,
+                                          transport=http))
 
-    # UI
+    # UI (il tempo passato nel dialog di login non conta)
     win = MainWindow(cfg, repo)
     win.show()
-    sys.exit(app.exec())
+
+    # sessione revocata (password cambiata, utente disabilitato...): nuovo login
+    def _on_auth_expired(e):
+        QtWidgets.QMessageBox.warning(win, "Sessione scaduta",
+                                      f"Il rinnovo della sessione è stato rifiutato ({e}).\n"
+                                      "Accedi di nuovo per continuare.")
+        if not _login(auth, win):
+            win.close()
+            return
+        auth.start_auto_refresh()
+        win.refresh_data()
+    auth_bridge = _AuthBridge()
+    auth_bridge.expired.connect(_on_auth_expired)
+    auth.on_auth_error = auth_bridge.expired.emit
+    QtCore.QTimer.singleShot(0, lambda: _check_startup("Finestra pronta", budget_ms, t_login))
+    rc = app.exec()
+    auth.stop_auto_refresh()
+    sys.exit(rc)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeRTDB:
+    """Server HTTP locale che imita la REST API di Firebase RTDB quanto basta per
+    i client dell'app: GET con orderBy ("dataOra" o "$key") / startAt / endAt /
+    limitToFirst, ETag con if-none-match e if-match, PATCH multi-path, PUT, DELETE
+    e stream SSE (put iniziale, poi put/patch a ogni scrittura e keep-alive).
+
+    Ogni richiesta attende latency_ms prima di rispondere. Il token "auth" non
+    viene controllato. Uso:
+
+        srv = FakeRTDB(latency_ms=40).start()
+        srv.load("molitura", generate_season(10000))
+        ... FirebaseRestClient(srv.url, "molitura", lambda: "tok") ...
+        srv.stop()
+    """
+
+    def __init__(self, latency_ms: float = 0.0, keepalive_s: float = 30.0):
+        self.latency_ms = float(latency_ms)
+        self.keepalive_s = float(keepalive_s)
+        self.root: Dict[str, Any] = {}
+        self.lock = threading.RLock()
+        self.requests: List[Tuple[str, str]] = []
+        self._subscribers: List[Tuple[List[str], "queue.Queue"]] = []
+        self._sorted_cache: Dict[Tuple[str, str], Tuple[int, list]] = {}
+        self._version = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.url = ""
+
+    # ---- ciclo di vita ----
+    def start(self) -> "FakeRTDB":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="FakeRTDB", daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return self
+
+    def stop(self):
+        for _, q in list(self._subscribers):
+            q.put(None)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def load(self, collection: str, items: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        with self.lock:
+            node = self.root.setdefault(collection, {})
+            n = 0
+            for key, val in items:
+                node[key] = val
+                n += 1
+            self._version += 1
+        return n
+
+    # ---- albero dati ----
+    def get(self, parts: List[str]) -> Any:
+        node: Any = self.root
+        for p in parts:
+            if not isinstance(node, dict) or p not in node:
+                return None
+            node = node[p]
+        return node
+
+    def set(self, parts: List[str], value: Any):
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for p in parts[:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                child = node[p] = {}
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def write(self, parts: List[str], value: Any, event: str):
+        """Scrittura (put o patch) con notifica agli stream in ascolto."""
+        with self.lock:
+            if event == "patch":
+                for k, v in value.items():
+                    self.set(parts + [p for p in k.split("/") if p], v)
+            else:
+                self.set(parts, value)
+            self._version += 1
+            for sub_parts, q in list(self._subscribers):
+                n = len(sub_parts)
+                if parts[:n] == sub_parts:
+                    rel = "/" + "/".join(parts[n:])
+                    q.put((event, {"path": rel, "data": value}))
+                elif sub_parts[:len(parts)] == parts:
+                    # scrittura su un antenato: si rimanda il nodo intero
+                    q.put(("put", {"path": "/", "data": self.get(sub_parts)}))
+
+    def query(self, parts: List[str], q: Dict[str, str]) -> Any:
+        node = self.get(parts)
+        if q.get("shallow") == "true":
+            return {k: True for k in node} if isinstance(node, dict) else node
+        order = q.get("orderBy")
+        if order is None or not isinstance(node, dict):
+            return node
+        field = json.loads(order)
+        key = ("/".join(parts), field)
+        with self.lock:
+            cached = self._sorted_cache.get(key)
+            if cached is None or cached[0] != self._version:
+                if field == "$key":
+                    items = sorted(node.items())
+                else:
+                    items = sorted(node.items(), key=lambda kv: (kv[1] or {}).get(field) or 0)
+                cached = self._sorted_cache[key] = (self._version, items)
+        items = cached[1]
+        start = json.loads(q["startAt"]) if "startAt" in q else None
+        end = json.loads(q["endAt"]) if "endAt" in q else None
+        out = {}
+        limit = int(q.get("limitToFirst", 0)) or None
+        for k, v in items:
+            val = k if field == "$key" else (v or {}).get(field)
+            if start is not None and (val is None or val < start):
+                continue
+            if end is not None and (val is None or val > end):
+                break
+            out[k] = v
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def subscribe(self, parts: List[str]) -> "queue.Queue":
+        q: "queue.Queue" = queue.Queue()
+        with self.lock:
+            self._subscribers.append((parts, q))
+            q.put(("put", {"path": "/", "data": self.get(parts)}))
+        return q
+
+    def unsubscribe(self, q: "queue.Queue"):
+        with self.lock:
+            self._subscribers = [s for s in self._subscribers if s[1] is not q]
+
+
+def _etag(body: bytes) -> str:
+    return hashlib.md5(body).hexdigest()
+
+
+def _make_handler(db: FakeRTDB):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _parse(self):
+            u = urlparse(self.path)
+            path = u.path[:-5] if u.path.endswith(".json") else u.path
+            parts = [p for p in path.split("/") if p]
+            q = {k: v[0] for k, v in parse_qs(u.query).items()}
+            with db.lock:
+                db.requests.append((self.command, u.path))
+            if db.latency_ms:
+                time.sleep(db.latency_ms / 1000)
+            return parts, q
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"null")
+
+        def _send(self, code: int, obj: Any, etag: bool = False):
+            body = json.dumps(obj, separators=(",", ":")).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", _etag(body))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts, q = self._parse()
+            if "text/event-stream" in (self.headers.get("Accept") or ""):
+                return self._stream(parts)
+            with db.lock:
+                data = db.query(parts, q)
+                body = json.dumps(data, separators=(",", ":")).encode()
+            if self.headers.get("X-Firebase-ETag") == "true":
+                tag = _etag(body)
+                if self.headers.get("if-none-match") == tag:
+                    self.send_response(304)
+                    self.send_header("ETag", tag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if self.headers.get("X-Firebase-ETag") == "true":
+                self.send_header("ETag", _etag(body))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _check_if_match(self, parts) -> bool:
+            expected = self.headers.get("if-match")
+            if expected is None:
+                return True
+            current = db.get(parts)
+            body = json.dumps(current, separators=(",", ":")).encode()
+            if expected == _etag(body):
+                return True
+            # come RTDB: 412 con valore ed ETag correnti
+            self._send(412, current, etag=True)
+            return False
+
+        def do_PUT(self):
+            parts, _ = self._parse()
+            value = self._body()
+            with db.lock:
+                if not self._check_if_match(parts):
+                    return
+                db.write(parts, value, "put")
+            self._send(200, value, etag=True)
+
+        def do_PATCH(self):
+            parts, _ = self._parse()
+            value = self._body()
+            if not isinstance(value, dict):
+                return self._send(400, {"error": "Invalid data; couldn't parse JSON object."})
+            keys = {k.strip("/") for k in value}
+            for k in keys:
+                segs = k.split("/")
+                for i in range(1, len(segs)):
+                    if "/".join(segs[:i]) in keys:
+                        return self._send(400, {"error": f"Invalid data; path {k} overlaps {'/'.join(segs[:i])}"})
+            db.write(parts, value, "patch")
+            self._send(200, value)
+
+        def do_DELETE(self):
+            parts, _ = self._parse()
+            with db.lock:
+                if not self._check_if_match(parts):
+                    return
+                db.write(parts, None, "put")
+            self._send(200, None)
+
+        def _stream(self, parts):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            q = db.subscribe(parts)
+            try:
+                while True:
+                    try:
+                        item = q.get(timeout=db.keepalive_s)
+                    except queue.Empty:
+                        item = ("keep-alive", None)
+                    if item is None:
+                        return
+                    event, data = item
+                    msg = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+                    self.wfile.write(msg.encode())
+                    self.wfile.flush()
+            except OSError:
+                pass
+            finally:
+                db.unsubscribe(q)
+
+    return Handler
@@ -0,0 +1,148 @@
+"""Verifica della LeaderLease (e del sync tra più PC) contro il RTDB finto.
+
+    python -m app_frantoio.bench.lease_check
+
+Controlla: un solo vincitore tra N PC in gara, failover alla scadenza, rilascio,
+LeaseLost per chi l'ha persa e che un PC senza lease riceve comunque, con la copia
+completa, il pagamento cambiato su un record più vecchio del margine incrementale.
+Esce con codice 1 al primo controllo fallito.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List
+from app_frantoio.bench.fake_rtdb import FakeRTDB
+from app_frantoio.core.fb_client import FirebaseRestClient
+from app_frantoio.core.lease import LeaderLease, LeaseLost
+from app_frantoio.core.repository import HybridRepository
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.core.transport import HttpTransport
+from app_frantoio.util.time_utils import TZ
+
+PATH = "locks/mirror"
+COLLECTION = "molitura"
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def _check(ok: bool, what: str):
+    print(f"  {'ok  ' if ok else 'FAIL'} {what}", file=sys.stderr)
+    if not ok:
+        raise CheckFailed(what)
+
+
+def _client(srv: FakeRTDB) -> FirebaseRestClient:
+    return FirebaseRestClient(srv.url, COLLECTION, lambda: "check", transport=HttpTransport(retries=0))
+
+
+def check_contention(srv: FakeRTDB, pcs: int):
+    srv.write(PATH.split("/"), None, "put")
+    leases = [LeaderLease(_client(srv), PATH, holder=f"pc{i}", ttl_s=60) for i in range(pcs)]
+    won: List[bool] = [False] * pcs
+    start = threading.Barrier(pcs)
+
+    def run(i):
+        start.wait()
+        won[i] = leases[i].acquire()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(pcs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    holder = (srv.get(PATH.split("/")) or {}).get("holder")
+    _check(sum(won) == 1, f"{pcs} PC in gara: un solo vincitore ({sum(won)})")
+    _check(won[int(holder[2:])] if holder else False, f"il nodo indica il vincitore ({holder})")
+    winner = leases[int(holder[2:])]
+    _check(winner.acquire(), "il detentore rinnova la propria lease")
+    _check(not leases[(int(holder[2:]) + 1) % pcs].acquire(), "gli altri restano esclusi")
+
+
+def check_failover(srv: FakeRTDB, ttl_s: float):
+    srv.write(PATH.split("/"), None, "put")
+    a = LeaderLease(_client(srv), PATH, holder="A", ttl_s=ttl_s)
+    b = LeaderLease(_client(srv), PATH, holder="B", ttl_s=ttl_s)
+    _check(a.acquire(), "A prende la lease libera")
+    _check(not b.acquire(), "B non la prende prima della scadenza")
+    # A smette di rinnovare (PC spento): l'header Date è al secondo, si aspetta un secondo in più
+    time.sleep(ttl_s + 1.1)
+    _check(b.acquire(), "B la prende dopo la scadenza")
+    try:
+        a.ensure()
+        lost = False
+    except LeaseLost:
+        lost = True
+    _check(lost, "A riceve LeaseLost se prova a continuare")
+    b.release()
+    _check(srv.get(PATH.split("/")) is None, "il rilascio libera il nodo")
+    _check(a.acquire(), "dopo il rilascio A la riprende subito")
+    b.release()  # non è più sua: non deve toccare il nodo
+    _check((srv.get(PATH.split("/")) or {}).get("holder") == "A", "il rilascio di chi non la tiene non ha effetto")
+    a.release()
+
+
+def check_follower_full_mirror(srv: FakeRTDB, workdir: str):
+    srv.write(PATH.split("/"), None, "put")
+    now = datetime.now(TZ)
+    old_ms = int((now - timedelta(days=4)).timestamp() * 1000)
+    new_ms = int((now - timedelta(hours=1)).timestamp() * 1000)
+    srv.write([COLLECTION, "old1"], {"name": "Rossi", "weight": 100.0, "pagamento": "", "dataOra": old_ms}, "put")
+    # un record recente: il watermark lascia old1 fuori dal margine incrementale
+    srv.write([COLLECTION, "new1"], {"name": "Bianchi", "weight": 50.0, "pagamento": "", "dataOra": new_ms}, "put")
+
+    def repo(name: str) -> HybridRepository:
+        fb = _client(srv)
+        r = HybridRepository(fb, SQLiteClient(os.path.join(workdir, f"{name}.db")), 7, 7,
+                             mirror_lookback_hours=48, cleanup_pause_s=0)
+        r.attach_lease(LeaderLease(fb, PATH, holder=name, ttl_s=60))
+        return r
+    leader, follower = repo("leader"), repo("follower")
+    _check(leader.mirror_and_cleanup()["leader"], "il primo PC tiene la lease")
+    res = follower.mirror_and_cleanup()
+    _check(not res["leader"] and res["deleted"] == 0, "il secondo copia senza cancellare")
+    srv.write([COLLECTION, "old1", "pagamento"], "POS", "put")
+    follower.mirror_and_cleanup()
+    rows = follower.sql.fetch_range(old_ms, old_ms)
+    _check(bool(rows) and rows[0].pagamento == "", "la copia incrementale non rilegge oltre il margine")
+    follower.sql.set_state("mirror_full_at", 0)  # passate full_mirror_hours
+    follower.mirror_and_cleanup()
+    rows = follower.sql.fetch_range(old_ms, old_ms)
+    _check(bool(rows) and rows[0].pagamento == "POS",
+           "pagamento su un record oltre il margine arriva anche al PC senza lease")
+    leader.sql.close()
+    follower.sql.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Verifica della lease tra più PC su RTDB finto")
+    p.add_argument("--pcs", type=int, default=10, help="PC in gara per la lease")
+    p.add_argument("--ttl", type=float, default=2.0,
+                   help="durata della lease nel test di failover (s, almeno 2: Date è al secondo)")
+    args = p.parse_args(argv)
+
+    srv = FakeRTDB().start()
+    workdir = tempfile.mkdtemp(prefix="frantoio-lease-")
+    try:
+        print("Contesa:", file=sys.stderr)
+        check_contention(srv, max(2, args.pcs))
+        print("Scadenza e rilascio:", file=sys.stderr)
+        check_failover(srv, args.ttl)
+        print("Copia sui PC senza lease:", file=sys.stderr)
+        check_follower_full_mirror(srv, workdir)
+    except CheckFailed:
+        return 1
+    finally:
+        srv.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("Tutti i controlli superati", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
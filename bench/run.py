@@ -0,0 +1,243 @@
+"""Benchmark dei percorsi caldi su dati sintetici e RTDB finto (nessuna rete reale).
+
+    python -m app_frantoio.bench.run --records 100000 --latency-ms 40 --out baseline.json
+    python -m app_frantoio.bench.run --records 100000 --compare baseline.json
+
+Il risultato è un JSON {"meta": ..., "results": {nome: {"median_ms", "min_ms", ...}}};
+con --compare si confrontano le mediane e si esce con codice 1 se qualcosa è
+peggiorato oltre --threshold (default 20%).
+
+La stagione sintetica sta tutta in memoria (i record d'archivio per upsert_many e
+gli export, i nodi dei giorni su Firebase nel server finto) e repo.fetch_range la
+rilegge intera: il picco è di circa 0,6 KB per record, quindi 5M record chiedono
+intorno ai 3 GB di RAM.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app_frantoio.bench.fake_rtdb import FakeRTDB
+from app_frantoio.bench.synth import generate_season
+from app_frantoio.core.excel_export import export_sheets
+from app_frantoio.core.fb_client import FirebaseRestClient
+from app_frantoio.core.lease import LeaderLease
+from app_frantoio.core.record import Molitura
+from app_frantoio.core.repository import HybridRepository
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.core.transport import HttpTransport
+from app_frantoio.util.time_utils import TZ
+
+COLLECTION = "molitura"
+
+
+class Bench:
+    def __init__(self, repeat: int):
+        self.repeat = max(1, repeat)
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def time(self, name: str, fn: Callable[[], Any], repeat: Optional[int] = None,
+             setup: Optional[Callable[[], None]] = None, **extra):
+        """Esegue fn `repeat` volte (setup prima di ognuna, fuori dal tempo)."""
+        times: List[float] = []
+        res = None
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            t = time.perf_counter()
+            res = fn()
+            times.append((time.perf_counter() - t) * 1000)
+        if "rows" in extra:
+            rows = extra.pop("rows")
+        else:
+            rows = len(res) if isinstance(res, (list, tuple)) else None
+        if isinstance(res, dict):
+            extra["stats"] = res  # es. i contatori di mirror_and_cleanup
+        self.results[name] = {"median_ms": round(statistics.median(times), 3),
+                              "min_ms": round(min(times), 3), "runs": len(times),
+                              "rows": rows, **extra}
+        print(f"  {name:<34} {statistics.median(times):10.2f} ms  (min {min(times):.2f}, "
+              f"n={len(times)}, rows={rows})", file=sys.stderr)
+        return res
+
+
+def run(records: int, days: int, hybrid_days: int, latency_ms: float, repeat: int,
+        workdir: str, skip_qt: bool = False) -> Dict[str, Any]:
+    now = datetime.now(TZ)
+    print(f"Generazione di {records} record su {days} giorni...", file=sys.stderr)
+    fb_first_ms = int((now - timedelta(days=hybrid_days)).replace(
+        hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+    # una sola copia in memoria: i giorni su Firebase come nodi, l'archivio già come
+    # record (servono interi a upsert_many e agli export)
+    fb_items: List[Tuple[str, Dict[str, Any]]] = []
+    archive: List[Molitura] = []
+    for k, v in generate_season(records, days=days, end=now):
+        if v["dataOra"] >= fb_first_ms:
+            fb_items.append((k, v))
+        else:
+            archive.append(Molitura.from_raw(k, v, "sqlite"))
+
+    bench = Bench(repeat)
+    srv = FakeRTDB(latency_ms=latency_ms).start()
+    try:
+        srv.load(COLLECTION, fb_items)
+        http = HttpTransport(retries=0)
+        fb = FirebaseRestClient(srv.url, COLLECTION, lambda: "bench", transport=http)
+
+        # --- SQLite ---
+        db = os.path.join(workdir, "bench.db")
+        sql = SQLiteClient(db)
+        bench.time("sqlite.upsert_many(archive)", lambda: sql.upsert_many(archive), repeat=1,
+                   rows=len(archive))
+        bench.time("sqlite.upsert_many(unchanged)", lambda: sql.upsert_many(archive), repeat=1,
+                   rows=len(archive))
+        busiest = max(_day_counts(archive).items(), key=lambda kv: kv[1])[0] if archive else now.date()
+        bench.time("sqlite.fetch_day(busiest)", lambda: sql.fetch_day(busiest))
+        if archive:
+            # pagina a metà archivio: con la paginazione keyset costa quanto la prima
+            # (i record sono generati giorno per giorno: quello a metà lista basta)
+            mid = (archive[len(archive) // 2].dataOra, archive[len(archive) // 2].id)
+            bench.time("sqlite.fetch_page(middle)", lambda: sql.fetch_page(
+                archive[0].dataOra, fb_first_ms, mid, 500))
+
+        # --- Firebase ---
+        bench.time("fb.fetch(all)", fb.fetch)
+        today = now.date()
+        repo = HybridRepository(fb, sql, hybrid_days, hybrid_days)
+        bench.time("repo.fetch_day(today, cold)", lambda: repo.fetch_day(today),
+                   setup=repo.cache.invalidate)
+        bench.time("repo.fetch_day(today, etag)", lambda: repo.fetch_day(today))
+        bench.time("repo.fetch_day(archive, cold)", lambda: repo.fetch_day(busiest),
+                   setup=repo.cache.invalidate)
+        bench.time("repo.fetch_range(season)", lambda: repo.fetch_range(
+            (now - timedelta(days=days)).date(), today), repeat=1)
+
+        # mirror: primo giro (completo) su un archivio vuoto, poi incrementale
+        msql = SQLiteClient(os.path.join(workdir, "mirror.db"))
+        mrepo = HybridRepository(fb, msql, hybrid_days, days + 1)  # retention ampia: niente cleanup
+        bench.time("repo.mirror_and_cleanup(full)", mrepo.mirror_and_cleanup, repeat=1)
+        bench.time("repo.mirror_and_cleanup(incr)", mrepo.mirror_and_cleanup)
+        msql.close()
+        lease = LeaderLease(fb, "locks/mirror", holder="bench")
+        bench.time("lease.acquire(renew)", lease.acquire)
+
+        # --- export Excel (motore usato da MainWindow.export_excel) ---
+        day_rows = sql.fetch_day(busiest)
+        xlsx = os.path.join(workdir, "bench.xlsx")
+        bench.time("export_sheets(1 day, new file)", lambda: export_sheets(xlsx, [("d", day_rows)]),
+                   setup=lambda: os.path.exists(xlsx) and os.remove(xlsx), rows=len(day_rows))
+        by_day: Dict[str, List[Molitura]] = {}
+        for r in archive[: min(len(archive), 20000)]:
+            by_day.setdefault(r.giorno.replace("/", "."), []).append(r)
+        bench.time("export_sheets(range, 1 sheet/day)", lambda: export_sheets(xlsx, list(by_day.items())),
+                   repeat=1, rows=sum(len(v) for v in by_day.values()))
+        # un giorno in più nel file con tutti i fogli: costa le righe del giorno, non il file
+        bench.time("export_sheets(1 day, append)", lambda: export_sheets(xlsx, [("d", day_rows)]),
+                   rows=len(day_rows))
+
+        # --- modello Qt: data() su tutte le celle, come un repaint completo ---
+        if not skip_qt:
+            _bench_model(bench, day_rows)
+        sql.close()
+    finally:
+        srv.stop()
+
+    return {
+        "meta": {
+            "when": now.isoformat(timespec="seconds"), "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+            "records": records, "days": days, "hybrid_days": hybrid_days,
+            "latency_ms": latency_ms, "firebase_records": len(fb_items),
+            "archive_records": len(archive),
+        },
+        "results": bench.results,
+    }
+
+
+def _day_counts(rows: List[Molitura]):
+    counts: Dict[Any, int] = {}
+    for r in rows:
+        d = datetime.fromtimestamp(r.dataOra / 1000, TZ).date()
+        counts[d] = counts.get(d, 0) + 1
+    return counts
+
+
+def _bench_model(bench: Bench, rows: List[Molitura]):
+    try:
+        from PyQt6 import QtCore
+        from app_frantoio.models.moliture_model import MolitureModel
+    except ImportError:
+        print("  (PyQt6 non disponibile: benchmark del modello saltato)", file=sys.stderr)
+        return
+    model = MolitureModel([], 0.30)
+    role = QtCore.Qt.ItemDataRole.DisplayRole
+    cols = model.columnCount()
+
+    def repaint():
+        n = model.rowCount()
+        for i in range(n):
+            for c in range(cols):
+                model.data(model.index(i, c), role)
+        return n * cols
+
+    bench.time("model.set_rows(day, from empty)", lambda: model.set_rows(list(rows)),
+               setup=lambda: model.set_rows([]), rows=len(rows))
+    bench.time("model.data(full repaint)", repaint, rows=len(rows))
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """Stampa le variazioni delle mediane; 1 se qualcosa è peggiorato oltre la soglia."""
+    worse = 0
+    base = baseline.get("results", {})
+    for name, res in current["results"].items():
+        old = base.get(name)
+        if not old or not old.get("median_ms"):
+            print(f"  {name:<34} (nuovo)")
+            continue
+        delta = (res["median_ms"] - old["median_ms"]) / old["median_ms"]
+        flag = ""
+        if delta > threshold:
+            flag = "  <-- PEGGIORATO"
+            worse += 1
+        print(f"  {name:<34} {old['median_ms']:10.2f} -> {res['median_ms']:10.2f} ms ({delta:+.0%}){flag}")
+    return 1 if worse else 0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark su stagione sintetica e RTDB finto")
+    p.add_argument("--records", type=int, default=10000, help="record nella stagione (10k-5M, ~0,6 KB di RAM l'uno)")
+    p.add_argument("--days", type=int, default=90, help="durata della stagione in giorni")
+    p.add_argument("--hybrid-days", type=int, default=7, help="giorni ancora su Firebase")
+    p.add_argument("--latency-ms", type=float, default=30.0, help="latenza del server finto")
+    p.add_argument("--repeat", type=int, default=5, help="ripetizioni per misura")
+    p.add_argument("--out", help="scrive i risultati in questo file JSON")
+    p.add_argument("--compare", help="baseline JSON con cui confrontare")
+    p.add_argument("--threshold", type=float, default=0.20, help="peggioramento tollerato (0.20 = 20%%)")
+    p.add_argument("--no-qt", action="store_true", help="salta i benchmark del modello Qt")
+    args = p.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="frantoio-bench-")
+    try:
+        result = run(args.records, args.days, args.hybrid_days, args.latency_ms, args.repeat,
+                     workdir, skip_qt=args.no_qt)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Risultati in {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            return compare(result, json.load(f), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import itertools
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app_frantoio.util.time_utils import TZ
+
+# Metodi di pagamento con frequenze tipiche (molti vuoti: pagamento registrato dopo)
+PAYMENTS = [("", 0.35), ("Contanti", 0.30), ("POS", 0.20), ("Olio", 0.10), ("Assegno", 0.05)]
+
+_FIRST = ["Mario", "Giuseppe", "Antonio", "Giovanni", "Francesco", "Luigi", "Salvatore", "Anna",
+          "Maria", "Rosa", "Angela", "Teresa", "Vincenzo", "Pietro", "Carmela", "Domenico"]
+_LAST = ["Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci",
+         "Marino", "Greco", "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa", "Giordano",
+         "Rizzo", "Lombardi", "Moretti"]
+
+
+def customer_names(n: int, rnd: random.Random) -> List[str]:
+    names = set()
+    while len(names) < n:
+        name = f"{rnd.choice(_FIRST)} {rnd.choice(_LAST)}"
+        if name in names:
+            name += " " + rnd.choice(string.ascii_uppercase) + "."
+        names.add(name)
+    return sorted(names)
+
+
+def _push_id(ts_ms: int, rnd: random.Random) -> str:
+    # come i push id di Firebase: 8 caratteri di timestamp + 12 casuali
+    alphabet = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+    head = []
+    for _ in range(8):
+        head.append(alphabet[ts_ms % 64])
+        ts_ms //= 64
+    return "".join(reversed(head)) + "".join(rnd.choice(alphabet) for _ in range(12))
+
+
+def generate_season(n: int, days: int = 90, end: Optional[datetime] = None, customers: int = 0,
+                    seed: int = 1) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """n conferimenti sintetici (push id, nodo come su Firebase) negli ultimi `days`
+    giorni fino a `end` (default: adesso), giorno per giorno.
+
+    - clienti con distribuzione di Zipf: pochi grandi produttori, molti piccoli;
+    - più conferimenti nel picco della raccolta (metà stagione) e in orario 7-19;
+    - peso lognormale (mediana ~300 kg), pagamenti secondo PAYMENTS."""
+    rnd = random.Random(seed)
+    end = end or datetime.now(TZ)
+    start = end - timedelta(days=days - 1)  # l'ultimo giorno è quello di end
+    customers = customers or max(20, min(5000, n // 40))
+    names = customer_names(customers, rnd)
+    # pesi cumulativi: choices() fa una ricerca binaria invece di sommare a ogni record
+    zipf = list(itertools.accumulate(1.0 / (k + 1) ** 1.1 for k in range(len(names))))
+    pay_values = [p for p, _ in PAYMENTS]
+    pay_weights = list(itertools.accumulate(w for _, w in PAYMENTS))
+
+    # giorni pesati a campana intorno al picco, ore lavorative
+    day_w = [1.0 + 4.0 * max(0.0, 1 - abs(d - days / 2) / (days / 2)) for d in range(days)]
+    day_idx = rnd.choices(range(days), weights=day_w, k=n)
+    day_idx.sort()
+    span_ms = 12 * 3600 * 1000
+    end_ms = int(end.timestamp() * 1000)
+    for d in day_idx:
+        day0 = (start + timedelta(days=d)).replace(hour=7, minute=0, second=0, microsecond=0)
+        ts = int(day0.timestamp() * 1000) + rnd.randrange(span_ms)
+        ts = min(ts, end_ms)
+        yield _push_id(ts, rnd), {
+            "name": rnd.choices(names, cum_weights=zipf)[0],
+            "weight": round(rnd.lognormvariate(5.7, 0.7), 1),
+            "pagamento": rnd.choices(pay_values, cum_weights=pay_weights)[0],
+            "dataOra": ts,
+        }
@@ -1,20 +1,220 @@
-from typing import Optional
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
 import requests
+from app_frantoio.core.transport import HttpTransport
+
+# errori 400 di securetoken per cui il refresh_token non tornerà valido: serve il login
+_REVOKED = {"TOKEN_EXPIRED", "INVALID_REFRESH_TOKEN", "USER_DISABLED", "USER_NOT_FOUND",
+            "INVALID_GRANT_TYPE", "MISSING_REFRESH_TOKEN"}
+
+
+def _revoked(e: requests.HTTPError) -> bool:
+    resp = e.response
+    if resp is None or resp.status_code != 400:
+        return False
+    try:
+        message = str(resp.json()["error"]["message"])
+    except (ValueError, KeyError, TypeError):
+        return False
+    # es. "TOKEN_EXPIRED" oppure "INVALID_REFRESH_TOKEN : dettaglio"
+    return message.split(" ", 1)[0] in _REVOKED
+
+
+def _retryable(e: Exception) -> bool:
+    """Errori per cui il rinnovo può riuscire più tardi: rete, timeout, 5xx, 408/429."""
+    if not isinstance(e, requests.RequestException):
+        return False
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is None or status >= 500 or status in (408, 429)
 
 class AuthClient:
-    def __init__(self, api_key: str):
+    """Login Firebase (email/password) e rinnovo dell'id_token.
+
+    - con cache_path i token vengono salvati su disco (file leggibile solo dall'utente)
+      e try_restore() permette di ripartire senza rifare il login;
+    - start_auto_refresh() rinnova il token in background refresh_margin_s prima
+      della scadenza; get_token() lo rinnova comunque se è già scaduto (es. dopo
+      una sospensione del PC); se securetoken rifiuta il refresh_token il rinnovo si
+      ferma e on_auth_error(e) (chiamata dal thread del timer) chiede un nuovo login;
+    - refresh_id_token(stale) è single-flight: se più richieste ricevono 401 con lo
+      stesso token, solo la prima chiama securetoken, le altre usano il nuovo."""
+
+    def __init__(self, api_key: str, transport: Optional[HttpTransport] = None,
+                 cache_path: Optional[Path] = None, refresh_margin_s: float = 300):
         self.api_key = api_key
+        self.http = transport or HttpTransport()
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.refresh_margin_s = float(refresh_margin_s)
         self.id_token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.local_id: Optional[str] = None
+        self.expires_at: float = 0.0  # epoch (s) di scadenza dell'id_token
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._auto = False
+        # errore per cui serve un nuovo login (None finché il rinnovo funziona)
+        self.auth_error: Optional[Exception] = None
+        self.on_auth_error: Optional[Callable[[Exception], None]] = None
 
     def sign_in_password(self, email: str, password: str):
         url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={self.api_key}"
         payload = {"email": email, "password": password, "returnSecureToken": True}
-        r = requests.post(url, json=payload, timeout=15)
+        r = self.http.post(url, op="auth", json=payload)
         r.raise_for_status()
         data = r.json()
-        self.id_token = data["idToken"]
-        self.refresh_token = data.get("refreshToken")
-        self.local_id = data.get("localId")
+        with self._lock:
+            self._set_tokens(data["idToken"], data.get("refreshToken"), data.get("localId"),
+                             data.get("expiresIn"))
         return data
+
+    def refresh_id_token(self, stale: Optional[str] = None):
+        """Rinnova id_token tramite refresh_token (endpoint securetoken).
+
+        Con stale (il token rifiutato dal server) il rinnovo avviene solo se nel
+        frattempo nessun altro thread lo ha già fatto."""
+        with self._lock:
+            if stale is not None and self.id_token and self.id_token != stale:
+                return None
+            if not self.refresh_token:
+                raise RuntimeError("refresh_token mancante: rieseguire il login")
+            url = f"https://securetoken.googleapis.com/v1/token?key={self.api_key}"
+            payload = {"grant_type": "refresh_token", "refresh_token": self.refresh_token}
+            r = self.http.post(url, op="auth", data=payload)
+            r.raise_for_status()
+            data = r.json()
+            self._set_tokens(data["id_token"], data.get("refresh_token", self.refresh_token),
+                             data.get("user_id", self.local_id), data.get("expires_in"))
+            return data
+
+    def get_token(self) -> Optional[str]:
+        """id_token valido: se è scaduto (o sta per scadere) lo rinnova prima."""
+        token = self.id_token
+        if token and self.refresh_token and time.time() >= self.expires_at - 30:
+            self.refresh_id_token(stale=token)
+            token = self.id_token
+        return token
+
+    def _set_tokens(self, id_token: str, refresh_token: Optional[str], local_id: Optional[str],
+                    expires_in: Any):
+        try:
+            ttl = float(expires_in)
+        except (TypeError, ValueError):
+            ttl = 3600.0
+        self.id_token = id_token
+        self.refresh_token = refresh_token
+        self.local_id = local_id
+        self.expires_at = time.time() + ttl
+        self.auth_error = None
+        self._save_cache()
+        if self._auto:
+            self._schedule()
+
+    # ---- cache su disco ----
+    def try_restore(self) -> bool:
+        """Riprende la sessione salvata: True se c'è un token utilizzabile
+        (ancora valido o rinnovato col refresh_token), senza login.
+
+        La cache si cancella solo se il file è illeggibile o securetoken risponde che
+        il refresh_token non vale più (400 TOKEN_EXPIRED, INVALID_REFRESH_TOKEN,
+        USER_DISABLED...). Senza rete o con errori del server i token restano: il
+        rinnovo riprova da start_auto_refresh() e da get_token()."""
+        if self.cache_path is None or not self.cache_path.exists():
+            return False
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            if data.get("api_key") != self.api_key or not data.get("refresh_token"):
+                return False
+            expires_at = float(data.get("expires_at") or 0)
+        except (OSError, ValueError, TypeError, AttributeError):
+            self._forget()
+            return False
+        with self._lock:
+            self.id_token = data.get("id_token")
+            self.refresh_token = data["refresh_token"]
+            self.local_id = data.get("local_id")
+            self.expires_at = expires_at
+        if time.time() >= self.expires_at - self.refresh_margin_s:
+            try:
+                self.refresh_id_token()
+            except requests.HTTPError as e:
+                if _revoked(e):
+                    self._forget()
+                    return False
+            except Exception:
+                pass  # rete assente o risposta inattesa: si riprova più tardi
+        return True
+
+    def _forget(self):
+        self.clear_cache()
+        with self._lock:
+            self.id_token = self.refresh_token = self.local_id = None
+            self.expires_at = 0.0
+
+    def clear_cache(self):
+        if self.cache_path is not None:
+            try:
+                self.cache_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _save_cache(self):
+        if self.cache_path is None:
+            return
+        data: Dict[str, Any] = {"api_key": self.api_key, "id_token": self.id_token,
+                                "refresh_token": self.refresh_token, "local_id": self.local_id,
+                                "expires_at": self.expires_at}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            # creato già con permessi 0600: il refresh_token vale quanto la password.
+            # Su Windows la modalità non ha effetto (conta solo il flag di sola lettura):
+            # il file è protetto solo dall'ACL del profilo utente in cui si trova
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass  # senza cache si rifà il login al prossimo avvio
+
+    # ---- rinnovo proattivo ----
+    def start_auto_refresh(self):
+        self._auto = True
+        self._schedule()
+
+    def stop_auto_refresh(self):
+        self._auto = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = max(5.0, self.expires_at - self.refresh_margin_s - time.time())
+        self._timer = threading.Timer(delay, self._auto_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _auto_refresh(self):
+        try:
+            self.refresh_id_token()
+        except Exception as e:
+            if _retryable(e):
+                # rete assente: si riprova tra un minuto (get_token rinnova comunque se scaduto)
+                if self._auto:
+                    self._timer = threading.Timer(60.0, self._auto_refresh)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            # refresh_token revocato o rifiutato: riprovare non serve, serve il login
+            self._auto = False
+            self._timer = None
+            if isinstance(e, requests.HTTPError) and _revoked(e):
+                self._forget()
+            self.auth_error = e
+            if self.on_auth_error is not None:
+                self.on_auth_error(e)
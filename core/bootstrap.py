@@ -0,0 +1,56 @@
+from typing import Any, Dict
+from app_frantoio.util.config import appdata_dir
+from app_frantoio.util.metrics import METRICS
+from app_frantoio.core.auth import AuthClient
+from app_frantoio.core.transport import HttpTransport
+from app_frantoio.core.fb_client import FirebaseRestClient
+from app_frantoio.core.lease import LeaderLease
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.core.repository import HybridRepository
+
+# Costruzione dei client a partire dalla configurazione, comune a GUI (app.py) e
+# sync senza interfaccia (sync_daemon.py): niente Qt qui.
+
+def setup_metrics(cfg: Dict[str, Any], filename: str = "metrics.jsonl"):
+    """Attiva il log JSON-lines delle misure in appdata/logs. GUI e sync_daemon
+    usano file diversi: la rotazione non è sicura tra processi."""
+    if cfg.get("metrics_log", True):
+        METRICS.configure_log(appdata_dir() / "logs" / filename,
+                              max_bytes=int(cfg.get("metrics_log_kb", 1024)) * 1024,
+                              backups=int(cfg.get("metrics_log_backups", 3)))
+
+def make_transport(cfg: Dict[str, Any]) -> HttpTransport:
+    """Trasporto HTTP condiviso (pool keep-alive + retry), con le richieste in METRICS."""
+    return HttpTransport(pool_size=int(cfg.get("http_pool_size", 4)),
+                         retries=int(cfg.get("http_retries", 3)),
+                         backoff_s=float(cfg.get("http_backoff_s", 0.5)),
+                         timeouts=cfg.get("http_timeouts") or None,
+                         on_request=METRICS.http_request)
+
+def make_auth(cfg: Dict[str, Any], http: HttpTransport) -> AuthClient:
+    """AuthClient con la cache dei token accanto a config.json (se token_cache è attivo)."""
+    cache = appdata_dir() / "token.json" if cfg.get("token_cache", True) else None
+    return AuthClient(cfg.get("api_key", "").strip(), transport=http, cache_path=cache,
+                      refresh_margin_s=float(cfg.get("token_refresh_margin_s", 300)))
+
+def make_repository(cfg: Dict[str, Any], auth: AuthClient, http: HttpTransport) -> HybridRepository:
+    fb = FirebaseRestClient(cfg.get("database_url", "").strip(), cfg.get("collection", "molitura"),
+                            get_token_callable=auth.get_token, transport=http,
+                            on_unauthorized=auth.refresh_id_token)
+    sql = SQLiteClient(cfg.get("archive_db", "frantoio_archive.db"))
+    repo = HybridRepository(fb, sql, int(cfg.get("hybrid_days", 7)), int(cfg.get("retention_days", 7)),
+                            mirror_lookback_hours=float(cfg.get("mirror_lookback_hours", 48)),
+                            full_mirror_hours=float(cfg.get("full_mirror_hours", 24)),
+                            cache_days=int(cfg.get("cache_days", 32)),
+                            cache_ttl_s=float(cfg.get("cache_ttl_s", 600)),
+                            work_hours=cfg.get("work_hours") or (7, 20),
+                            rollover_days=int(cfg.get("rollover_days", 60)),
+                            page_size=int(cfg.get("fb_page_size", 1000)),
+                            cleanup_batch=int(cfg.get("cleanup_batch", 500)),
+                            cleanup_pause_s=float(cfg.get("cleanup_pause_ms", 200)) / 1000)
+    lease_path = (cfg.get("lease_path") or "").strip()
+    if lease_path:
+        # più PC sullo stesso database: pulizia di Firebase solo dal detentore
+        repo.attach_lease(LeaderLease(fb, lease_path, holder=cfg.get("lease_holder") or None,
+                                      ttl_s=float(cfg.get("lease_ttl_s", 900))))
+    return repo
@@ -0,0 +1,90 @@
+import csv
+import os
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.util.time_utils import TZ
+
+# colonne dell'estratto: quelle di moliture più data/ora leggibile (Europe/Rome)
+COLUMNS = ("id", "nome", "peso_kg", "pagamento", "dataOra", "data_ora")
+FORMATS = ("csv", "parquet", "feather")
+
+Progress = Callable[[int], None]
+
+
+def format_from_path(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("arrow", "ipc"):
+        return "feather"
+    return ext if ext in FORMATS else "csv"
+
+
+def _rows(chunks: Iterator[List[Tuple]]) -> Iterator[List[Tuple]]:
+    for chunk in chunks:
+        yield [(rid, name or "", float(weight or 0), pagamento or "", int(ts or 0),
+                datetime.fromtimestamp(int(ts or 0) / 1000, TZ).strftime("%Y-%m-%d %H:%M"))
+               for rid, name, weight, pagamento, ts in chunk]
+
+
+def export_archive(sql: SQLiteClient, path: str, fmt: Optional[str] = None,
+                   start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                   chunk_size: int = 5000, sep: str = ";",
+                   progress: Optional[Progress] = None) -> int:
+    """Estrae da moliture i record con start_ms <= dataOra <= end_ms in `path`,
+    a blocchi di chunk_size righe (memoria limitata al blocco). Ritorna le righe scritte.
+
+    csv è sempre disponibile (UTF-8 con BOM, separatore ';' per Excel in italiano);
+    parquet e feather richiedono pyarrow."""
+    fmt = fmt or format_from_path(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato non supportato: {fmt}")
+    chunks = _rows(sql.iter_chunks(start_ms, end_ms, chunk_size))
+    if fmt == "csv":
+        return _write_csv(path, chunks, sep, progress)
+    return _write_arrow(path, fmt, chunks, progress)
+
+
+def _write_csv(path: str, chunks, sep: str, progress: Optional[Progress]) -> int:
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f, delimiter=sep)
+        w.writerow(COLUMNS)
+        for chunk in chunks:
+            w.writerows(chunk)
+            n += len(chunk)
+            if progress is not None:
+                progress(n)
+    return n
+
+
+def _write_arrow(path: str, fmt: str, chunks, progress: Optional[Progress]) -> int:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError(f"Per il formato {fmt} serve pyarrow (pip install pyarrow); in alternativa usa csv")
+
+    schema = pa.schema([
+        ("id", pa.string()), ("nome", pa.string()), ("peso_kg", pa.float64()),
+        ("pagamento", pa.string()), ("dataOra", pa.int64()), ("data_ora", pa.string()),
+    ])
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)  # un row group per blocco
+        write = writer.write_table
+    else:
+        import pyarrow.ipc as ipc
+        writer = ipc.new_file(path, schema)  # Feather v2 = file Arrow IPC
+        write = writer.write_table
+
+    n = 0
+    try:
+        for chunk in chunks:
+            cols = list(zip(*chunk))
+            write(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(cols, schema)],
+                                       schema=schema))
+            n += len(chunk)
+            if progress is not None:
+                progress(n)
+    finally:
+        writer.close()
+    return n
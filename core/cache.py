@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class _Entry:
+    __slots__ = ("rows", "etag", "stored_at")
+
+    def __init__(self, rows: List[Any], etag: Optional[str]):
+        self.rows = rows
+        self.etag = etag
+        self.stored_at = time.monotonic()
+
+
+class DayCache:
+    """Cache LRU con scadenza (TTL) delle righe di un giorno, chiave (data, sorgente).
+    Per Firebase conserva anche l'ETag, usato per la rivalidazione condizionale."""
+
+    def __init__(self, max_entries: int = 32, ttl_s: float = 600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0  # risposte 304 / ETag invariato
+        # cresce a ogni invalidate(): una lettura iniziata prima non deve finire in cache
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at > self.ttl_s:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key: Hashable) -> Optional[_Entry]:
+        """Come get() ma senza contare hit/miss (serve per leggere l'ETag)."""
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: Hashable, rows: List[Any], etag: Optional[str] = None,
+            generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = _Entry(rows, etag)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def touch(self, key: Hashable):
+        """Voce rivalidata (304): conta come hit e ne rinnova la scadenza."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                entry.stored_at = time.monotonic()
+                self._data.move_to_end(key)
+                self.hits += 1
+                self.revalidated += 1
+
+    def note_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def invalidate(self, source: Optional[str] = None):
+        """Svuota la cache, o solo le voci di una sorgente ("firebase"/"sqlite")."""
+        with self._lock:
+            self.generation += 1
+            if source is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if isinstance(k, tuple) and k[-1] == source]:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "revalidated": self.revalidated, "entries": len(self._data),
+                    "max_entries": self.max_entries}
@@ -0,0 +1,286 @@
+import os
+import re
+import tempfile
+import zipfile
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr, unescape
+from app_frantoio.core.record import Molitura
+
+HEADERS = ("Nome", "Peso (Kg)", "Ora", "Metodo di Pagamento")
+
+# (foglio, righe) da scrivere; progress(fatte, totali) conta le righe
+Sheet = Tuple[str, Sequence[Molitura]]
+Progress = Callable[[int, int], None]
+
+# parti OOXML toccate quando si aggiunge un foglio a un file esistente
+_WORKBOOK = "xl/workbook.xml"
+_WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+_CONTENT_TYPES = "[Content_Types].xml"
+_STYLES = "xl/styles.xml"
+_CALC_CHAIN = "xl/calcChain.xml"
+_SHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+_SHEET_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+# stile "centrato" aggiunto una volta sola in cellXfs e poi riusato
+_CENTER_XF = ('<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+              '<alignment horizontal="center" vertical="center"/></xf>')
+# caratteri che XML 1.0 non ammette nemmeno con escape
+_XML_BAD = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CHECK_EVERY = 1000
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def record_values(r: Molitura) -> Tuple[Any, ...]:
+    return (r.name, r.weight, r.ora, r.pagamento)
+
+
+def _width(values: Iterable[Any]) -> int:
+    # stessa regola dell'autofit precedente: testo più lungo + 2
+    return max((len("" if v is None else str(v)) for v in values), default=0) + 2
+
+
+def _col(c: int) -> str:
+    """Indice di colonna da 0 -> lettera Excel (A, B, ..., AA)."""
+    s = ""
+    c += 1
+    while c:
+        c, rem = divmod(c - 1, 26)
+        s = chr(65 + rem) + s
+    return s
+
+
+def export_sheets(path: str, sheets: Iterable[Sheet],
+                  progress: Optional[Progress] = None,
+                  cancelled: Optional[Callable[[], bool]] = None,
+                  total: Optional[int] = None) -> List[str]:
+    """Scrive i fogli in `path` (celle centrate, colonne adattate al contenuto).
+
+    Un file nuovo si crea con openpyxl in modalità write-only. In un file esistente
+    si aggiungono (o sostituiscono, se hanno lo stesso nome) solo i fogli esportati,
+    lavorando sullo zip: gli altri fogli e le loro formattazioni vengono copiati
+    byte per byte senza essere riletti, quindi il costo dipende dalle righe esportate
+    e non dai giorni già presenti nel file. Il file viene scritto accanto e sostituito
+    solo a lavoro finito: un errore o un annullamento lasciano intatto quello
+    esistente. Ritorna i nomi dei fogli scritti.
+
+    sheets può essere un generatore (es. sheets_by_day su un'estrazione a blocchi):
+    in memoria resta un foglio alla volta. In quel caso total (righe attese) serve
+    solo a progress."""
+    if total is None:
+        sheets = list(sheets)
+        total = sum(len(rows) for _, rows in sheets)
+    done = [0]
+
+    def tick(n: int):
+        if cancelled is not None and cancelled():
+            raise ExportCancelled()
+        done[0] += n
+        if progress is not None and n:
+            progress(done[0], total)
+
+    fd, tmp = tempfile.mkstemp(suffix=".xlsx", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        if os.path.exists(path):
+            written = _append(path, tmp, _unique(sheets), tick)
+        else:
+            written = _create(tmp, _unique(sheets), tick)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return written
+
+
+def sheets_by_day(chunks: Iterable[Sequence[Molitura]], fallback: str = "") -> Iterator[Sheet]:
+    """Un foglio per giorno ("dd.mm.yyyy") da blocchi di record ordinati per dataOra:
+    tiene in memoria solo il giorno in corso."""
+    name: Optional[str] = None
+    rows: List[Molitura] = []
+    for chunk in chunks:
+        for r in chunk:
+            day = r.giorno.replace("/", ".") or fallback
+            if day != name:
+                if rows:
+                    yield name, rows
+                name, rows = day, []
+            rows.append(r)
+    if rows:
+        yield name, rows
+
+
+def _unique(sheets: Iterable[Sheet]) -> Iterator[Tuple[str, List[Tuple[Any, ...]]]]:
+    """(nome, valori delle righe) un foglio alla volta; un nome ripetuto è un errore
+    (Excel non distingue maiuscole e minuscole)."""
+    seen = set()
+    for name, rows in sheets:
+        if name.casefold() in seen:
+            raise ValueError(f"Foglio ripetuto nell'export: {name}")
+        seen.add(name.casefold())
+        yield name, [record_values(r) for r in rows]
+
+
+def _create(out_path: str, new: Iterable[Tuple[str, List[Tuple[Any, ...]]]],
+            tick: Callable[[int], None]) -> List[str]:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment
+    from openpyxl.utils import get_column_letter
+
+    center = Alignment(horizontal="center", vertical="center")
+    wb = Workbook(write_only=True)
+    written = []
+    for name, rows in new:
+        tick(0)
+        ws = wb.create_sheet(title=name)
+        # in write-only le larghezze vanno fissate prima della prima riga
+        for c in range(len(HEADERS)):
+            ws.column_dimensions[get_column_letter(c + 1)].width = _width(
+                [HEADERS[c]] + [row[c] for row in rows])
+        for row in [HEADERS] + rows:
+            cells = []
+            for v in row:
+                cell = WriteOnlyCell(ws, value=v)
+                cell.alignment = center
+                cells.append(cell)
+            ws.append(cells)
+        tick(len(rows))
+        written.append(name)
+    wb.save(out_path)
+    return written
+
+
+def _cell_xml(ref: str, v: Any, style: int) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return f'<c r="{ref}" s="{style}" t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float)):
+        return f'<c r="{ref}" s="{style}"><v>{v!r}</v></c>'
+    text = _XML_BAD.sub("", str(v))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def _write_sheet(zout: zipfile.ZipFile, part: str, rows: List[Tuple[Any, ...]], style: int,
+                 tick: Callable[[int], None]):
+    """Foglio OOXML minimo con stringhe inline (niente sharedStrings da unire)."""
+    cols = "".join(
+        f'<col min="{c + 1}" max="{c + 1}" width="{_width([HEADERS[c]] + [r[c] for r in rows])}"'
+        f' customWidth="1"/>' for c in range(len(HEADERS)))
+    letters = [_col(c) for c in range(len(HEADERS))]
+
+    def row_xml(i: int, row: Sequence[Any]) -> str:
+        return f'<row r="{i}">' + "".join(
+            _cell_xml(f"{letters[c]}{i}", v, style) for c, v in enumerate(row)) + "</row>"
+
+    with zout.open(part, "w", force_zip64=True) as f:
+        f.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                 f'<cols>{cols}</cols><sheetData>{row_xml(1, HEADERS)}').encode("utf-8"))
+        for start in range(0, len(rows), _CHECK_EVERY):
+            chunk = rows[start:start + _CHECK_EVERY]
+            f.write("".join(row_xml(start + i, row)
+                            for i, row in enumerate(chunk, start=2)).encode("utf-8"))
+            tick(len(chunk))
+        f.write(b"</sheetData></worksheet>")
+
+
+def _center_style(styles: str) -> Tuple[str, int]:
+    """Indice in cellXfs dello stile centrato, aggiungendolo se manca."""
+    m = re.search(r"<cellXfs\b[^>]*>(.*?)</cellXfs>", styles, re.S)
+    if m is None:
+        raise ValueError("styles.xml senza cellXfs")
+    body = m.group(1)
+    xfs = re.findall(r"<xf\b(?:[^>]*/>|.*?</xf>)", body, re.S)
+    if _CENTER_XF in xfs:
+        return styles, xfs.index(_CENTER_XF)
+    head = re.sub(r'\bcount="\d+"', f'count="{len(xfs) + 1}"', styles[m.start():m.start(1)])
+    styles = styles[:m.start()] + head + body + _CENTER_XF + styles[m.end(1):]
+    return styles, len(xfs)
+
+
+def _append(path: str, out_path: str, new: Iterable[Tuple[str, List[Tuple[Any, ...]]]],
+            tick: Callable[[int], None]) -> List[str]:
+    with zipfile.ZipFile(path) as zin:
+        names = set(zin.namelist())
+        workbook = zin.read(_WORKBOOK).decode("utf-8")
+        rels = zin.read(_WORKBOOK_RELS).decode("utf-8")
+        types = zin.read(_CONTENT_TYPES).decode("utf-8")
+        styles, style = _center_style(zin.read(_STYLES).decode("utf-8"))
+        if 'xmlns:r="' not in workbook[:workbook.find("<sheets")]:
+            raise ValueError("workbook.xml senza namespace delle relazioni")
+
+        targets = {}
+        for rel in re.finditer(r"<Relationship\b[^>]*>", rels):
+            rid = re.search(r'\bId="([^"]*)"', rel.group(0))
+            target = re.search(r'\bTarget="([^"]*)"', rel.group(0))
+            if rid and target:
+                t = target.group(1)
+                targets[rid.group(1)] = t.lstrip("/") if t.startswith("/") else "xl/" + t
+        existing = {}
+        for sheet in re.finditer(r"<sheet\b[^>]*>", workbook):
+            name = re.search(r'\bname="([^"]*)"', sheet.group(0))
+            rid = re.search(r'\br:id="([^"]*)"', sheet.group(0))
+            if name and rid and rid.group(1) in targets:
+                title = unescape(name.group(1), {"&quot;": '"', "&apos;": "'"})
+                existing[title.casefold()] = targets[rid.group(1)]  # Excel non distingue maiuscole
+
+        sheet_ids = [int(x) for x in re.findall(r'<sheet\b[^>]*\bsheetId="(\d+)"', workbook)]
+        next_id = max(sheet_ids, default=0) + 1
+        n = 1
+        written: List[str] = []
+        new_parts = set()
+        replaced = set()
+        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as zout:
+            # prima i fogli esportati, man mano che arrivano (l'ordine delle parti
+            # nello zip non conta): così non serve conoscerli tutti in anticipo
+            for name, rows in new:
+                tick(0)
+                part = existing.get(name.casefold())
+                if part is not None:
+                    replaced.add(part)
+                else:
+                    while f"xl/worksheets/sheet{n}.xml" in names or f"xl/worksheets/sheet{n}.xml" in new_parts:
+                        n += 1
+                    part = f"xl/worksheets/sheet{n}.xml"
+                    new_parts.add(part)
+                    rid = f"rIdFr{next_id}"
+                    rels = rels.replace("</Relationships>",
+                                        f'<Relationship Id="{rid}" Type="{_SHEET_REL}" '
+                                        f'Target="/{part}"/></Relationships>')
+                    types = types.replace("</Types>", f'<Override PartName="/{part}" '
+                                                      f'ContentType="{_SHEET_TYPE}"/></Types>')
+                    workbook = workbook.replace("</sheets>", f'<sheet name={quoteattr(name)} '
+                                                             f'sheetId="{next_id}" r:id="{rid}"/></sheets>')
+                    next_id += 1
+                _write_sheet(zout, part, rows, style, tick)
+                written.append(name)
+
+            # un foglio sostituito perde le sue relazioni (disegni, tabelle) e la catena
+            # di calcolo, che Excel ricostruisce all'apertura
+            drop = {p.rsplit("/", 1)[0] + "/_rels/" + p.rsplit("/", 1)[1] + ".rels" for p in replaced}
+            if replaced and _CALC_CHAIN in names:
+                drop.add(_CALC_CHAIN)
+                rels = re.sub(r'<Relationship\b[^>]*Target="/?(?:xl/)?calcChain\.xml"[^>]*/>', "", rels)
+                types = re.sub(r'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', "", types)
+
+            edited = {_WORKBOOK: workbook, _WORKBOOK_RELS: rels, _CONTENT_TYPES: types, _STYLES: styles}
+            skip = drop | replaced
+            for info in zin.infolist():
+                if info.filename in skip:
+                    continue
+                if info.filename in edited:
+                    zout.writestr(info, edited[info.filename].encode("utf-8"))
+                    continue
+                tick(0)
+                with zin.open(info) as src, zout.open(info, "w", force_zip64=True) as dst:
+                    while True:
+                        chunk = src.read(1 << 20)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+    return written
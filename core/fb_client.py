@@ -1,34 +1,299 @@
-from typing import Any, Dict, List
+import codecs
+import json
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import requests
+from app_frantoio.core.record import Molitura
+from app_frantoio.core.transport import HttpTransport
+
+# scanner C di json (lo stesso di json.loads), chiamato su un valore alla volta
+_SCAN = json.JSONDecoder().scan_once
+_INCOMPLETE = (StopIteration, json.JSONDecodeError, IndexError)
+_WS = re.compile(r"\s*")
+_SEP = re.compile(r"[\s,]*")
+_COLON = re.compile(r"\s*:\s*")
+_AFTER = frozenset(",} \t\r\n")
+
+
+def iter_children(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Any]]:
+    """(chiave, valore) dei figli di un oggetto JSON letto a pezzi.
+
+    Il corpo non viene mai tenuto tutto in memoria: si decodifica un figlio alla
+    volta con lo scanner di json, leggendo altri byte solo quando quello corrente
+    è incompleto. Un corpo "null" (nodo vuoto) non ha figli."""
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    it = iter(chunks)
+    buf, pos, eof = "", 0, False
+    opened = False
+    while True:
+        n = len(buf)
+        if not opened:
+            pos = _WS.match(buf, pos).end()
+            if pos < n:
+                if buf[pos] == "{":
+                    opened = True
+                    pos += 1
+                    continue
+                if buf.startswith("null", pos):
+                    return
+                if not "null".startswith(buf[pos:pos + 4]):
+                    raise ValueError("Risposta JSON inattesa: serve un oggetto")
+            elif eof:
+                return
+        else:
+            while True:
+                p = _SEP.match(buf, pos).end()
+                if p < n and buf[p] == "}":
+                    return
+                try:
+                    key, p = _SCAN(buf, p)
+                    if buf[p] == ":" and buf[p + 1] not in " \t\r\n":
+                        p += 1  # risposta compatta di Firebase: niente spazi
+                    else:
+                        p = _COLON.match(buf, p).end()
+                    value, end = _SCAN(buf, p)
+                except _INCOMPLETE:
+                    break
+                except AttributeError:  # niente ':' (ancora)
+                    break
+                # completo solo se seguito da un separatore: "1.5" può essere "1.5e3" a metà
+                if end >= n or buf[end] not in _AFTER:
+                    if eof and end >= n:
+                        raise ValueError("Risposta JSON troncata o non valida")
+                    break
+                pos = end
+                yield key, value
+        if eof:
+            raise ValueError("Risposta JSON troncata o non valida")
+        try:
+            data = utf8.decode(next(it))
+        except StopIteration:
+            data, eof = utf8.decode(b"", final=True), True
+        buf = buf[pos:] + data
+        pos = 0
+
 
 class FirebaseRestClient:
-    def __init__(self, database_url: str, collection: str, get_token_callable):
+    def __init__(self, database_url: str, collection: str, get_token_callable,
+                 transport: Optional[HttpTransport] = None,
+                 on_unauthorized: Optional[Callable[[Optional[str]], None]] = None):
         self.db_url = database_url.rstrip("/")
         self.collection = collection.strip("/")
         self._get_token = get_token_callable
+        # chiamata con il token rifiutato (401) per rinnovarlo; la richiesta si ripete una volta
+        self._on_unauthorized = on_unauthorized
+        self.http = transport or HttpTransport()
+        # False dopo il primo errore "Index not defined": si passa al filtro lato client
+        self._range_supported = True
+        # False se il server rifiuta X-Firebase-ETag su questa richiesta
+        self._etag_supported = True
 
     def _url(self, path=""):
         return f"{self.db_url}/{self.collection}{path}.json"
 
-    def fetch(self) -> List[Dict[str, Any]]:
-        """Legge TUTTI i record della collection."""
-        params = {"auth": self._get_token()}
-        r = requests.get(self._url(""), params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-        rows: List[Dict[str, Any]] = []
+    def _send(self, method: str, url: str, op: str, params=None, **kwargs) -> requests.Response:
+        token = self._get_token()
+        params = dict(params or {}, auth=token)
+        r = self.http.request(method, url, op=op, params=params, **kwargs)
+        if r.status_code == 401 and self._on_unauthorized is not None:
+            r.close()
+            self._on_unauthorized(token)
+            params["auth"] = self._get_token()
+            r = self.http.request(method, url, op=op, params=params, **kwargs)
+        return r
+
+    @staticmethod
+    def _to_rows(data) -> List[Molitura]:
+        rows: List[Molitura] = []
         if isinstance(data, dict):
             for key, val in data.items():
                 if isinstance(val, dict):
-                    row = val.copy()
-                    row["id"] = key
-                    rows.append(row)
+                    rows.append(Molitura.from_raw(key, val, "firebase"))
+        return rows
+
+    def _get_rows(self, params=None) -> List[Molitura]:
+        """GET sulla collection decodificando la risposta un record alla volta
+        (senza corpo completo né dizionario intermedio in memoria)."""
+        r = self._send("GET", self._url(""), "read", params=params, stream=True, count_body=True)
+        with r:
+            if r.status_code >= 400:
+                _ = r.content  # così e.response.text resta leggibile (es. "Index not defined")
+                r.raise_for_status()
+            return [Molitura.from_raw(k, v, "firebase")
+                    for k, v in iter_children(self.http.iter_body(r)) if isinstance(v, dict)]
+
+    def fetch(self) -> List[Molitura]:
+        """Legge TUTTI i record della collection."""
+        return self._get_rows()
+
+    def iter_pages(self, page_size: int = 1000, after_key: Optional[str] = None) -> Iterator[List[Molitura]]:
+        """Tutta la collection a pagine di page_size record in ordine di chiave
+        (orderBy="$key", non serve alcun indice), a partire dalla chiave dopo after_key.
+        In memoria c'è una pagina alla volta; l'ultima chiave di ogni pagina è il
+        punto da cui riprendere."""
+        page_size = max(1, int(page_size))
+        while True:
+            params = {"orderBy": json.dumps("$key"), "limitToFirst": page_size}
+            if after_key is not None:
+                # startAt è inclusivo: si chiede un record in più e si salta il primo
+                params["startAt"] = json.dumps(after_key)
+                params["limitToFirst"] = page_size + 1
+            rows = self._get_rows(params)
+            # l'ordine delle chiavi nel JSON non è garantito
+            rows.sort(key=lambda r: r.id)
+            if after_key is not None and rows and rows[0].id == after_key:
+                rows = rows[1:]
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            after_key = rows[-1].id
+
+    def fetch_oldest(self, end_ms: int, limit: int) -> Optional[List[Molitura]]:
+        """I primi `limit` record con 0 < dataOra <= end_ms, dal più vecchio
+        (query orderBy="dataOra" con endAt e limitToFirst). None se la query
+        non è possibile perché manca la regola .indexOn su dataOra."""
+        if not self._range_supported:
+            return None
+        params = {"orderBy": json.dumps("dataOra"), "startAt": 1, "endAt": int(end_ms),
+                  "limitToFirst": max(1, int(limit))}
+        try:
+            rows = self._get_rows(params)
+        except requests.HTTPError as e:
+            if not self._index_missing(e):
+                raise
+            self._range_supported = False
+            return None
+        rows.sort(key=lambda r: r.dataOra)
         return rows
 
+    def fetch_range(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Molitura]:
+        """Legge solo i record con start_ms <= dataOra <= end_ms (estremi opzionali).
+
+        Usa la query RTDB orderBy="dataOra"; se la regola .indexOn manca
+        ripiega su fetch() + filtro lato client."""
+        if self._range_supported:
+            params = {"orderBy": json.dumps("dataOra")}
+            if start_ms is not None:
+                params["startAt"] = int(start_ms)
+            if end_ms is not None:
+                params["endAt"] = int(end_ms)
+            try:
+                return self._get_rows(params)
+            except requests.HTTPError as e:
+                if not self._index_missing(e):
+                    raise
+                self._range_supported = False
+
+        return [row for row in self.fetch() if self._in_range(row, start_ms, end_ms)]
+
+    def fetch_range_conditional(self, start_ms: Optional[int], end_ms: Optional[int],
+                                etag: Optional[str] = None) -> Tuple[Optional[List[Molitura]], Optional[str]]:
+        """Come fetch_range, ma chiede l'ETag (X-Firebase-ETag) e manda if-none-match.
+        Ritorna (None, etag) se i dati non sono cambiati, altrimenti (righe, nuovo etag)."""
+        if not self._etag_supported:
+            return self.fetch_range(start_ms, end_ms), None
+
+        params = {}
+        if self._range_supported:
+            params["orderBy"] = json.dumps("dataOra")
+            if start_ms is not None:
+                params["startAt"] = int(start_ms)
+            if end_ms is not None:
+                params["endAt"] = int(end_ms)
+        headers = {"X-Firebase-ETag": "true"}
+        if etag:
+            headers["if-none-match"] = etag
+        r = self._send("GET", self._url(""), "read", params=params, headers=headers)
+        if r.status_code == 400:
+            msg = r.text.lower()
+            if "index not defined" in msg:
+                self._range_supported = False
+            elif "etag" in msg:
+                self._etag_supported = False
+            else:
+                r.raise_for_status()
+            return self.fetch_range_conditional(start_ms, end_ms, etag)
+        new_etag = r.headers.get("ETag")
+        if r.status_code == 304 or (etag and new_etag == etag):
+            # invariato: non serve nemmeno decodificare il corpo
+            return None, etag
+        r.raise_for_status()
+        rows = self._to_rows(r.json())
+        if "orderBy" not in params:
+            rows = [row for row in rows if self._in_range(row, start_ms, end_ms)]
+        return rows, new_etag
+
+    @staticmethod
+    def _index_missing(e: requests.HTTPError) -> bool:
+        resp = e.response
+        return resp is not None and resp.status_code == 400 and "index not defined" in resp.text.lower()
+
+    @staticmethod
+    def _in_range(row: Molitura, start_ms: Optional[int], end_ms: Optional[int]) -> bool:
+        ts = row.dataOra
+        if start_ms is not None and ts < start_ms:
+            return False
+        if end_ms is not None and ts > end_ms:
+            return False
+        return True
+
+    # ---- nodi fuori dalla collection, con scritture condizionali (ETag) ----
+    def _node_url(self, path: str) -> str:
+        return f"{self.db_url}/{path.strip('/')}.json"
+
+    @staticmethod
+    def _server_time(r: requests.Response) -> float:
+        """Ora del server (header Date, al secondo), così PC con orologi diversi
+        confrontano le scadenze sulla stessa base; ora locale se manca."""
+        try:
+            return parsedate_to_datetime(r.headers["Date"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+
+    def read_node(self, path: str) -> Tuple[Any, Optional[str], float]:
+        """(valore, ETag, ora del server) del nodo path, relativo alla radice del database."""
+        r = self._send("GET", self._node_url(path), "read", headers={"X-Firebase-ETag": "true"})
+        r.raise_for_status()
+        return r.json(), r.headers.get("ETag"), self._server_time(r)
+
+    def write_node_if(self, path: str, value: Any, etag: str) -> Tuple[bool, Any, Optional[str]]:
+        """Scrive value nel nodo (lo cancella se None) solo se il suo ETag è ancora etag.
+        (True, value, nuovo ETag) se scritto; (False, valore attuale, ETag attuale)
+        se nel frattempo qualcun altro l'ha cambiato (412)."""
+        url = self._node_url(path)
+        headers = {"if-match": etag}
+        if value is None:
+            r = self._send("DELETE", url, "write", headers=headers)
+        else:
+            r = self._send("PUT", url, "write", json=value, headers=headers)
+        if r.status_code == 412:
+            return False, r.json(), r.headers.get("ETag")
+        r.raise_for_status()
+        return True, value, r.headers.get("ETag")
+
     def update_pagamento(self, push_id: str, pagamento: str):
-        params = {"auth": self._get_token()}
-        r = requests.patch(self._url(f"/{push_id}"), params=params,
-                           json={"pagamento": pagamento}, timeout=15)
+        r = self._send("PATCH", self._url(f"/{push_id}"), "write", json={"pagamento": pagamento})
+        r.raise_for_status()
+        return r.json()
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """Gli id di ids che esistono ancora su Firebase, con una sola GET shallow
+        della collection (solo le chiavi dei giorni su Firebase, senza i record)."""
+        r = self._send("GET", self._url(""), "read", params={"shallow": "true"})
+        r.raise_for_status()
+        keys = r.json() or {}
+        return {rid for rid in ids if rid in keys}
+
+    def patch_multi(self, updates: Dict[str, Any]):
+        """Aggiornamento multi-path atomico sulla collection: {"id/campo": valore,
+        "id": None, ...} in una sola richiesta. Un path non può contenerne un altro."""
+        if not updates:
+            return
+        r = self._send("PATCH", self._url(""), "write", json=updates)
         r.raise_for_status()
         return r.json()
 
@@ -36,11 +301,7 @@ class FirebaseRestClient:
         """Cancella in batch via PATCH {id: null}."""
         if not ids:
             return
-        params = {"auth": self._get_token()}
-        payload = {iid: None for iid in ids}
-        r = requests.patch(self._url(""), params=params, json=payload, timeout=30)
-        r.raise_for_status()
-        return r.json()
+        return self.patch_multi({iid: None for iid in ids})
 
     def delete_one(self, iid: str):
         """Cancella un singolo record (equivale a delete_many con 1 id)."""
@@ -0,0 +1,261 @@
+import json
+import socket
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from app_frantoio.core.record import Molitura
+from app_frantoio.core.transport import HttpTransport
+
+
+class _AuthRevoked(Exception):
+    pass
+
+
+class FirebaseStream:
+    """Mirror in memoria della collection tenuto aggiornato dallo stream SSE di RTDB
+    (Accept: text/event-stream). Gli eventi put/patch vengono applicati come delta
+    e on_change(changed_rows, removed_ids) riceve solo le righe cambiate.
+
+    Alla riconnessione RTDB rimanda lo snapshot completo con un put su "/":
+    viene confrontato col mirror, quindi si notificano solo le differenze."""
+
+    def __init__(self, database_url: str, collection: str, get_token_callable,
+                 on_change: Optional[Callable[[List[Molitura], List[str]], None]] = None,
+                 refresh_token_callable: Optional[Callable[[], Any]] = None,
+                 reconnect_s: float = 2.0, max_backoff_s: float = 60.0,
+                 transport: Optional[HttpTransport] = None):
+        self.db_url = database_url.rstrip("/")
+        self.collection = collection.strip("/")
+        self._get_token = get_token_callable
+        self._refresh_token = refresh_token_callable
+        self.http = transport or HttpTransport()
+        self.on_change = on_change
+        self.reconnect_s = reconnect_s
+        self.max_backoff_s = max_backoff_s
+        self.last_error: Optional[str] = None
+
+        self._rows: Dict[str, Dict[str, Any]] = {}      # nodi grezzi, per applicare i path
+        self._records: Dict[str, Molitura] = {}         # gli stessi, già normalizzati
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._resp = None
+
+    def _url(self):
+        return f"{self.db_url}/{self.collection}.json"
+
+    # ---- ciclo di vita ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="FirebaseStream", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        resp = self._resp
+        if resp is not None:
+            # resp.close() attenderebbe la read bloccata: si chiude direttamente il socket
+            sock = self._socket_of(resp)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self._thread:
+            self._thread.join(timeout)
+        self._synced.clear()
+
+    @staticmethod
+    def _socket_of(resp):
+        sock = getattr(getattr(resp.raw, "connection", None), "sock", None)
+        if sock is None:
+            # con "Connection: close" http.client stacca il socket dalla connessione,
+            # resta raggiungibile solo dal file della risposta
+            fp = getattr(getattr(resp.raw, "_fp", None), "fp", None)
+            sock = getattr(getattr(fp, "raw", None), "_sock", None)
+        return sock
+
+    def is_synced(self) -> bool:
+        """True se il mirror riflette lo stato corrente (connessi e snapshot ricevuto)."""
+        return self._synced.is_set()
+
+    def wait_synced(self, timeout: Optional[float] = None) -> bool:
+        return self._synced.wait(timeout)
+
+    # ---- letture dal mirror ----
+    def snapshot(self) -> List[Molitura]:
+        with self._lock:
+            return list(self._records.values())
+
+    def snapshot_range(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Molitura]:
+        with self._lock:
+            return [r for r in self._records.values()
+                    if (start_ms is None or r.dataOra >= start_ms)
+                    and (end_ms is None or r.dataOra <= end_ms)]
+
+    # ---- connessione ----
+    def _run(self):
+        backoff = self.reconnect_s
+        auth_retries = 0  # rinnovi del token senza che lo stream sia mai arrivato allo snapshot
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                backoff = self.reconnect_s
+            except _AuthRevoked:
+                if self._synced.is_set():
+                    auth_retries = 0  # lo stream funzionava: il token è solo scaduto
+                self._synced.clear()
+                try:
+                    if self._refresh_token is None:
+                        raise RuntimeError("token revocato e nessun refresh disponibile")
+                    self._refresh_token()
+                    auth_retries += 1
+                    if auth_retries == 1:
+                        continue  # primo rinnovo: ci si riconnette subito, poi con il backoff
+                    self.last_error = "Token rinnovato ma rifiutato di nuovo dal server"
+                except Exception as e:
+                    self.last_error = f"Ri-autenticazione fallita: {e}"
+            except Exception as e:
+                self.last_error = str(e)
+            self._synced.clear()
+            if self._stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff_s)
+
+    def _listen(self):
+        params = {"auth": self._get_token()}
+        headers = {"Accept": "text/event-stream"}
+        # RTDB manda keep-alive ogni ~30 s: il read timeout "stream" (90 s) rileva connessioni morte
+        resp = self.http.get(self._url(), op="stream", params=params, headers=headers, stream=True)
+        self._resp = resp
+        try:
+            if resp.status_code == 401:
+                raise _AuthRevoked()
+            resp.raise_for_status()
+            for event, data in self._iter_events(resp):
+                if self._stop.is_set():
+                    return
+                self._dispatch(event, data)
+        finally:
+            self._resp = None
+            resp.close()
+
+    @staticmethod
+    def _iter_chunks(resp):
+        read1 = getattr(resp.raw, "read1", None)
+        if read1 is None:
+            # urllib3 < 2: niente read1, si legge a byte per non ritardare gli eventi
+            yield from resp.iter_content(chunk_size=1)
+            return
+        while True:
+            chunk = read1(65536, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+
+    def _iter_events(self, resp):
+        buf = b""
+        event, data = None, []
+        for chunk in self._iter_chunks(resp):
+            buf += chunk
+            while True:
+                nl = buf.find(b"\n")
+                if nl < 0:
+                    break
+                line = buf[:nl].rstrip(b"\r").decode("utf-8")
+                buf = buf[nl + 1:]
+                if not line:
+                    if event is not None:
+                        yield event, "\n".join(data)
+                    event, data = None, []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].lstrip())
+
+    # ---- applicazione eventi ----
+    def _dispatch(self, event: str, raw: str):
+        if event == "keep-alive":
+            return
+        if event == "auth_revoked":
+            raise _AuthRevoked()
+        if event == "cancel":
+            raise RuntimeError(f"Stream annullato dal server: {raw}")
+        if event not in ("put", "patch"):
+            return
+
+        msg = json.loads(raw) if raw else {}
+        path = (msg or {}).get("path", "/")
+        value = (msg or {}).get("data")
+        changed: Dict[str, Optional[Dict[str, Any]]] = {}
+        upserts: List[Molitura] = []
+        removed: List[str] = []
+        with self._lock:
+            if event == "put":
+                self._put(path, value, changed)
+            elif isinstance(value, dict):
+                base = path.rstrip("/")
+                for key, val in value.items():
+                    self._put(f"{base}/{key}", val, changed)
+            for rid, row in changed.items():
+                if row is None:
+                    self._records.pop(rid, None)
+                    removed.append(rid)
+                else:
+                    rec = self._records[rid] = Molitura.from_raw(rid, row, "firebase")
+                    upserts.append(rec)
+        self._synced.set()
+        self._notify(upserts, removed)
+
+    def _put(self, path: str, value: Any, changed: Dict[str, Optional[Dict[str, Any]]]):
+        parts = [p for p in path.split("/") if p]
+        if not parts:
+            new_rows = {}
+            if isinstance(value, dict):
+                for key, val in value.items():
+                    if isinstance(val, dict):
+                        new_rows[key] = val
+            for key in self._rows.keys() - new_rows.keys():
+                changed[key] = None
+            for key, row in new_rows.items():
+                if self._rows.get(key) != row:
+                    changed[key] = row
+            self._rows = new_rows
+            return
+
+        rid = parts[0]
+        if len(parts) == 1:
+            if isinstance(value, dict):
+                self._rows[rid] = value
+                changed[rid] = value
+            elif self._rows.pop(rid, None) is not None:
+                changed[rid] = None
+            return
+
+        row = self._rows.get(rid)
+        if row is None:
+            if value is None:
+                return
+            row = {}
+            self._rows[rid] = row
+        node = row
+        for p in parts[1:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                child = node[p] = {}
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        changed[rid] = row
+
+    def _notify(self, upserts: List[Molitura], removed: List[str]):
+        if not (upserts or removed) or self.on_change is None:
+            return
+        try:
+            self.on_change(upserts, removed)
+        except Exception as e:
+            self.last_error = str(e)
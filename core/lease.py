@@ -0,0 +1,111 @@
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+import requests
+from app_frantoio.core.fb_client import FirebaseRestClient
+
+log = logging.getLogger("app_frantoio.lease")
+
+# il nodo della lease non si può scrivere (regole RTDB): si lavora come prima, senza
+_DENIED_STATUS = {401, 403}
+
+
+class LeaseLost(RuntimeError):
+    """La lease è passata a un altro PC mentre si lavorava come detentore."""
+
+
+class LeaderLease:
+    """Lease con scadenza in un nodo RTDB: un solo PC alla volta cancella da Firebase
+    i record oltre retention_days; gli altri copiano soltanto nel proprio archivio.
+
+    Il nodo contiene {"holder", "host", "expires"} (expires in ms, ora del server).
+    acquire() lo legge con il suo ETag e, se è libero, scaduto o già nostro, lo
+    riscrive con if-match e una nuova scadenza: se intanto un altro PC l'ha preso
+    RTDB risponde 412 e la lease resta sua. Il detentore la rinnova a ogni sync;
+    se smette (PC spento, rete giù) dopo ttl_s la prende il primo che ci prova.
+
+    Se le regole del database non permettono di scrivere il nodo la lease viene
+    disattivata e acquire() ritorna sempre True (ogni PC fa la pulizia, come prima)."""
+
+    def __init__(self, fb: FirebaseRestClient, path: str, holder: Optional[str] = None,
+                 ttl_s: float = 900.0):
+        self.fb = fb
+        self.path = path.strip("/")
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl_ms = int(max(1.0, float(ttl_s)) * 1000)
+        self.enabled = True
+        # ultimo contenuto letto dal nodo (chi la tiene, fino a quando)
+        self.current: Optional[Dict[str, Any]] = None
+        # errore dell'ultima acquire() fallita (rete, 5xx...), None se è andata a buon fine
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._deadline = 0.0  # time.monotonic() oltre cui la nostra lease è scaduta
+
+    def is_held(self) -> bool:
+        """True se l'ultima acquire() è riuscita e la scadenza non è passata (orologio locale)."""
+        return not self.enabled or time.monotonic() < self._deadline
+
+    def acquire(self) -> bool:
+        """Prende o rinnova la lease; False se è di un altro PC e non è scaduta.
+        Gli altri errori (rete, 5xx, 400 dalle regole) vengono sollevati e restano
+        in last_error."""
+        with self._lock:
+            if not self.enabled:
+                return True
+            try:
+                held = self._acquire()
+            except Exception as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if not isinstance(e, requests.HTTPError) or status not in _DENIED_STATUS:
+                    self.last_error = str(e)
+                    raise
+                log.warning("Lease %s non scrivibile (HTTP %s): ogni PC farà la pulizia",
+                            self.path, status)
+                self.enabled = False
+                held = True
+            self.last_error = None
+            return held
+
+    def _acquire(self) -> bool:
+        value, etag, server_s = self.fb.read_node(self.path)
+        now_ms = int(server_s * 1000)
+        if isinstance(value, dict) and value.get("holder") != self.holder \
+                and int(value.get("expires") or 0) > now_ms:
+            self.current = value
+            self._deadline = 0.0
+            return False
+        t0 = time.monotonic()
+        mine = {"holder": self.holder, "host": socket.gethostname(), "expires": now_ms + self.ttl_ms}
+        ok, current, _ = self.fb.write_node_if(self.path, mine, etag)
+        self.current = current if isinstance(current, dict) else None
+        if not ok:
+            self._deadline = 0.0
+            return False
+        # margine: la scadenza locale parte da prima della scrittura
+        self._deadline = t0 + self.ttl_ms / 1000
+        return True
+
+    def ensure(self):
+        """Per i lavori lunghi del detentore: rinnova la lease quando ne è passata
+        metà e solleva LeaseLost se nel frattempo l'ha presa un altro PC."""
+        if not self.enabled:
+            return
+        if time.monotonic() < self._deadline - self.ttl_ms / 2000:
+            return
+        if not self.acquire():
+            holder = (self.current or {}).get("holder")
+            raise LeaseLost(f"La lease {self.path} è passata a {holder}")
+
+    def release(self):
+        """Libera la lease se è ancora nostra, così un altro PC può subentrare subito."""
+        with self._lock:
+            if not self.enabled or self._deadline == 0.0:
+                return
+            self._deadline = 0.0
+            value, etag, _ = self.fb.read_node(self.path)
+            if isinstance(value, dict) and value.get("holder") == self.holder:
+                self.fb.write_node_if(self.path, None, etag)
+            self.current = None
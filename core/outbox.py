@@ -0,0 +1,173 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import requests
+from app_frantoio.core.fb_client import FirebaseRestClient
+from app_frantoio.core.record import Molitura
+from app_frantoio.core.sqlite_client import SQLiteClient
+
+PAGAMENTO = "pagamento"
+DELETE = "delete"
+
+# risposte che non cambiano riprovando (dati rifiutati): le operazioni si scartano.
+# 401 no: il token potrebbe tornare valido; 408/429 sono temporanei
+_REJECT_STATUS = {400, 403, 404, 405, 409, 412, 413, 422}
+
+
+class Outbox:
+    """Coda persistente (tabella outbox) delle modifiche a Firebase.
+
+    Le operazioni vengono accodate subito e le letture le vedono già applicate
+    (overlay); flush() le invia tutte in un solo PATCH multi-path, fondendo quelle
+    sullo stesso record (l'ultimo pagamento vince, la cancellazione prevale).
+    Se l'invio fallisce restano in coda e si riprova al flush successivo."""
+
+    def __init__(self, fb: FirebaseRestClient, sql: SQLiteClient):
+        self.fb = fb
+        self.sql = sql
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # rid -> (seq dell'ultima operazione, op, valore) dopo la fusione
+        self._pending: Dict[str, Tuple[int, str, Optional[str]]] = {}
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            self._pending = self._coalesce(self.sql.outbox_pending())
+
+    @staticmethod
+    def _coalesce(ops) -> Dict[str, Tuple[int, str, Optional[str]]]:
+        merged: Dict[str, Tuple[int, str, Optional[str]]] = {}
+        for seq, rid, op, value in ops:
+            prev = merged.get(rid)
+            if prev is not None and prev[1] == DELETE:
+                # un pagamento dopo la cancellazione ricreerebbe il nodo
+                merged[rid] = (seq, DELETE, None)
+            else:
+                merged[rid] = (seq, op, value)
+        return merged
+
+    def add_many(self, ops: List[Tuple[str, str, Optional[str]]]):
+        """Accoda [(rid, op, valore)] (op: PAGAMENTO o DELETE)."""
+        if not ops:
+            return
+        self.sql.outbox_add_many(ops)
+        self._load()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def overlay(self, rows: List[Molitura]) -> List[Molitura]:
+        """Applica alle righe lette le operazioni non ancora inviate."""
+        with self._lock:
+            if not self._pending:
+                return rows
+            pending = dict(self._pending)
+        out: List[Molitura] = []
+        for r in rows:
+            p = pending.get(r.id)
+            if p is None:
+                out.append(r)
+            elif p[1] == PAGAMENTO and r.pagamento != p[2]:
+                # copia: le righe possono stare nella cache del repository
+                out.append(Molitura(r.id, r.name, r.weight, p[2] or "", r.dataOra, r.source))
+            elif p[1] == PAGAMENTO:
+                out.append(r)
+        return out
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """Dentro il blocco nessun flush è in corso né può partire."""
+        with self._flush_lock:
+            yield
+
+    def drop(self, rids: List[str]):
+        """Toglie dalla coda le operazioni sui record rids, senza inviarle."""
+        self.sql.outbox_drop(rids)
+        self._load()
+
+    def flush(self) -> Dict[str, Any]:
+        """Invia le operazioni in coda in un solo PATCH multi-path.
+
+        Prima si controlla, con una sola GET shallow delle chiavi della collection,
+        che i record con un pagamento in coda esistano ancora: PATCH su rid/pagamento
+        di un nodo cancellato (da un altro PC o dalla pulizia) lo ricreerebbe con il
+        solo pagamento, quindi quelle operazioni si scartano ("gone"). Resta la finestra tra controllo e invio; per chiuderla del tutto
+        serve una regola .validate su $rid che richieda dataOra.
+
+        Se Firebase rifiuta il PATCH (dati, regole) le operazioni si ritentano una
+        alla volta e si scartano solo quelle rifiutate. Ritorna {"sent", "pending",
+        "rejected", "gone"}; solleva l'eccezione se l'invio va ritentato (rete, 5xx,
+        401), lasciando in coda le operazioni non ancora inviate."""
+        with self._flush_lock:
+            ops = self.sql.outbox_pending()
+            if not ops:
+                return {"sent": 0, "pending": 0, "rejected": [], "gone": []}
+            max_seq = ops[-1][0]
+            merged = self._coalesce(ops)
+            paid = [rid for rid, (_seq, op, _value) in merged.items() if op == PAGAMENTO]
+            try:
+                alive = self.fb.existing_ids(paid) if paid else set()
+            except Exception as e:
+                self._failed(max_seq, e)
+                raise
+            gone = [rid for rid in paid if rid not in alive]
+            updates: Dict[str, Tuple[str, Any]] = {}
+            for rid, (_seq, op, value) in merged.items():
+                if op == DELETE:
+                    updates[rid] = (rid, None)
+                elif rid in alive:
+                    updates[rid] = (f"{rid}/pagamento", value)
+            sent: List[str] = []
+            rejected: List[str] = []
+            try:
+                try:
+                    self.fb.patch_multi(dict(updates.values()))
+                    sent = list(updates)
+                except requests.HTTPError as e:
+                    if self._status(e) not in _REJECT_STATUS or len(updates) == 1:
+                        raise
+                    # una sola operazione rifiutata non deve far perdere le altre
+                    for rid, (path, value) in updates.items():
+                        try:
+                            self.fb.patch_multi({path: value})
+                            sent.append(rid)
+                        except requests.HTTPError as e1:
+                            if self._status(e1) not in _REJECT_STATUS:
+                                raise
+                            rejected.append(rid)
+                            self.last_error = f"Modifiche rifiutate da Firebase ({self._status(e1)}): {e1}"
+            except requests.HTTPError as e:
+                if self._status(e) in _REJECT_STATUS and not sent:
+                    rejected = list(updates)
+                    self.last_error = f"Modifiche rifiutate da Firebase ({self._status(e)}): {e}"
+                else:
+                    self._done(sent + gone, max_seq)
+                    self._failed(max_seq, e)
+                    raise
+            except Exception as e:
+                self._done(sent + gone, max_seq)
+                self._failed(max_seq, e)
+                raise
+            if not rejected:
+                self.last_error = None
+            self.sql.outbox_done(max_seq)
+            self._load()  # restano solo le operazioni accodate durante l'invio
+            return {"sent": len(sent), "pending": self.pending_count(),
+                    "rejected": rejected, "gone": gone}
+
+    @staticmethod
+    def _status(e: requests.HTTPError) -> Optional[int]:
+        return getattr(e.response, "status_code", None)
+
+    def _done(self, rids: List[str], max_seq: int):
+        """Toglie dalla coda le operazioni già chiuse quando l'invio si interrompe a metà."""
+        if rids:
+            self.sql.outbox_drop(rids, max_seq)
+            self._load()
+
+    def _failed(self, max_seq: int, e: Exception):
+        self.last_error = str(e)
+        self.sql.outbox_failed(max_seq, str(e))
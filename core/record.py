@@ -0,0 +1,79 @@
+from typing import Any, Dict, Optional
+from app_frantoio.util.time_utils import fmt_day, fmt_ts
+
+
+def _to_float(v: Any) -> float:
+    try:
+        return float(v or 0)
+    except Exception:
+        return 0.0
+
+
+def _to_ms(v: Any) -> int:
+    try:
+        return int(float(v or 0))
+    except Exception:
+        return 0
+
+
+class Molitura:
+    """Record di molitura normalizzato una sola volta all'ingresso (Firebase, stream,
+    SQLite): name/nome e weight/peso unificati, peso già float, dataOra in ms.
+    Ora di visualizzazione e prezzo sono calcolati una volta e poi solo letti."""
+
+    __slots__ = ("id", "name", "weight", "pagamento", "dataOra", "source", "prezzo", "_ora", "_giorno")
+
+    def __init__(self, rid: str, name: str, weight: float, pagamento: str, dataOra: int,
+                 source: str, prezzo: float = 0.0):
+        self.id = rid
+        self.name = name
+        self.weight = weight
+        self.pagamento = pagamento
+        self.dataOra = dataOra
+        self.source = source
+        self.prezzo = prezzo
+        self._ora: Optional[str] = None
+        self._giorno: Optional[str] = None
+
+    @classmethod
+    def from_raw(cls, rid: str, raw: Dict[str, Any], source: str) -> "Molitura":
+        """Da un nodo Firebase (chiavi name/nome, weight/peso, pagamento, dataOra)."""
+        return cls(
+            rid,
+            str(raw.get("name") or raw.get("nome") or ""),
+            _to_float(raw.get("weight") or raw.get("peso")),
+            str(raw.get("pagamento") or ""),
+            _to_ms(raw.get("dataOra")),
+            source,
+        )
+
+    @property
+    def ora(self) -> str:
+        """'HH:MM' (Europe/Rome), calcolata alla prima lettura."""
+        if self._ora is None:
+            self._ora = fmt_ts(self.dataOra) if self.dataOra else ""
+        return self._ora
+
+    @property
+    def giorno(self) -> str:
+        """'dd/mm/YYYY' (Europe/Rome), per le viste su più giorni."""
+        if self._giorno is None:
+            self._giorno = fmt_day(self.dataOra) if self.dataOra else ""
+        return self._giorno
+
+    def set_price(self, euro_per_kg: float):
+        self.prezzo = self.weight * euro_per_kg
+
+    def same_as(self, other: "Molitura") -> bool:
+        """True se i campi visibili coincidono (usato dal diff del modello)."""
+        return (self.id == other.id and self.name == other.name and self.weight == other.weight
+                and self.pagamento == other.pagamento and self.dataOra == other.dataOra
+                and self.source == other.source)
+
+    def as_tuple(self):
+        """(id, name, weight, pagamento, dataOra): l'ordine delle colonne di moliture."""
+        return (self.id, self.name, self.weight, self.pagamento, self.dataOra)
+
+    def __repr__(self):
+        return (f"Molitura(id={self.id!r}, name={self.name!r}, weight={self.weight!r}, "
+                f"pagamento={self.pagamento!r}, dataOra={self.dataOra!r}, source={self.source!r})")
@@ -1,79 +1,441 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
-from typing import Any, Dict, List
-from app_frantoio.util.time_utils import TZ, in_day
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app_frantoio.util.metrics import METRICS
+from app_frantoio.util.time_utils import TZ, day_bounds_ts_ms, season_bounds, season_of
+from app_frantoio.core.cache import DayCache
 from app_frantoio.core.fb_client import FirebaseRestClient 
+from app_frantoio.core.fb_stream import FirebaseStream
+from app_frantoio.core.lease import LeaderLease
+from app_frantoio.core.outbox import DELETE, PAGAMENTO, Outbox
+from app_frantoio.core.record import Molitura
 from app_frantoio.core.sqlite_client import SQLiteClient
 
 class HybridRepository:
     """Legge: Firebase (ultimi N giorni) o SQLite (storico).
-       Sync periodico: duplica tutto da Firebase -> SQLite e ripulisce Firebase > retention."""
+       Sync periodico incrementale: copia da Firebase -> SQLite solo i record dal watermark
+       in poi (più un margine per i pagamenti modificati dopo) e ripulisce Firebase > retention.
+       Una volta ogni full_mirror_hours si rilegge tutta la collection per riallineare."""
     def __init__(self, firebase_client: FirebaseRestClient, sqlite_client: SQLiteClient,
-                 hybrid_days: int, retention_days: int):
+                 hybrid_days: int, retention_days: int,
+                 mirror_lookback_hours: float = 48, full_mirror_hours: float = 24,
+                 cache_days: int = 32, cache_ttl_s: float = 600,
+                 work_hours: Sequence[int] = (7, 20), rollover_days: int = 60,
+                 page_size: int = 1000, cleanup_batch: int = 500, cleanup_pause_s: float = 0.2):
         self.fb = firebase_client
         self.sql = sqlite_client
         self.hybrid_days = max(0, int(hybrid_days))
         self.retention_days = max(1, int(retention_days))
+        self.mirror_lookback_ms = int(max(0.0, float(mirror_lookback_hours)) * 3600 * 1000)
+        self.full_mirror_ms = int(max(1.0, float(full_mirror_hours)) * 3600 * 1000)
+        self.stream: Optional[FirebaseStream] = None
+        # con più PC: solo chi tiene la lease fa la pulizia di Firebase
+        self.lease: Optional[LeaderLease] = None
+        self._archive_token: Optional[Tuple[int, int]] = None  # ultima archive_version()
+        # cache per (data, sorgente): i giorni Firebase si rivalidano con l'ETag,
+        # quelli SQLite restano validi finché una scrittura locale non li invalida
+        self.cache = DayCache(cache_days, cache_ttl_s)
+        # pagamenti/cancellazioni su Firebase: applicati subito in locale, inviati da flush_outbox()
+        self.outbox = Outbox(firebase_client, sqlite_client)
+        # manutenzione dell'archivio fuori da work_hours; una stagione passa nel suo
+        # file rollover_days dopo la fine (Firebase non ha più suoi record)
+        self.work_hours = (int(work_hours[0]), int(work_hours[1]))
+        self.rollover_days = max(0, int(rollover_days))
+        # letture a pagine e cancellazioni a blocchi: memoria e dimensione dei PATCH limitate
+        self.page_size = max(1, int(page_size))
+        self.cleanup_batch = max(1, int(cleanup_batch))
+        self.cleanup_pause_s = max(0.0, float(cleanup_pause_s))
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def attach_stream(self, stream: Optional[FirebaseStream]):
+        """Con uno stream SSE sincronizzato le letture Firebase usano il mirror locale."""
+        self.stream = stream
+
+    def attach_lease(self, lease: Optional[LeaderLease]):
+        self.lease = lease
+
+    def is_firebase_day(self, d: date) -> bool:
+        return self._is_in_firebase_window(d)
 
     def _is_in_firebase_window(self, d: date) -> bool:
         today = datetime.now(TZ).date()
         return (today - d).days <= self.hybrid_days
 
-    def fetch_day(self, d: date) -> List[Dict[str, Any]]:
+    @METRICS.timed("repo.fetch_day")
+    def fetch_day(self, d: date) -> List[Molitura]:
+        return self.outbox.overlay(self._fetch_day(d))
+
+    def _fetch_day(self, d: date) -> List[Molitura]:
+        gen = self.cache.generation
         if self._is_in_firebase_window(d):
-            rows = self.fb.fetch()
-            out = []
-            for r in rows:
-                if in_day(r.get("dataOra"), d):
-                    rr = r.copy()
-                    rr["_source"] = "firebase"
-                    out.append(rr)
-            try:
-                out.sort(key=lambda r: int(float(r.get("dataOra") or 0)))
-            except Exception:
-                pass
-            return out
+            a_ms, b_ms = day_bounds_ts_ms(d)
+            if self.stream is not None and self.stream.is_synced():
+                return self._sorted(self.stream.snapshot_range(a_ms, b_ms))
+            key = (d, "firebase")
+            entry = self.cache.peek(key)
+            rows, etag = self.fb.fetch_range_conditional(a_ms, b_ms, entry.etag if entry else None)
+            if rows is None:
+                self.cache.touch(key)
+                return list(entry.rows)
+            self.cache.note_miss()
+            rows = self._sorted(rows)
+            self.cache.put(key, rows, etag, generation=gen)
+            return list(rows)
         else:
-            return self.sql.fetch_day(d)
+            key = (d, "sqlite")
+            entry = self.cache.get(key)
+            if entry is None:
+                rows = self.sql.fetch_day(d)
+                self.cache.put(key, rows, generation=gen)
+            else:
+                rows = entry.rows
+            return list(rows)
+
+    @METRICS.timed("repo.fetch_range")
+    def fetch_range(self, start: date, end: date) -> List[Molitura]:
+        """Record dal giorno start al giorno end compresi, ordinati per dataOra.
+
+        L'intervallo viene diviso al confine ibrido: la parte storica va su SQLite,
+        quella recente su Firebase (o sul mirror dello stream), con due query di
+        intervallo eseguite in parallelo. In caso di id presenti in entrambe le
+        sorgenti (giorni appena copiati in archivio) vince Firebase."""
+        if end < start:
+            start, end = end, start
+        if start == end:
+            return self.fetch_day(start)
+
+        fb_first = datetime.now(TZ).date() - timedelta(days=self.hybrid_days)
+        sql_part = (start, min(end, fb_first - timedelta(days=1))) if start < fb_first else None
+        fb_part = (max(start, fb_first), end) if end >= fb_first else None
+
+        def _sql():
+            a_ms = day_bounds_ts_ms(sql_part[0])[0]
+            b_ms = day_bounds_ts_ms(sql_part[1])[1]
+            return self.sql.fetch_range(a_ms, b_ms)
+
+        def _fb():
+            a_ms = day_bounds_ts_ms(fb_part[0])[0]
+            b_ms = day_bounds_ts_ms(fb_part[1])[1]
+            if self.stream is not None and self.stream.is_synced():
+                return self.stream.snapshot_range(a_ms, b_ms)
+            return self.fb.fetch_range(a_ms, b_ms)
+
+        if sql_part and fb_part:
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                f_sql, f_fb = ex.submit(_sql), ex.submit(_fb)
+                sql_rows, fb_rows = f_sql.result(), f_fb.result()
+        else:
+            sql_rows = _sql() if sql_part else []
+            fb_rows = _fb() if fb_part else []
+
+        merged = {r.id: r for r in sql_rows}
+        merged.update((r.id, r) for r in fb_rows)
+        return self.outbox.overlay(self._sorted(list(merged.values())))
+
+    def archive_version(self) -> Optional[Tuple[Any, ...]]:
+        """Versione dell'archivio (SQLiteClient.change_token), None se non
+        disponibile ora. Se è cambiata (anche per mano di un altro processo) i
+        giorni SQLite in cache non valgono più."""
+        token = self.sql.change_token()
+        if token is not None:
+            if self._archive_token is not None and token != self._archive_token:
+                self.cache.invalidate("sqlite")
+            self._archive_token = token
+        return token
+
+    def is_archive_range(self, start: date, end: date) -> bool:
+        """True se tutti i giorni da start a end si leggono dall'archivio SQLite."""
+        return not self._is_in_firebase_window(max(start, end))
+
+    def archive_totals(self, start: date, end: date) -> Tuple[int, float]:
+        """(conferimenti, kg) dei giorni d'archivio da start a end, dagli aggregati:
+        nessun record viene letto."""
+        rows = self.sql.totals_by_day(min(start, end), max(start, end))
+        return sum(n for _, _, n in rows), float(sum(kg for _, kg, _ in rows))
+
+    def archive_page(self, start: date, end: date, after: Optional[Tuple[int, str]],
+                     limit: int, blocking: bool = True) -> Optional[List[Molitura]]:
+        """Pagina di record d'archivio ordinati per (dataOra, id), dopo la chiave after
+        (vedi SQLiteClient.fetch_page). Le modifiche locali sono già nell'archivio.
+        Con blocking=False None se l'archivio è occupato."""
+        a_ms = day_bounds_ts_ms(min(start, end))[0]
+        b_ms = day_bounds_ts_ms(max(start, end))[1]
+        return self.sql.fetch_page(a_ms, b_ms, after, limit, blocking)
+
+    def iter_archive(self, start: date, end: date, chunk_size: int = 5000) -> Iterator[List[Molitura]]:
+        """Record d'archivio da start a end ordinati per dataOra, a blocchi di
+        chunk_size (SQLiteClient.iter_chunks: connessione dedicata, il lock del client
+        resta libero). Per gli export da un thread di lavoro."""
+        a_ms = day_bounds_ts_ms(min(start, end))[0]
+        b_ms = day_bounds_ts_ms(max(start, end))[1]
+        for chunk in self.sql.iter_chunks(a_ms, b_ms, chunk_size):
+            yield [Molitura(rid, name or "", weight or 0.0, pagamento or "", ts or 0, "sqlite")
+                   for rid, name, weight, pagamento, ts in chunk]
+
+    @METRICS.timed("repo.search")
+    def search(self, text: str, limit: int = 500) -> List[Molitura]:
+        """Record il cui nome contiene text, dal più recente: archivio (indice FTS)
+        più i giorni ancora su Firebase, che prevalgono sugli stessi id in archivio."""
+        text = text.strip()
+        if not text:
+            return []
+        sql_rows = self.sql.search_name(text, limit)
+        needle = text.casefold()
+        fb_rows = [r for r in self._firebase_window() if needle in r.name.casefold()]
+        merged = {r.id: r for r in sql_rows}
+        merged.update((r.id, r) for r in fb_rows)
+        rows = self.outbox.overlay(list(merged.values()))
+        rows.sort(key=lambda r: r.dataOra, reverse=True)
+        return rows[:limit]
+
+    def _firebase_window(self) -> List[Molitura]:
+        """Tutti i record della finestra Firebase: mirror dello stream se sincronizzato,
+        altrimenti una lettura condizionale (ETag) tenuta in cache come i giorni."""
+        fb_first = datetime.now(TZ).date() - timedelta(days=self.hybrid_days)
+        a_ms = day_bounds_ts_ms(fb_first)[0]
+        if self.stream is not None and self.stream.is_synced():
+            return self.stream.snapshot_range(a_ms, None)
+        gen = self.cache.generation
+        key = (fb_first, "window", "firebase")
+        entry = self.cache.peek(key)
+        rows, etag = self.fb.fetch_range_conditional(a_ms, None, entry.etag if entry else None)
+        if rows is None:
+            self.cache.touch(key)
+            return entry.rows
+        self.cache.note_miss()
+        self.cache.put(key, rows, etag, generation=gen)
+        return rows
+
+    @staticmethod
+    def _sorted(rows: List[Molitura]) -> List[Molitura]:
+        rows.sort(key=lambda r: r.dataOra)
+        return rows
 
     def update_pagamento(self, rid: str, pagamento: str, source: str):
-        if source == "firebase":
-            return self.fb.update_pagamento(rid, pagamento)
-        elif source == "sqlite":
-            return self.sql.update_pagamento(rid, pagamento)
+        return self.update_pagamento_many([(rid, source)], pagamento)
+
+    @staticmethod
+    def _split_sources(items: Sequence[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+        fb_ids, sql_ids = [], []
+        for rid, source in items:
+            if not rid:
+                raise ValueError("ID mancante")
+            if source == "firebase":
+                fb_ids.append(rid)
+            elif source == "sqlite":
+                sql_ids.append(rid)
+            else:
+                raise ValueError(f"Sorgente sconosciuta: {source}")
+        return fb_ids, sql_ids
+
+    @METRICS.timed("repo.update_pagamento")
+    def update_pagamento_many(self, items: Sequence[Tuple[str, str]], pagamento: str):
+        """Stesso pagamento su più record [(id, sorgente)]: una transazione SQLite
+        e, per i record su Firebase, un solo PATCH multi-path al prossimo flush."""
+        fb_ids, sql_ids = self._split_sources(items)
+        # i record Firebase già in archivio si allineano subito (il sync incrementale
+        # non rilegge i record più vecchi del margine)
+        self.sql.update_pagamento_many(fb_ids + sql_ids, pagamento)
+        self.outbox.add_many([(rid, PAGAMENTO, pagamento) for rid in fb_ids])
+        self.cache.invalidate("sqlite")
+
+    def season_summary(self, season: int) -> Dict[str, Any]:
+        """Totali della stagione dalle tabelle aggregate dell'archivio.
+
+        I giorni ancora solo su Firebase entrano nei totali al sync successivo
+        (mirror_and_cleanup li copia in archivio)."""
+        kg, n = self.sql.season_totals(season)
+        first, last = season_bounds(season)
+        return {
+            "season": season, "kg": kg, "n": n,
+            "by_name": self.sql.totals_by_name(season),
+            "by_pagamento": self.sql.totals_by_pagamento(season),
+            "by_day": self.sql.totals_by_day(first, last),
+        }
+
+    def seasons(self) -> List[int]:
+        return self.sql.seasons()
+
+    @METRICS.timed("repo.flush_outbox")
+    def flush_outbox(self) -> Dict[str, Any]:
+        """Invia a Firebase le modifiche in coda (un solo PATCH multi-path)."""
+        res = self.outbox.flush()
+        if res["rejected"] or res["gone"]:
+            # le modifiche scartate erano già nell'archivio e nelle letture: si rilegge tutto
+            self.cache.invalidate()
+        return res
+
+    def maintenance_due(self, now: Optional[datetime] = None) -> bool:
+        """True se è ora della manutenzione dell'archivio: fuori orario di lavoro e
+        almeno 20 ore dopo l'ultima, oppure comunque dopo 7 giorni (PC sempre spento
+        di notte)."""
+        now = now or datetime.now(TZ)
+        last = float(self.sql.get_state("maintenance_at") or 0)
+        elapsed_h = (now.timestamp() - last) / 3600
+        start, end = self.work_hours
+        off_hours = not (start <= now.hour < end)
+        return (off_hours and elapsed_h >= 20) or elapsed_h >= 7 * 24
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        """Rollover delle stagioni chiuse nei loro file e compattazione dell'archivio."""
+        limit = datetime.now(TZ).date() - timedelta(days=self.rollover_days)
+        res = self.sql.maintenance(rollover_before=season_of(limit))
+        self.sql.set_state("maintenance_at", int(datetime.now(TZ).timestamp()))
+        if res["rolled"]:
+            self.cache.invalidate("sqlite")
+        return res
+
+    @METRICS.timed("repo.mirror")
+    def mirror_and_cleanup(self, progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """Copia su SQLite i record nuovi/modificati e cancella da Firebase quelli più vecchi di retention_days.
+
+        La copia completa legge la collection a pagine (memoria limitata a una pagina)
+        e riprende dall'ultima pagina salvata se era stata interrotta; la pulizia è in
+        cleanup(). progress(n) riceve i record cancellati finora.
+
+        Con una lease (attach_lease) la pulizia la fa solo il PC che la tiene. Ogni PC
+        ha il proprio archivio, quindi tutti continuano la copia (anche quella completa
+        ogni full_mirror_hours, che porta i pagamenti cambiati sui record più vecchi
+        del margine); tra una copia completa e l'altra la lettura incrementale è
+        condizionale e non scarica nulla se Firebase non è cambiato. Nel risultato
+        "leader" dice se questo PC teneva la lease."""
+        try:
+            self.flush_outbox()
+        except Exception:
+            pass  # restano in coda: l'overlay sotto evita che l'archivio torni indietro
+        now_ms = int(datetime.now(TZ).timestamp() * 1000)
+        watermark = self.sql.get_state("mirror_watermark")
+        last_full = int(self.sql.get_state("mirror_full_at") or 0)
+        resume_key = self.sql.get_state("mirror_full_key")
+        leader = self._try_lease()
+        full = watermark is None or resume_key is not None or now_ms - last_full >= self.full_mirror_ms
+
+        high = int(watermark) if watermark is not None else 0
+        written = fetched = 0
+        if full:
+            for page in self.fb.iter_pages(self.page_size, after_key=resume_key):
+                if self.lease is not None and leader:
+                    self.lease.ensure()  # la copia completa può superare metà della lease
+                written += self.sql.upsert_many(self.outbox.overlay(page))
+                fetched += len(page)
+                high = max(high, max(r.dataOra for r in page))
+                self.sql.set_state("mirror_full_key", page[-1].id)
+            self.sql.delete_state("mirror_full_key")
+            self.sql.set_state("mirror_full_at", now_ms)
         else:
-            raise ValueError("Sorgente sconosciuta per update")
+            start_ms = int(watermark) - self.mirror_lookback_ms
+            # ETag dell'ultima lettura con lo stesso inizio: se nulla è cambiato, 304
+            prev = (self.sql.get_state("mirror_etag") or "").split(":", 1)
+            etag = prev[1] if len(prev) == 2 and prev[0] == str(start_ms) else None
+            fb_rows, new_etag = self.fb.fetch_range_conditional(start_ms, None, etag)
+            if fb_rows is not None:
+                written += self.sql.upsert_many(self.outbox.overlay(fb_rows))
+                fetched += len(fb_rows)
+                high = max(high, max((r.dataOra for r in fb_rows), default=0))
+                if new_etag and high == int(watermark):
+                    self.sql.set_state("mirror_etag", f"{start_ms}:{new_etag}")
+        self.sql.set_state("mirror_watermark", high)
+        if written:
+            self.cache.invalidate("sqlite")
 
-    def mirror_and_cleanup(self) -> Dict[str, int]:
-        """Duplica TUTTI i record da Firebase a SQLite e cancella quelli più vecchi di retention_days su Firebase."""
-        fb_rows = self.fb.fetch()
-        self.sql.upsert_many(fb_rows)
+        res = self.cleanup(progress) if leader else {"archived": 0, "deleted": 0, "fetched": 0}
+        return {"mirrored": written + res["archived"], "deleted": res["deleted"],
+                "fetched": fetched + res["fetched"], "leader": leader}
 
-        cutoff_date = datetime.now(TZ).date() - timedelta(days=self.retention_days)
-        cutoff_ms = int(datetime(cutoff_date.year, cutoff_date.month, cutoff_date.day, 23, 59, 59, 999000, tzinfo=TZ).timestamp() * 1000)
+    def _try_lease(self) -> bool:
+        """True se questo PC può fare la pulizia. Un errore nel leggere o scrivere il
+        nodo della lease (rete, 5xx, regole che rispondono 400) non ferma la copia:
+        il PC lavora come gli altri senza lease e l'errore resta in lease.last_error."""
+        if self.lease is None:
+            return True
+        try:
+            return self.lease.acquire()
+        except Exception:
+            return False
 
-        to_delete = []
-        for r in fb_rows:
-            try:
-                ts = int(float(r.get("dataOra") or 0))
-            except Exception:
-                ts = 0
-            if ts and ts <= cutoff_ms:
-                rid = r.get("id")
-                if rid:
-                    to_delete.append(rid)
+    def cleanup(self, progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+        """Cancella da Firebase i record più vecchi di retention_days, a blocchi di
+        cleanup_batch con una pausa di cleanup_pause_s tra un blocco e l'altro.
 
-        if to_delete:
-            self.fb.delete_many(to_delete)
+        Ogni blocco viene prima scritto in archivio e poi cancellato, quindi
+        un'interruzione non perde nulla e la volta successiva si riparte dai
+        record rimasti. Con l'indice su dataOra si leggono solo i record oltre
+        la soglia; senza, si scorre la collection per chiave salvando il punto
+        raggiunto (cleanup_key)."""
+        cutoff_date = datetime.now(TZ).date() - timedelta(days=self.retention_days)
+        cutoff_ms = day_bounds_ts_ms(cutoff_date)[1]
+        done = {"deleted": 0, "archived": 0, "fetched": 0}
+        with METRICS.timer("repo.cleanup") as m:
+            for batch in self._old_batches(cutoff_ms):
+                if done["deleted"]:
+                    time.sleep(self.cleanup_pause_s)
+                if self.lease is not None:
+                    self.lease.ensure()  # un altro PC ha preso la lease: ci si ferma
+                done["fetched"] += len(batch)
+                # i record con cancellazione in coda non si archiviano ma si cancellano comunque
+                done["archived"] += self.sql.upsert_many(self.outbox.overlay(batch))
+                self._delete_archived([r.id for r in batch])
+                done["deleted"] += len(batch)
+                if progress is not None:
+                    progress(done["deleted"])
+            m.rows = done["deleted"]
+        if done["deleted"]:
+            self.cache.invalidate("firebase")
+        if done["archived"]:
+            self.cache.invalidate("sqlite")
+        return done
+
+    def _delete_archived(self, rids: List[str]):
+        """Cancella da Firebase record già copiati in archivio (con l'overlay) e toglie
+        dalla coda le loro operazioni: sono già nell'archivio e, inviate dopo la
+        cancellazione, un pagamento ricreerebbe su Firebase un nodo con il solo campo
+        pagamento. Con il flush fermo nessun invio passa tra le due cose."""
+        with self.outbox.paused():
+            self.fb.delete_many(rids)
+            self.outbox.drop(rids)
 
-        return {"mirrored": len(fb_rows), "deleted": len(to_delete)}
+    def _old_batches(self, cutoff_ms: int) -> Iterator[List[Molitura]]:
+        """Blocchi di record con 0 < dataOra <= cutoff_ms; il chiamante cancella
+        ogni blocco prima di chiedere il successivo."""
+        prev_ids: set = set()
+        while True:
+            batch = self.fb.fetch_oldest(cutoff_ms, self.cleanup_batch)
+            if batch is None:
+                break  # niente indice su dataOra: si scorre per chiave
+            if not batch:
+                return
+            if batch[0].id in prev_ids:
+                # le regole di Firebase hanno ignorato la cancellazione: non si insiste
+                raise RuntimeError("Pulizia di Firebase interrotta: i record non risultano cancellati")
+            yield batch
+            if len(batch) < self.cleanup_batch:
+                return
+            prev_ids = {r.id for r in batch}
+        after = self.sql.get_state("cleanup_key")
+        pending: List[Molitura] = []
+        for page in self.fb.iter_pages(self.page_size, after_key=after):
+            pending += [r for r in page if 0 < r.dataOra <= cutoff_ms]
+            while len(pending) >= self.cleanup_batch:
+                batch, pending = pending[:self.cleanup_batch], pending[self.cleanup_batch:]
+                yield batch
+            if not pending:
+                self.sql.set_state("cleanup_key", page[-1].id)
+        if pending:
+            yield pending
+        self.sql.delete_state("cleanup_key")
 
     def delete_record(self, rid: str, source: str):
         """Cancella un record dalla sua sorgente."""
-        if not rid:
-            raise ValueError("ID mancante")
-        if source == "firebase":
-            return self.fb.delete_one(rid)
-        elif source == "sqlite":
-            return self.sql.delete_one(rid)
-        else:
-            raise ValueError(f"Sorgente sconosciuta: {source}")
+        return self.delete_many([(rid, source)])
+
+    @METRICS.timed("repo.delete")
+    def delete_many(self, items: Sequence[Tuple[str, str]]):
+        """Cancella più record [(id, sorgente)] come update_pagamento_many. I record
+        Firebase spariscono anche dall'archivio, altrimenti vi ricomparirebbero."""
+        fb_ids, sql_ids = self._split_sources(items)
+        self.sql.delete_many(fb_ids + sql_ids)
+        self.outbox.add_many([(rid, DELETE, None) for rid in fb_ids])
+        self.cache.invalidate("sqlite")
@@ -1,12 +1,102 @@
+import re
 import sqlite3
-from datetime import date
-from typing import Any, Dict, List
-from app_frantoio.util.time_utils import day_bounds_ts_ms
-
-def _ensure_archive_db(path: str):
-    con = sqlite3.connect(path)
-    cur = con.cursor()
-    cur.execute("""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from app_frantoio.core.record import Molitura
+from app_frantoio.util.metrics import METRICS
+from app_frantoio.util.time_utils import (
+    SEASON_START_MONTH, TZ, day_bounds_ts_ms, season_bounds, season_of,
+)
+
+# Chiavi degli aggregati (giorno 'YYYY-MM-DD' e stagione) calcolate in SQL puro, così
+# i trigger funzionano con qualunque connessione, anche sqlite3 da riga di comando.
+# Il giorno è quello di Europe/Rome qualunque sia il fuso del PC ('localtime' dipende
+# dalla macchina): ora legale UE dall'ultima domenica di marzo all'ultima di ottobre,
+# con il cambio alle 01:00 UTC.
+def _sql_giorno(ts: str) -> str:
+    s = f"(COALESCE({ts}, 0) / 1000)"
+    y = f"strftime('%Y', {s}, 'unixepoch')"
+    dst = (f"{s} >= CAST(strftime('%s', {y} || '-03-31', '-6 days', 'weekday 0', '+1 hours') AS INTEGER)"
+           f" AND {s} < CAST(strftime('%s', {y} || '-10-31', '-6 days', 'weekday 0', '+1 hours') AS INTEGER)")
+    return f"date({s} + CASE WHEN {dst} THEN 7200 ELSE 3600 END, 'unixepoch')"
+
+def _sql_stagione(ts: str) -> str:
+    g = _sql_giorno(ts)
+    return (f"(CAST(substr({g}, 1, 4) AS INTEGER)"
+            f" - (CAST(substr({g}, 6, 2) AS INTEGER) < {SEASON_START_MONTH}))")
+
+# Trigger che tengono aggiornati agg_giorno/agg_cliente/agg_pagamento
+_AGG_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_moliture_agg_ins AFTER INSERT ON moliture BEGIN
+        INSERT INTO agg_giorno(giorno, kg, n)
+            VALUES ({g_new}, COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(giorno) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+        INSERT INTO agg_cliente(stagione, name, kg, n)
+            VALUES ({s_new}, COALESCE(NEW.name, ''), COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(stagione, name) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+        INSERT INTO agg_pagamento(stagione, pagamento, kg, n)
+            VALUES ({s_new}, COALESCE(NEW.pagamento, ''), COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(stagione, pagamento) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_moliture_agg_del AFTER DELETE ON moliture BEGIN
+        UPDATE agg_giorno SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE giorno = {g_old};
+        UPDATE agg_cliente SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE stagione = {s_old} AND name = COALESCE(OLD.name, '');
+        UPDATE agg_pagamento SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE stagione = {s_old} AND pagamento = COALESCE(OLD.pagamento, '');
+        DELETE FROM agg_giorno WHERE giorno = {g_old} AND n <= 0;
+        DELETE FROM agg_cliente WHERE stagione = {s_old}
+            AND name = COALESCE(OLD.name, '') AND n <= 0;
+        DELETE FROM agg_pagamento WHERE stagione = {s_old}
+            AND pagamento = COALESCE(OLD.pagamento, '') AND n <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_moliture_agg_upd
+    AFTER UPDATE OF name, weight, pagamento, dataOra ON moliture BEGIN
+        UPDATE agg_giorno SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE giorno = {g_old};
+        UPDATE agg_cliente SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE stagione = {s_old} AND name = COALESCE(OLD.name, '');
+        UPDATE agg_pagamento SET kg = kg - COALESCE(OLD.weight, 0), n = n - 1
+            WHERE stagione = {s_old} AND pagamento = COALESCE(OLD.pagamento, '');
+        INSERT INTO agg_giorno(giorno, kg, n)
+            VALUES ({g_new}, COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(giorno) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+        INSERT INTO agg_cliente(stagione, name, kg, n)
+            VALUES ({s_new}, COALESCE(NEW.name, ''), COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(stagione, name) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+        INSERT INTO agg_pagamento(stagione, pagamento, kg, n)
+            VALUES ({s_new}, COALESCE(NEW.pagamento, ''), COALESCE(NEW.weight, 0), 1)
+            ON CONFLICT(stagione, pagamento) DO UPDATE SET kg = kg + excluded.kg, n = n + 1;
+        DELETE FROM agg_giorno WHERE n <= 0 AND giorno = {g_old};
+        DELETE FROM agg_cliente WHERE n <= 0 AND stagione = {s_old}
+            AND name = COALESCE(OLD.name, '');
+        DELETE FROM agg_pagamento WHERE n <= 0 AND stagione = {s_old}
+            AND pagamento = COALESCE(OLD.pagamento, '');
+    END
+    """,
+]
+
+def _agg_triggers() -> List[str]:
+    keys = {"g_new": _sql_giorno("NEW.dataOra"), "g_old": _sql_giorno("OLD.dataOra"),
+            "s_new": _sql_stagione("NEW.dataOra"), "s_old": _sql_stagione("OLD.dataOra")}
+    return [t.format(**keys) for t in _AGG_TRIGGERS]
+
+# Migrazioni dello schema: (versione, statement). PRAGMA user_version registra
+# l'ultima applicata; gli archivi esistenti (versione 0) hanno già la tabella
+# moliture, per questo la v1 usa IF NOT EXISTS.
+_MIGRATIONS = [
+    (1, [
+        """
         CREATE TABLE IF NOT EXISTS moliture (
             id TEXT PRIMARY KEY,
             name TEXT,
@@ -14,81 +104,723 @@ def _ensure_archive_db(path: str):
             pagamento TEXT,
             dataOra INTEGER
         )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+    ]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_moliture_dataOra ON moliture(dataOra)",
+    ]),
+    # Totali materializzati (kg e numero conferimenti) per giorno, per cliente e per
+    # metodo di pagamento nella stagione. Li tengono aggiornati i trigger su moliture.
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS agg_giorno (
+            giorno TEXT PRIMARY KEY,
+            kg REAL NOT NULL DEFAULT 0,
+            n INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS agg_cliente (
+            stagione INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            kg REAL NOT NULL DEFAULT 0,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stagione, name)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS agg_pagamento (
+            stagione INTEGER NOT NULL,
+            pagamento TEXT NOT NULL,
+            kg REAL NOT NULL DEFAULT 0,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stagione, pagamento)
+        )
+        """,
+        *_agg_triggers(),
+        # archivi esistenti: si parte dai totali attuali
+        f"""
+        INSERT OR REPLACE INTO agg_giorno(giorno, kg, n)
+            SELECT {_sql_giorno("dataOra")}, SUM(COALESCE(weight, 0)), COUNT(*) FROM moliture GROUP BY 1
+        """,
+        f"""
+        INSERT OR REPLACE INTO agg_cliente(stagione, name, kg, n)
+            SELECT {_sql_stagione("dataOra")}, COALESCE(name, ''), SUM(COALESCE(weight, 0)), COUNT(*)
+            FROM moliture GROUP BY 1, 2
+        """,
+        f"""
+        INSERT OR REPLACE INTO agg_pagamento(stagione, pagamento, kg, n)
+            SELECT {_sql_stagione("dataOra")}, COALESCE(pagamento, ''), SUM(COALESCE(weight, 0)), COUNT(*)
+            FROM moliture GROUP BY 1, 2
+        """,
+    ]),
+    # Modifiche a Firebase in attesa di invio (pagamenti e cancellazioni), in ordine
+    # di inserimento: sopravvivono a cadute di rete e riavvii
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            rid TEXT NOT NULL,
+            op TEXT NOT NULL,
+            value TEXT,
+            created_at INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+        """,
+    ]),
+    # Indice full-text sui nomi dei clienti (vedi _create_name_index)
+    (5, [
+        lambda con: _create_name_index(con),
+    ]),
+    # Paginazione keyset su (dataOra, id): l'indice copre anche lo spareggio per id,
+    # così ogni pagina è una ricerca sull'indice senza ordinamento temporaneo
+    (6, [
+        "CREATE INDEX IF NOT EXISTS idx_moliture_dataOra_id ON moliture(dataOra, id)",
+        "DROP INDEX IF EXISTS idx_moliture_dataOra",
+    ]),
+    # Trigger degli aggregati senza le funzioni Python giorno_di/stagione_di: chi
+    # scriveva su moliture senza registrarle riceveva "no such function"
+    (7, [
+        "DROP TRIGGER IF EXISTS trg_moliture_agg_ins",
+        "DROP TRIGGER IF EXISTS trg_moliture_agg_del",
+        "DROP TRIGGER IF EXISTS trg_moliture_agg_upd",
+        *_agg_triggers(),
+    ]),
+]
+
+# Tokenizer in ordine di preferenza: trigram (SQLite >= 3.34) trova qualunque
+# sottostringa di almeno 3 caratteri; unicode61 solo prefissi di parola.
+_FTS_TOKENIZERS = ("trigram", "unicode61 remove_diacritics 2")
+
+def _create_name_index(con: sqlite3.Connection):
+    """Tabella FTS5 a contenuto esterno su moliture.name, tenuta allineata dai trigger.
+    Se FTS5 non è disponibile non si crea nulla e la ricerca usa LIKE."""
+    for tokenizer in _FTS_TOKENIZERS:
+        try:
+            con.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS moliture_fts
+                USING fts5(name, content='moliture', content_rowid='rowid', tokenize='{tokenizer}')
+            """)
+            break
+        except sqlite3.OperationalError:
+            continue
+    else:
+        return
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_moliture_fts_ins AFTER INSERT ON moliture BEGIN
+            INSERT INTO moliture_fts(rowid, name) VALUES (NEW.rowid, NEW.name);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_moliture_fts_del AFTER DELETE ON moliture BEGIN
+            INSERT INTO moliture_fts(moliture_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+        END
     """)
-    con.commit()
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_moliture_fts_upd AFTER UPDATE OF name ON moliture BEGIN
+            INSERT INTO moliture_fts(moliture_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+            INSERT INTO moliture_fts(rowid, name) VALUES (NEW.rowid, NEW.name);
+        END
+    """)
+    con.execute("INSERT INTO moliture_fts(moliture_fts) VALUES ('rebuild')")
+
+_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",   # sicuro con WAL, molto meno fsync
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",    # ~16 MB di page cache
+    "PRAGMA mmap_size=134217728",
+]
+
+def _stagione_di(ts_ms) -> int:
+    return season_of(datetime.fromtimestamp(int(ts_ms or 0) / 1000, TZ).date())
+
+def _migrate(con: sqlite3.Connection):
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in _MIGRATIONS:
+        if target <= version:
+            continue
+        with con:
+            for stmt in statements:
+                if callable(stmt):
+                    stmt(con)  # passo che dipende dalla build di SQLite
+                else:
+                    con.execute(stmt)
+            con.execute(f"PRAGMA user_version={target}")
+
+def _ensure_archive_db(path: str, wal: bool = True):
+    # una sola connessione per client, condivisa tra i thread (protetta da un lock);
+    # sqlite3 tiene in cache gli statement già compilati per questa connessione.
+    # uri=True serve ad ATTACH delle stagioni passate in sola lettura (?mode=ro)
+    con = sqlite3.connect(path, check_same_thread=False, cached_statements=256, uri=True)
+    for pragma in _PRAGMAS:
+        if not wal and "journal_mode" in pragma:
+            pragma = "PRAGMA journal_mode=DELETE"  # file in sola lettura: niente -wal/-shm
+        con.execute(pragma)
+    _migrate(con)
     return con
 
+def _season_ms(season: int) -> Tuple[int, int]:
+    first, last = season_bounds(season)
+    return day_bounds_ts_ms(first)[0], day_bounds_ts_ms(last)[1]
+
+def _season_at(ts_ms: Optional[int]) -> Optional[int]:
+    """Stagione di un istante; None se manca o è fuori dal calendario (nessun limite)."""
+    if ts_ms is None:
+        return None
+    try:
+        return season_of(datetime.fromtimestamp(ts_ms / 1000, TZ).date())
+    except (ValueError, OverflowError, OSError):
+        return None
+
+def _uri(path: Path, mode: str) -> str:
+    return path.resolve().as_uri() + f"?mode={mode}"
+
+_COLS = "id, name, weight, pagamento, dataOra"
+
+_UPSERT = """
+    INSERT INTO {schema}.moliture(id,name,weight,pagamento,dataOra)
+    {source}
+    ON CONFLICT(id) DO UPDATE SET
+        name=excluded.name,
+        weight=excluded.weight,
+        pagamento=excluded.pagamento,
+        dataOra=excluded.dataOra
+    WHERE name IS NOT excluded.name
+       OR weight IS NOT excluded.weight
+       OR pagamento IS NOT excluded.pagamento
+       OR dataOra IS NOT excluded.dataOra
+"""
+
+def _to_records(fetched) -> List[Molitura]:
+    return [Molitura(rid, name or "", weight or 0.0, pagamento or "", dataOra or 0, "sqlite")
+            for rid, name, weight, pagamento, dataOra in fetched]
+
+def _chunks(items: List[str], size: int = 500) -> Iterator[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 class SQLiteClient:
+    """Archivio partizionato per stagione.
+
+    Il file principale (db_path) contiene la stagione in corso, la coda outbox e lo
+    stato del sync; ogni stagione chiusa viene spostata da rollover() in un file a
+    sé ("<nome>_<stagione>.db" accanto al principale), compattato e poi aperto in
+    sola lettura. Le letture agganciano con ATTACH solo i file delle stagioni che
+    toccano (al massimo MAX_ATTACHED alla volta, i meno usati vengono staccati):
+    un giorno costa una ricerca sull'indice di un file di una stagione, qualunque
+    sia il numero di anni in archivio. Ogni file ha i suoi aggregati e il suo indice
+    FTS, tenuti dai trigger come prima."""
+
+    MAX_ATTACHED = 6
+
     def __init__(self, db_path: str):
         self.db_path = db_path
-        _ensure_archive_db(self.db_path)
+        self._lock = threading.RLock()
+        self._con = _ensure_archive_db(self.db_path)
+        self._parts: Dict[int, Path] = self._find_partitions()
+        self._checked: Set[int] = set()  # stagioni già portate all'ultima migrazione
+        self._attached: "OrderedDict[int, str]" = OrderedDict()  # stagione -> schema, LRU
+        self._fts: Dict[str, Optional[str]] = {"main": self._detect_fts("main")}
+        # scritture su moliture da questo client: PRAGMA data_version vede solo quelle
+        # delle altre connessioni (es. sync_daemon sullo stesso file)
+        self.writes = 0
+
+    def _detect_fts(self, schema: str) -> Optional[str]:
+        """"trigram", "unicode61" o None (niente FTS5: ricerca con LIKE)."""
+        row = self._con.execute(
+            f"SELECT sql FROM {schema}.sqlite_master WHERE name='moliture_fts'").fetchone()
+        if not row:
+            return None
+        return "trigram" if "trigram" in row[0] else "unicode61"
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    # ---- partizioni per stagione ----
+    def partition_path(self, season: int) -> Path:
+        base = Path(self.db_path)
+        return base.with_name(f"{base.stem}_{int(season)}{base.suffix}")
+
+    def _find_partitions(self) -> Dict[int, Path]:
+        base = Path(self.db_path)
+        pattern = re.compile(re.escape(base.stem) + r"_(\d{4})" + re.escape(base.suffix) + "$")
+        parts = {}
+        for p in base.parent.glob(f"{base.stem}_*{base.suffix}"):
+            m = pattern.match(p.name)
+            if m:
+                parts[int(m.group(1))] = p
+        return dict(sorted(parts.items()))
+
+    def _check_partition(self, season: int):
+        """Al primo uso della stagione (non all'avvio: con molti anni in archivio
+        aprirli tutti rallenterebbe la partenza) applica le migrazioni arrivate dopo
+        la sua chiusura. Lock tenuto, stagione non agganciata."""
+        if season not in self._checked:
+            self._upgrade_partition(self._parts[season])
+            self._checked.add(season)
+
+    @staticmethod
+    def _upgrade_partition(path: Path):
+        con = sqlite3.connect(str(path))
+        try:
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            con.close()
+        if version < _MIGRATIONS[-1][0]:
+            _ensure_archive_db(str(path), wal=False).close()
+
+    def partitions(self) -> Dict[int, str]:
+        """{stagione: file} delle stagioni già spostate fuori dal file principale."""
+        return {s: str(p) for s, p in self._parts.items()}
+
+    def _attach(self, season: int) -> str:
+        """Schema della stagione archiviata, agganciato in sola lettura (lock tenuto)."""
+        schema = self._attached.get(season)
+        if schema is not None:
+            self._attached.move_to_end(season)
+            return schema
+        while len(self._attached) >= self.MAX_ATTACHED:
+            old, old_schema = self._attached.popitem(last=False)
+            self._con.execute(f"DETACH DATABASE {old_schema}")
+        self._check_partition(season)
+        schema = f"s{int(season)}"
+        self._con.execute(f"ATTACH DATABASE ? AS {schema}", (_uri(self._parts[season], "ro"),))
+        self._attached[season] = schema
+        if schema not in self._fts:
+            self._fts[schema] = self._detect_fts(schema)
+        return schema
+
+    def _detach(self, season: int):
+        schema = self._attached.pop(season, None)
+        if schema is not None:
+            self._con.execute(f"DETACH DATABASE {schema}")
 
-    def fetch_day(self, d: date):
+    @contextmanager
+    def _writable(self, season: int) -> Iterator[str]:
+        """Schema della stagione archiviata agganciato in scrittura, per le rare
+        modifiche ai record delle stagioni chiuse (pagamenti arrivati dopo)."""
+        with self._lock:
+            self._detach(season)
+            if season in self._parts:
+                self._check_partition(season)
+            schema = f"w{int(season)}"
+            self._con.execute(f"ATTACH DATABASE ? AS {schema}", (_uri(self.partition_path(season), "rwc"),))
+            try:
+                yield schema
+            finally:
+                self._con.execute(f"DETACH DATABASE {schema}")
+
+    def _archived_seasons(self, start_ms: Optional[int], end_ms: Optional[int]) -> List[int]:
+        """Stagioni archiviate che intersecano [start_ms, end_ms], in ordine."""
+        if not self._parts:
+            return []
+        lo, hi = _season_at(start_ms), _season_at(end_ms)
+        return [s for s in self._parts if (lo is None or s >= lo) and (hi is None or s <= hi)]
+
+    def _owners(self, rids: List[str]) -> Dict[int, List[str]]:
+        """{stagione archiviata: id} per gli id che non sono nel file principale."""
+        rest = set(rids)
+        for chunk in _chunks(list(rest)):
+            marks = ",".join("?" * len(chunk))
+            rest -= {r[0] for r in self._con.execute(
+                f"SELECT id FROM main.moliture WHERE id IN ({marks})", chunk)}
+        owners: Dict[int, List[str]] = {}
+        for season in sorted(self._parts, reverse=True):
+            if not rest:
+                break
+            schema = self._attach(season)
+            found = []
+            for chunk in _chunks(list(rest)):
+                marks = ",".join("?" * len(chunk))
+                found += [r[0] for r in self._con.execute(
+                    f"SELECT id FROM {schema}.moliture WHERE id IN ({marks})", chunk)]
+            if found:
+                owners[season] = found
+                rest -= set(found)
+        return owners
+
+    def _main_seasons(self) -> List[int]:
+        return [r[0] for r in self._con.execute(
+            "SELECT DISTINCT stagione FROM main.agg_pagamento ORDER BY stagione")]
+
+    def rollover(self, season: int) -> int:
+        """Sposta i record della stagione dal file principale al suo file (creato se
+        manca), poi lo compatta e lo rende in sola lettura. Idempotente: se viene
+        interrotto, rieseguirlo completa lo spostamento. Ritorna i record spostati."""
+        path = self.partition_path(season)
+        _ensure_archive_db(str(path)).close()  # schema, trigger e indici come il principale
+        a_ms, b_ms = _season_ms(season)
+        with self._lock:
+            with self._writable(season) as schema:
+                with self._con:
+                    self._con.execute(_UPSERT.format(schema=schema, source=f"""
+                        SELECT {_COLS} FROM main.moliture WHERE dataOra BETWEEN ? AND ?"""),
+                        (a_ms, b_ms))
+                    moved = self._con.execute("DELETE FROM main.moliture WHERE dataOra BETWEEN ? AND ?",
+                                              (a_ms, b_ms)).rowcount
+            self._parts[season] = path
+            self._parts = dict(sorted(self._parts.items()))
+            self._checked.add(season)
+            self.writes += 1
+        self._compact_partition(path)
+        return moved
+
+    @staticmethod
+    def _compact_partition(path: Path):
+        con = _ensure_archive_db(str(path))
+        try:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE name='moliture_fts'").fetchone():
+                con.execute("INSERT INTO moliture_fts(moliture_fts) VALUES ('optimize')")
+                con.commit()
+            con.execute("ANALYZE")
+            con.commit()
+            con.execute("PRAGMA journal_mode=DELETE")
+            con.execute("VACUUM")
+        finally:
+            con.close()
+
+    @METRICS.timed("sql.maintenance", kind="sql")
+    def maintenance(self, rollover_before: Optional[int] = None,
+                    vacuum_ratio: float = 0.2) -> Dict[str, Any]:
+        """Manutenzione del file principale, da eseguire fuori orario:
+        rollover delle stagioni < rollover_before, PRAGMA optimize/ANALYZE,
+        optimize dell'indice FTS, VACUUM se le pagine libere superano vacuum_ratio
+        (o dopo un rollover) e checkpoint del WAL."""
+        with self._lock:
+            seasons = self._main_seasons()
+        rolled = {}
+        if rollover_before is not None:
+            for season in seasons:
+                if season < rollover_before:
+                    rolled[season] = self.rollover(season)
+        with self._lock:
+            con = self._con
+            con.execute("PRAGMA main.optimize")
+            con.execute("ANALYZE main")
+            if self._fts["main"]:
+                con.execute("INSERT INTO main.moliture_fts(moliture_fts) VALUES ('optimize')")
+            con.commit()
+            free = con.execute("PRAGMA main.freelist_count").fetchone()[0]
+            pages = con.execute("PRAGMA main.page_count").fetchone()[0] or 1
+            vacuum = bool(rolled) or free / pages > vacuum_ratio
+            if vacuum:
+                con.execute("VACUUM main")
+            con.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+            size = Path(self.db_path).stat().st_size
+        return {"rolled": rolled, "vacuum": vacuum, "size_kb": size // 1024}
+
+    def fetch_day(self, d: date) -> List[Molitura]:
         a_ms, b_ms = day_bounds_ts_ms(d)
-        con = sqlite3.connect(self.db_path)
-        cur = con.cursor()
-        cur.execute("""
-            SELECT id, name, weight, pagamento, dataOra
-            FROM moliture
-            WHERE dataOra BETWEEN ? AND ?
-            ORDER BY dataOra ASC
-        """, (a_ms, b_ms))
-        rows = []
-        for rid, name, weight, pagamento, dataOra in cur.fetchall():
-            rows.append({
-                "id": rid, "name": name, "weight": weight,
-                "pagamento": pagamento, "dataOra": dataOra,
-                "_source": "sqlite"
-            })
-        con.close()
+        return self.fetch_range(a_ms, b_ms)
+
+    @METRICS.timed("sql.fetch_range", kind="sql")
+    def fetch_range(self, start_ms: int, end_ms: int) -> List[Molitura]:
+        """Record con start_ms <= dataOra <= end_ms, ordinati per dataOra
+        (file principale più le stagioni archiviate che l'intervallo tocca)."""
+        query = f"SELECT {_COLS} FROM {{schema}}.moliture WHERE dataOra BETWEEN ? AND ? ORDER BY dataOra ASC"
+        with self._lock:
+            fetched = []
+            archived = self._archived_seasons(start_ms, end_ms)
+            for season in archived:
+                schema = self._attach(season)
+                fetched += self._con.execute(query.format(schema=schema), (start_ms, end_ms)).fetchall()
+            fetched += self._con.execute(query.format(schema="main"), (start_ms, end_ms)).fetchall()
+        rows = _to_records(fetched)
+        if archived:
+            # un rollover interrotto può lasciare un record in due file: vince il principale
+            rows = sorted({r.id: r for r in rows}.values(), key=lambda r: r.dataOra)
         return rows
 
+    @METRICS.timed("sql.fetch_page", kind="sql")
+    def fetch_page(self, start_ms: int, end_ms: int, after: Optional[Tuple[int, str]] = None,
+                   limit: int = 500, blocking: bool = True) -> Optional[List[Molitura]]:
+        """Al massimo limit record di [start_ms, end_ms] ordinati per (dataOra, id)
+        e successivi alla chiave after (l'ultima della pagina precedente).
+
+        Paginazione keyset: il costo di una pagina non dipende da quante ne sono
+        state lette prima. Le stagioni archiviate prima di after non si toccano.
+        Con blocking=False ritorna None se il client è occupato, come change_token()."""
+        query = f"""SELECT {_COLS} FROM {{schema}}.moliture
+                    WHERE dataOra BETWEEN ? AND ? AND (dataOra, id) > (?, ?)
+                    ORDER BY dataOra, id LIMIT ?"""
+        key = after if after is not None else (start_ms - 1, "")
+        fetched: List[Tuple] = []
+        if not self._lock.acquire(blocking=blocking):
+            return None
+        try:
+            for season in self._archived_seasons(max(start_ms, key[0]), end_ms) + [None]:
+                schema = "main" if season is None else self._attach(season)
+                fetched += self._con.execute(query.format(schema=schema),
+                                             (start_ms, end_ms, key[0], key[1], limit - len(fetched))).fetchall()
+                if len(fetched) >= limit:
+                    break
+        finally:
+            self._lock.release()
+        return _to_records(fetched)
+
+    def iter_chunks(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                    chunk_size: int = 5000) -> Iterator[List[Tuple]]:
+        """Righe grezze (id, name, weight, pagamento, dataOra) ordinate per dataOra,
+        a blocchi di chunk_size: la memoria resta limitata qualunque sia l'archivio.
+
+        Usa una connessione in sola lettura dedicata: con WAL legge una fotografia
+        coerente senza tenere il lock del client per tutta l'estrazione. Le stagioni
+        archiviate vengono lette una alla volta, prima del file principale (che
+        contiene solo stagioni più recenti)."""
+        params = (start_ms if start_ms is not None else -2 ** 63,
+                  end_ms if end_ms is not None else 2 ** 63 - 1)
+        query = f"SELECT {_COLS} FROM {{schema}}.moliture WHERE dataOra BETWEEN ? AND ? ORDER BY dataOra ASC"
+        con = sqlite3.connect(_uri(Path(self.db_path), "ro"), uri=True)
+        try:
+            for season in self._archived_seasons(start_ms, end_ms):
+                with self._lock:
+                    self._check_partition(season)
+                con.execute("ATTACH DATABASE ? AS part", (_uri(self._parts[season], "ro"),))
+                try:
+                    yield from self._fetch_chunks(con.execute(query.format(schema="part"), params),
+                                                  chunk_size)
+                finally:
+                    con.execute("DETACH DATABASE part")
+            yield from self._fetch_chunks(con.execute(query.format(schema="main"), params), chunk_size)
+        finally:
+            con.close()
+
+    @staticmethod
+    def _fetch_chunks(cur: sqlite3.Cursor, chunk_size: int) -> Iterator[List[Tuple]]:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                cur.close()
+                return
+            yield chunk
+
     def update_pagamento(self, rid: str, pagamento: str):
-        con = sqlite3.connect(self.db_path)
-        cur = con.cursor()
-        cur.execute("UPDATE moliture SET pagamento=? WHERE id=?", (pagamento, rid))
-        con.commit()
-        con.close()
+        self.update_pagamento_many([rid], pagamento)
+
+    @METRICS.timed("sql.update_pagamento_many", kind="sql")
+    def update_pagamento_many(self, rids: List[str], pagamento: str):
+        """Stesso pagamento su più record: una transazione sul file principale e,
+        se servono, una per ciascuna stagione archiviata coinvolta."""
+        self._write_by_id("UPDATE {schema}.moliture SET pagamento=? WHERE id=?",
+                          [(pagamento, rid) for rid in rids], rids)
 
-    def upsert_many(self, rows: List[Dict[str, Any]]):
+    def _write_by_id(self, stmt: str, params: List[Tuple], rids: List[str]):
+        with self._lock:
+            owners = self._owners(rids) if self._parts else {}
+            archived = {rid for ids in owners.values() for rid in ids}
+            with self._con:
+                self._con.executemany(stmt.format(schema="main"),
+                                      [p for p, rid in zip(params, rids) if rid not in archived])
+            for season, ids in owners.items():
+                wanted = set(ids)
+                with self._writable(season) as schema, self._con:
+                    self._con.executemany(stmt.format(schema=schema),
+                                          [p for p, rid in zip(params, rids) if rid in wanted])
+            self.writes += 1
+
+    @METRICS.timed("sql.upsert_many", kind="sql")
+    def upsert_many(self, rows: List[Molitura]):
         """Inserisce o aggiorna molti record (id unique)."""
-        if not rows:
+        to_ins = [r.as_tuple() for r in rows if r.id]
+        if not to_ins:
             return 0
-        con = sqlite3.connect(self.db_path)
-        cur = con.cursor()
-        to_ins = []
-        for r in rows:
-            rid = r.get("id")
-            if not rid:
-                continue
-            name = r.get("name") or r.get("nome") or ""
-            try:
-                weight = float(r.get("weight") or r.get("peso") or 0)
-            except Exception:
-                weight = 0.0
-            pagamento = r.get("pagamento") or ""
-            try:
-                dataOra = int(float(r.get("dataOra") or 0))
-            except Exception:
-                dataOra = 0
-            to_ins.append((rid, name, weight, pagamento, dataOra))
-        cur.executemany("""
-            INSERT INTO moliture(id,name,weight,pagamento,dataOra)
-            VALUES (?,?,?,?,?)
-            ON CONFLICT(id) DO UPDATE SET
-                name=excluded.name,
-                weight=excluded.weight,
-                pagamento=excluded.pagamento,
-                dataOra=excluded.dataOra
-        """, to_ins)
-        con.commit()
-        affected = cur.rowcount
-        con.close()
-        return affected
+        # i record delle stagioni archiviate vanno nel loro file
+        by_season: Dict[int, List[Tuple]] = {}
+        if self._parts:
+            hot = []
+            for t in to_ins:
+                season = _stagione_di(t[4])
+                (by_season.setdefault(season, []) if season in self._parts else hot).append(t)
+            to_ins = hot
+        # i record invariati non vengono riscritti: rowcount conta solo nuovi/modificati
+        with self._lock:
+            written = 0
+            if to_ins:
+                with self._con:
+                    written = self._con.executemany(
+                        _UPSERT.format(schema="main", source="VALUES (?,?,?,?,?)"), to_ins).rowcount
+            for season, items in by_season.items():
+                with self._writable(season) as schema, self._con:
+                    written += self._con.executemany(
+                        _UPSERT.format(schema=schema, source="VALUES (?,?,?,?,?)"), items).rowcount
+            if written:
+                self.writes += 1
+        return written
 
     def delete_one(self, rid: str):
-        con = sqlite3.connect(self.db_path)
-        cur = con.cursor()
-        cur.execute("DELETE FROM moliture WHERE id=?", (rid,))
-        con.commit()
-        con.close()
+        self.delete_many([rid])
+
+    @METRICS.timed("sql.delete_many", kind="sql")
+    def delete_many(self, rids: List[str]):
+        self._write_by_id("DELETE FROM {schema}.moliture WHERE id=?", [(rid,) for rid in rids], rids)
+
+    def change_token(self) -> Optional[Tuple[Any, ...]]:
+        """(PRAGMA data_version, scritture locali, data_version delle stagioni
+        agganciate): cambia quando l'archivio viene modificato, da questo processo o
+        da un altro. None se il client è occupato (es. una sync in corso): chi
+        controlla dal thread della GUI non si blocca.
+
+        Le stagioni archiviate non agganciate non vengono osservate: una modifica lì
+        da un altro processo si vede alla prossima lettura che le tocca. Agganciarne
+        una nuova cambia il valore, al più una rilettura in più."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            parts = tuple((season, self._con.execute(f"PRAGMA {schema}.data_version").fetchone()[0])
+                          for season, schema in sorted(self._attached.items()))
+            return self._con.execute("PRAGMA data_version").fetchone()[0], self.writes, parts
+        finally:
+            self._lock.release()
+
+    def get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Legge un valore dalla tabella sync_state (watermark, ultimo sync completo, ...)."""
+        with self._lock:
+            row = self._con.execute("SELECT value FROM sync_state WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value: Any):
+        with self._lock, self._con:
+            self._con.execute("""
+                INSERT INTO sync_state(key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value=excluded.value
+            """, (key, str(value)))
+
+    def delete_state(self, key: str):
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM sync_state WHERE key=?", (key,))
+
+    @METRICS.timed("sql.search_name", kind="sql")
+    def search_name(self, text: str, limit: int = 500) -> List[Molitura]:
+        """Record il cui nome contiene text (senza distinguere maiuscole), dal più recente.
+        Le stagioni archiviate si interrogano dalla più recente solo finché mancano risultati."""
+        text = text.strip()
+        if not text:
+            return []
+        fetched: List[Tuple] = []
+        with self._lock:
+            fetched += self._con.execute(*self._search_sql("main", text, limit)).fetchall()
+            for season in sorted(self._parts, reverse=True):
+                if len(fetched) >= limit:
+                    break
+                schema = self._attach(season)
+                fetched += self._con.execute(
+                    *self._search_sql(schema, text, limit - len(fetched))).fetchall()
+        return _to_records(fetched)
+
+    def _search_sql(self, schema: str, text: str, limit: int) -> Tuple[str, Tuple]:
+        cols = "m.id, m.name, m.weight, m.pagamento, m.dataOra"
+        mode = self._fts.get(schema)
+        if mode == "trigram" and len(text) >= 3:
+            # frase tra virgolette: sottostringa esatta, senza sintassi FTS
+            sql = f"""SELECT {cols} FROM {schema}.moliture_fts f JOIN {schema}.moliture m ON m.rowid = f.rowid
+                      WHERE moliture_fts MATCH ? ORDER BY m.dataOra DESC LIMIT ?"""
+            return sql, ('"' + text.replace('"', '""') + '"', limit)
+        if mode == "unicode61":
+            query = " ".join('"' + t.replace('"', '""') + '"*' for t in text.split())
+            sql = f"""SELECT {cols} FROM {schema}.moliture_fts f JOIN {schema}.moliture m ON m.rowid = f.rowid
+                      WHERE moliture_fts MATCH ? ORDER BY m.dataOra DESC LIMIT ?"""
+            return sql, (query, limit)
+        like = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        sql = f"""SELECT {cols} FROM {schema}.moliture m WHERE m.name LIKE ? ESCAPE '\\'
+                  ORDER BY m.dataOra DESC LIMIT ?"""
+        return sql, (f"%{like}%", limit)
+
+    # ---- outbox (operazioni su Firebase in attesa) ----
+    def outbox_add_many(self, ops: List[Tuple[str, str, Optional[str]]]):
+        """Accoda (rid, op, value) in una sola transazione; op è "pagamento" o "delete"."""
+        now = int(datetime.now(TZ).timestamp() * 1000)
+        with self._lock, self._con:
+            self._con.executemany(
+                "INSERT INTO outbox(rid, op, value, created_at) VALUES (?, ?, ?, ?)",
+                [(rid, op, value, now) for rid, op, value in ops])
+
+    @METRICS.timed("sql.outbox_pending", kind="sql")
+    def outbox_pending(self) -> List[Tuple[int, str, str, Optional[str]]]:
+        """[(seq, rid, op, value)] in ordine di inserimento."""
+        with self._lock:
+            return self._con.execute(
+                "SELECT seq, rid, op, value FROM outbox ORDER BY seq").fetchall()
+
+    def outbox_done(self, max_seq: int):
+        """Rimuove le operazioni fino a max_seq compreso (inviate o scartate)."""
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM outbox WHERE seq <= ?", (max_seq,))
+
+    def outbox_drop(self, rids: List[str], max_seq: Optional[int] = None):
+        """Rimuove le operazioni sui record indicati (solo fino a max_seq, se dato)."""
+        bound = " AND seq <= ?" if max_seq is not None else ""
+        with self._lock, self._con:
+            for i in range(0, len(rids), 500):
+                chunk = rids[i:i + 500]
+                self._con.execute(
+                    f"DELETE FROM outbox WHERE rid IN ({','.join('?' * len(chunk))}){bound}",
+                    chunk + ([max_seq] if max_seq is not None else []))
+
+    def outbox_failed(self, max_seq: int, error: str):
+        with self._lock, self._con:
+            self._con.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE seq <= ?",
+                (error, max_seq))
+
+    # ---- aggregati (tabelle agg_*, mantenute dai trigger) ----
+    @METRICS.timed("sql.totals_by_day", kind="sql")
+    def totals_by_day(self, start: date, end: date) -> List[Tuple[str, float, int]]:
+        """[(giorno 'YYYY-MM-DD', kg, conferimenti)] tra start ed end compresi."""
+        a_ms, b_ms = day_bounds_ts_ms(start)[0], day_bounds_ts_ms(end)[1]
+        with self._lock:
+            rows = self._agg_rows(self._archived_seasons(a_ms, b_ms), """
+                SELECT giorno, kg, n FROM {schema}.agg_giorno WHERE giorno BETWEEN ? AND ?
+            """, (start.isoformat(), end.isoformat()))
+        return sorted(rows)
+
+    def _agg_rows(self, seasons: Iterable[int], query: str, params: Tuple) -> List[Tuple[Any, float, int]]:
+        """(chiave, kg, n) dal file principale e dalle stagioni archiviate indicate,
+        sommando le chiavi presenti in più file (lock tenuto)."""
+        totals: Dict[Any, List] = {}
+        for season in [s for s in seasons if s in self._parts] + [None]:
+            # uno alla volta: con molte stagioni _attach stacca le meno recenti
+            schema = "main" if season is None else self._attach(season)
+            for key, kg, n in self._con.execute(query.format(schema=schema), params):
+                t = totals.setdefault(key, [0.0, 0])
+                t[0] += kg
+                t[1] += n
+        return [(key, kg, n) for key, (kg, n) in totals.items()]
+
+    @METRICS.timed("sql.totals_by_name", kind="sql")
+    def totals_by_name(self, season: int) -> List[Tuple[str, float, int]]:
+        """[(cliente, kg, conferimenti)] della stagione, dal cliente con più kg."""
+        with self._lock:
+            rows = self._agg_rows([season], """
+                SELECT name, kg, n FROM {schema}.agg_cliente WHERE stagione = ?
+            """, (season,))
+        return sorted(rows, key=lambda r: r[1], reverse=True)
+
+    @METRICS.timed("sql.totals_by_pagamento", kind="sql")
+    def totals_by_pagamento(self, season: int) -> List[Tuple[str, float, int]]:
+        with self._lock:
+            rows = self._agg_rows([season], """
+                SELECT pagamento, kg, n FROM {schema}.agg_pagamento WHERE stagione = ?
+            """, (season,))
+        return sorted(rows, key=lambda r: r[1], reverse=True)
+
+    @METRICS.timed("sql.season_totals", kind="sql")
+    def season_totals(self, season: int) -> Tuple[float, int]:
+        """(kg, conferimenti) della stagione."""
+        rows = self.totals_by_pagamento(season)
+        return float(sum(r[1] for r in rows)), int(sum(r[2] for r in rows))
+
+    def seasons(self) -> List[int]:
+        """Stagioni presenti in archivio, dalla più recente."""
+        with self._lock:
+            seasons = set(self._main_seasons()) | set(self._parts)
+        return sorted(seasons, reverse=True)
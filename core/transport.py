@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_TIMEOUTS: Dict[str, Any] = {
+    "read": 30,      # GET sulla collection
+    "write": 15,     # PATCH pagamento / cancellazioni
+    "auth": 15,      # identitytoolkit / securetoken
+    "stream": [15, 90],  # connessione SSE: (connect, read)
+}
+
+
+class HttpTransport:
+    """Sessione HTTP condivisa da AuthClient, FirebaseRestClient e FirebaseStream:
+    pool di connessioni keep-alive, gzip, timeout per tipo di operazione e retry
+    con backoff esponenziale (jitter) su 429/5xx ed errori di rete.
+
+    Ogni richiesta viene riportata a on_request(info) con latenza e byte."""
+
+    def __init__(self, pool_size: int = 4, retries: int = 3, backoff_s: float = 0.5,
+                 max_backoff_s: float = 8.0, timeouts: Optional[Dict[str, Any]] = None,
+                 on_request: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.retries = max(0, int(retries))
+        self.backoff_s = float(backoff_s)
+        self.max_backoff_s = float(max_backoff_s)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.on_request = on_request
+
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"requests": 0, "retries": 0, "errors": 0,
+                                        "bytes_in": 0, "bytes_out": 0, "total_ms": 0.0}
+
+    def _timeout(self, op: str):
+        t = self.timeouts.get(op, self.timeouts["read"])
+        return tuple(t) if isinstance(t, (list, tuple)) else t
+
+    def _sleep_before_retry(self, attempt: int, resp: Optional[requests.Response]):
+        delay = random.uniform(0, min(self.max_backoff_s, self.backoff_s * (2 ** attempt)))
+        if resp is not None:
+            try:
+                delay = max(delay, float(resp.headers.get("Retry-After", 0)))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def request(self, method: str, url: str, op: str = "read", stream: bool = False,
+                count_body: bool = False, **kwargs) -> requests.Response:
+        """Come requests.request, con timeout dell'operazione `op` e retry.
+        Le risposte in streaming non vengono ritentate dopo la connessione; con
+        count_body=True una risposta riuscita viene riportata solo quando iter_body()
+        ne ha letto il corpo, con i byte ricevuti e il tempo fino all'ultimo."""
+        kwargs.setdefault("timeout", self._timeout(op))
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            resp = None
+            try:
+                resp = self.session.request(method, url, stream=stream, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._report(method, url, op, None, t0, None, kwargs, error=str(e))
+                if attempt >= self.retries:
+                    raise
+            else:
+                if stream and count_body and resp.status_code < 400:
+                    resp._pending_report = (method, url, op, t0, kwargs)
+                    return resp
+                self._report(method, url, op, resp, t0, resp if not stream else None, kwargs)
+                if resp.status_code not in RETRY_STATUS or attempt >= self.retries:
+                    return resp
+                resp.close()
+            with self._lock:
+                self.stats["retries"] += 1
+            self._sleep_before_retry(attempt, resp)
+            attempt += 1
+
+    def iter_body(self, resp: requests.Response, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Corpo di una risposta in streaming a pezzi. A lettura finita (o interrotta)
+        riporta la richiesta aperta con count_body=True: byte sul filo (compressi)
+        se urllib3 li espone, altrimenti quelli decodificati."""
+        pending = getattr(resp, "_pending_report", None)
+        received = 0
+        try:
+            for chunk in resp.iter_content(chunk_size):
+                received += len(chunk)
+                yield chunk
+        finally:
+            if pending is not None:
+                resp._pending_report = None
+                try:
+                    wire = int(resp.raw.tell())
+                except (AttributeError, TypeError, ValueError):
+                    wire = 0
+                method, url, op, t0, kwargs = pending
+                self._report(method, url, op, resp, t0, None, kwargs, bytes_in=wire or received)
+
+    def get(self, url: str, op: str = "read", **kwargs) -> requests.Response:
+        return self.request("GET", url, op=op, **kwargs)
+
+    def post(self, url: str, op: str = "write", **kwargs) -> requests.Response:
+        return self.request("POST", url, op=op, **kwargs)
+
+    def patch(self, url: str, op: str = "write", **kwargs) -> requests.Response:
+        return self.request("PATCH", url, op=op, **kwargs)
+
+    def put(self, url: str, op: str = "write", **kwargs) -> requests.Response:
+        return self.request("PUT", url, op=op, **kwargs)
+
+    def _report(self, method, url, op, resp, t0, body_resp, kwargs, error=None, bytes_in=0):
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if body_resp is not None:
+            try:
+                # byte sul filo (compressi) se noti, altrimenti il corpo decodificato
+                bytes_in = int(body_resp.headers.get("Content-Length") or len(body_resp.content))
+            except (ValueError, requests.RequestException):
+                bytes_in = 0
+        req = getattr(resp, "request", None)
+        body = getattr(req, "body", None)
+        bytes_out = len(body) if body else 0
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["total_ms"] += elapsed_ms
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+            if error is not None or (resp is not None and resp.status_code >= 400):
+                self.stats["errors"] += 1
+        if self.on_request is not None:
+            info = {
+                "method": method, "op": op, "url": url.split("?", 1)[0],
+                "status": getattr(resp, "status_code", None), "ms": round(elapsed_ms, 1),
+                "bytes_in": bytes_in, "bytes_out": bytes_out, "error": error,
+            }
+            try:
+                self.on_request(info)
+            except Exception:
+                pass
+
+    def close(self):
+        self.session.close()
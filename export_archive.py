@@ -0,0 +1,50 @@
+"""Estratto dell'archivio SQLite senza avviare l'interfaccia.
+
+    python -m app_frantoio.export_archive stagione_2025.csv --season 2025
+    python -m app_frantoio.export_archive tutto.parquet
+"""
+import argparse
+import sys
+from datetime import date
+from app_frantoio.util.config import load_config
+from app_frantoio.util.time_utils import day_bounds_ts_ms, season_bounds
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.core.bulk_export import FORMATS, export_archive
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Esporta i record dell'archivio in CSV/Parquet/Feather")
+    p.add_argument("output", help="file di destinazione (.csv, .parquet, .feather)")
+    p.add_argument("--format", choices=FORMATS, help="di default dall'estensione del file")
+    p.add_argument("--season", type=int, help="solo la stagione che inizia in quest'anno")
+    p.add_argument("--from", dest="date_from", type=date.fromisoformat, help="dal giorno (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", type=date.fromisoformat, help="al giorno (YYYY-MM-DD)")
+    p.add_argument("--db", help="archivio SQLite (default: archive_db della configurazione)")
+    p.add_argument("--chunk", type=int, default=5000, help="righe per blocco")
+    p.add_argument("--sep", default=";", help="separatore CSV")
+    args = p.parse_args(argv)
+
+    start, end = args.date_from, args.date_to
+    if args.season is not None:
+        s_start, s_end = season_bounds(args.season)
+        start, end = max(start or s_start, s_start), min(end or s_end, s_end)
+    start_ms = day_bounds_ts_ms(start)[0] if start else None
+    end_ms = day_bounds_ts_ms(end)[1] if end else None
+
+    db = args.db or load_config().get("archive_db", "frantoio_archive.db")
+    sql = SQLiteClient(db)
+    try:
+        n = export_archive(sql, args.output, fmt=args.format, start_ms=start_ms, end_ms=end_ms,
+                           chunk_size=max(1, args.chunk), sep=args.sep,
+                           progress=lambda k: print(f"\r{k} righe", end="", file=sys.stderr))
+    except Exception as e:
+        print(f"\nErrore: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sql.close()
+    print(f"\rEsportate {n} righe in {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,170 @@
-from typing import Any, Dict, List
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from PyQt6 import QtCore
-from app_frantoio.util.time_utils import fmt_ts
+from app_frantoio.core.record import Molitura
+from app_frantoio.util.metrics import METRICS
 
 COLS = ["Nome", "Peso (kg)", "Prezzo (€)", "Ora", "Pagamento"]
 
+
+def _display(r: Molitura, c: int, show_date: bool):
+    if c == 0: return r.name
+    if c == 1: return f"{r.weight:.2f}"
+    if c == 2: return f"{r.prezzo:.2f}"
+    if c == 3: return f"{r.giorno} {r.ora}" if show_date else r.ora
+    if c == 4: return r.pagamento
+    return None
+
+
+def _header(section: int, orientation, role, show_date: bool):
+    if role == QtCore.Qt.ItemDataRole.DisplayRole:
+        if orientation == QtCore.Qt.Orientation.Horizontal:
+            if section == 3 and show_date:
+                return "Data e ora"
+            return COLS[section]
+        return section + 1
+    if role == QtCore.Qt.ItemDataRole.TextAlignmentRole:
+        return int(QtCore.Qt.AlignmentFlag.AlignCenter)
+    return None
+
+
+def _flags(index):
+    base = QtCore.Qt.ItemFlag.ItemIsEnabled | QtCore.Qt.ItemFlag.ItemIsSelectable
+    if index.column() == 4:
+        base |= QtCore.Qt.ItemFlag.ItemIsEditable
+    return base
+
+
 class MolitureModel(QtCore.QAbstractTableModel):
-    def __init__(self, rows: List[Dict[str, Any]], euro_per_kg: float, parent=None):
+    def __init__(self, rows: List[Molitura], euro_per_kg: float, parent=None):
         super().__init__(parent)
-        self._rows = rows
+        self._rows = list(rows)
         self._euro = euro_per_kg
+        self._show_date = False
+        for r in self._rows:
+            r.set_price(self._euro)
+        self._reindex()
+
+    @METRICS.timed("model.set_rows", kind="ui")
+    def set_rows(self, rows: List[Molitura]) -> bool:
+        """Sostituisce le righe emettendo solo i segnali necessari (diff per id):
+        rowsRemoved per gli id spariti, rowsInserted per i nuovi, dataChanged per i
+        modificati. Selezione e scroll della vista restano dove sono.
+        Se l'ordine delle righe comuni cambia si ripiega su un reset.
+        Ritorna True se qualcosa è cambiato."""
+        new_ids = {r.id for r in rows}
+        changed = False
 
-    def set_rows(self, rows: List[Dict[str, Any]]):
+        # 1) rimozioni, a blocchi contigui dal fondo
+        i = len(self._rows) - 1
+        while i >= 0:
+            if self._rows[i].id in new_ids:
+                i -= 1
+                continue
+            last = i
+            while i >= 0 and self._rows[i].id not in new_ids:
+                i -= 1
+            self.beginRemoveRows(QtCore.QModelIndex(), i + 1, last)
+            del self._rows[i + 1:last + 1]
+            self.endRemoveRows()
+            changed = True
+
+        # 2) le righe rimaste devono comparire nello stesso ordine
+        old_ids = [r.id for r in self._rows]
+        kept = set(old_ids)
+        if old_ids != [r.id for r in rows if r.id in kept]:
+            self._reset(rows)
+            return True
+
+        # 3) inserimenti a blocchi e aggiornamenti
+        pos = 0
+        first_dirty = last_dirty = -1
+        n = 0
+        while n < len(rows):
+            r = rows[n]
+            if pos < len(self._rows) and self._rows[pos].id == r.id:
+                # record invariato: si tiene il vecchio oggetto (ora/prezzo già calcolati)
+                if not self._rows[pos].same_as(r):
+                    r.set_price(self._euro)
+                    self._rows[pos] = r
+                    if first_dirty < 0:
+                        first_dirty = pos
+                    last_dirty = pos
+                pos += 1
+                n += 1
+                continue
+            block = []
+            while n < len(rows) and rows[n].id not in kept:
+                rows[n].set_price(self._euro)
+                block.append(rows[n])
+                n += 1
+            if not block:  # id duplicati: niente diff affidabile
+                self._reset(rows)
+                return True
+            self.beginInsertRows(QtCore.QModelIndex(), pos, pos + len(block) - 1)
+            self._rows[pos:pos] = block
+            self.endInsertRows()
+            if first_dirty >= pos:
+                first_dirty += len(block)
+                last_dirty += len(block)
+            pos += len(block)
+            changed = True
+
+        if first_dirty >= 0:
+            self.dataChanged.emit(self.index(first_dirty, 0),
+                                  self.index(last_dirty, len(COLS) - 1),
+                                  [QtCore.Qt.ItemDataRole.DisplayRole])
+            changed = True
+        if changed:
+            self._reindex()
+        return changed
+
+    def _reset(self, rows: List[Molitura]):
+        METRICS.count("model.reset")
         self.beginResetModel()
-        self._rows = rows
+        self._rows = list(rows)
+        for r in self._rows:
+            r.set_price(self._euro)
+        self._reindex()
         self.endResetModel()
 
+    def _reindex(self):
+        self._index = {r.id: i for i, r in enumerate(self._rows)}
+
+    def row_index(self, rid: Optional[str]) -> Optional[int]:
+        """Posizione della riga con questo id (O(1)), None se assente."""
+        return self._index.get(rid)
+
+    def apply_changes(self, changed: List[Molitura], removed_ids: List[str]) -> bool:
+        """Applica un delta (righe nuove/modificate, id rimossi) senza reset del modello.
+        Le righe restano ordinate per dataOra."""
+        pending = {r.id: r for r in changed}
+        gone = set(removed_ids) | pending.keys()
+        rows = [r for r in self._rows if r.id not in gone]
+        rows.extend(pending.values())
+        rows.sort(key=lambda r: r.dataOra)
+        return self.set_rows(rows)
+
+    def set_pagamento(self, ids: List[str], pagamento: str):
+        """Pagamento su più righe con un solo dataChanged (colonna Pagamento)."""
+        rows = [self._index[rid] for rid in ids if rid in self._index]
+        if not rows:
+            return
+        for i in rows:
+            self._rows[i].pagamento = pagamento
+        self.dataChanged.emit(self.index(min(rows), 4), self.index(max(rows), 4),
+                              [QtCore.Qt.ItemDataRole.DisplayRole])
+
+    def set_show_date(self, on: bool):
+        """Nelle viste su più giorni la colonna Ora mostra anche la data."""
+        if on == self._show_date:
+            return
+        self._show_date = on
+        self.headerDataChanged.emit(QtCore.Qt.Orientation.Horizontal, 3, 3)
+        if self._rows:
+            self.dataChanged.emit(self.index(0, 3), self.index(len(self._rows) - 1, 3),
+                                  [QtCore.Qt.ItemDataRole.DisplayRole])
+
     def rowCount(self, parent=QtCore.QModelIndex()):
         return len(self._rows)
 
@@ -22,51 +172,23 @@ class MolitureModel(QtCore.QAbstractTableModel):
         return len(COLS)
 
     def headerData(self, section, orientation, role):
-        if role == QtCore.Qt.ItemDataRole.DisplayRole:
-            if orientation == QtCore.Qt.Orientation.Horizontal:
-                return COLS[section]
-            return section + 1
-        if role == QtCore.Qt.ItemDataRole.TextAlignmentRole:
-            return int(QtCore.Qt.AlignmentFlag.AlignCenter)
-        return None
+        return _header(section, orientation, role, self._show_date)
 
     def data(self, index, role):
         if not index.isValid():
             return None
-        r = self._rows[index.row()]
-        c = index.column()
-
-        name = r.get("name") or r.get("nome") or ""
-        weight = r.get("weight") or r.get("peso") or 0
-        try:
-            weight_f = float(weight)
-        except Exception:
-            weight_f = 0.0
-        prezzo = weight_f * self._euro
-        ts = r.get("dataOra")
-        pagamento = r.get("pagamento") or ""
-
         if role == QtCore.Qt.ItemDataRole.DisplayRole:
-            if c == 0: return str(name)
-            if c == 1: return f"{weight_f:.2f}"
-            if c == 2: return f"{prezzo:.2f}"
-            if c == 3: return fmt_ts(ts)
-            if c == 4: return pagamento
-
+            return _display(self._rows[index.row()], index.column(), self._show_date)
         if role == QtCore.Qt.ItemDataRole.TextAlignmentRole:
             return int(QtCore.Qt.AlignmentFlag.AlignCenter)
-
         return None
 
     def flags(self, index):
-        base = QtCore.Qt.ItemFlag.ItemIsEnabled | QtCore.Qt.ItemFlag.ItemIsSelectable
-        if index.column() == 4:
-            base |= QtCore.Qt.ItemFlag.ItemIsEditable
-        return base
+        return _flags(index)
 
     def setData(self, index, value, role):
         if role == QtCore.Qt.ItemDataRole.EditRole and index.column() == 4:
-            self._rows[index.row()]["pagamento"] = str(value)
+            self._rows[index.row()].pagamento = str(value)
             self.dataChanged.emit(index, index, [QtCore.Qt.ItemDataRole.DisplayRole])
             return True
         return False
@@ -76,3 +198,197 @@ class MolitureModel(QtCore.QAbstractTableModel):
 
     def all_rows(self):
         return self._rows
+
+    def totals(self) -> Tuple[int, float]:
+        """(righe, kg) per il footer."""
+        return len(self._rows), sum(r.weight for r in self._rows)
+
+
+# pagina(after, limit, blocking): record successivi alla chiave (dataOra, id) after,
+# in ordine; con blocking=False None se l'archivio è occupato
+PageFn = Callable[[Optional[Tuple[int, str]], int, bool], Optional[List[Molitura]]]
+
+
+class PagedMolitureModel(QtCore.QAbstractTableModel):
+    """Vista a pagine su un insieme di record troppo grande per tenerlo in memoria
+    (es. un intervallo di mesi dall'archivio).
+
+    Le righe arrivano a finestre di `window` record con paginazione keyset: la vista
+    chiede canFetchMore/fetchMore mentre si scorre verso il fondo. Di ogni finestra
+    si ricorda solo la chiave di partenza; delle righe se ne tengono al massimo
+    `keep` finestre, scartando le più lontane da quella in uso e rileggendole se la
+    vista ci torna. Numero di righe e kg del footer arrivano dagli aggregati
+    (total_rows, total_kg), senza leggere i record.
+
+    Le letture per il disegno e lo scorrimento non aspettano il lock di SQLite: se
+    il client è occupato (es. una sync in corso) la funzione di pagina ritorna None,
+    le celle mostrano un segnaposto e si riprova dopo retry_ms."""
+
+    PLACEHOLDER = "…"
+
+    def __init__(self, euro_per_kg: float, window: int = 500, keep: int = 8,
+                 retry_ms: int = 100, parent=None):
+        super().__init__(parent)
+        self._euro = euro_per_kg
+        self._window = max(1, int(window))
+        self._keep = max(2, int(keep))
+        self._page: Optional[PageFn] = None
+        self._total = 0
+        self._kg = 0.0
+        self._loaded = 0
+        # chiave dell'ultima riga prima della finestra k (None per la prima)
+        self._starts: List[Optional[Tuple[int, str]]] = [None]
+        self._windows: "OrderedDict[int, List[Molitura]]" = OrderedDict()
+        # finestre mostrate con il segnaposto e fetchMore rimandato: si riprova al timer
+        self._missing: Set[int] = set()
+        self._grow_wanted = False
+        self._retry = QtCore.QTimer(self)
+        self._retry.setSingleShot(True)
+        self._retry.setInterval(max(10, int(retry_ms)))
+        self._retry.timeout.connect(self._on_retry)
+
+    def set_source(self, page: Optional[PageFn], total_rows: int = 0, total_kg: float = 0.0):
+        """Nuovo insieme di record: si riparte dalla prima finestra."""
+        METRICS.count("model.reset")
+        self.beginResetModel()
+        self._page = page
+        self._total = max(0, int(total_rows)) if page is not None else 0
+        self._kg = float(total_kg)
+        self._loaded = 0
+        self._starts = [None]
+        self._windows.clear()
+        self._missing.clear()
+        self._grow_wanted = False
+        self._retry.stop()
+        self.endResetModel()
+
+    def totals(self) -> Tuple[int, float]:
+        return self._total, self._kg
+
+    # ---- finestre ----
+    def _load(self, k: int, blocking: bool = True) -> Optional[List[Molitura]]:
+        """Finestra k; con blocking=False None se SQLite è occupato (si riprova al timer)."""
+        rows = self._windows.get(k)
+        if rows is not None:
+            self._windows.move_to_end(k)
+            return rows
+        with METRICS.timer("model.fetch_page", kind="ui", log=False) as m:
+            rows = self._page(self._starts[k], self._window, blocking) if self._page is not None else []
+            m.rows = len(rows or ())
+        if rows is None:
+            METRICS.count("model.fetch_page.busy")
+            self._missing.add(k)
+            self._retry.start()
+            return None
+        for r in rows:
+            r.set_price(self._euro)
+        if len(rows) == self._window and len(self._starts) == k + 1:
+            last = rows[-1]
+            self._starts.append((last.dataOra, last.id))
+        self._windows[k] = rows
+        while len(self._windows) > self._keep:
+            far = max(self._windows, key=lambda j: abs(j - k))
+            del self._windows[far]
+        return rows
+
+    def _on_retry(self):
+        if self._grow_wanted:
+            self._grow_wanted = False
+            self.fetchMore()
+        missing, self._missing = self._missing, set()
+        for k in sorted(missing):
+            first = k * self._window
+            last = min(self._loaded, first + self._window) - 1
+            if first <= last:
+                # la vista ridisegna quelle righe e richiede i dati
+                self.dataChanged.emit(self.index(first, 0), self.index(last, len(COLS) - 1),
+                                      [QtCore.Qt.ItemDataRole.DisplayRole])
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self._loaded < self._total
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self._loaded >= self._total:
+            return
+        k = self._loaded // self._window
+        rows = self._load(k, blocking=False)
+        if rows is None:
+            self._grow_wanted = True
+            return
+        end = min(k * self._window + len(rows), self._total)
+        if len(rows) < self._window:
+            # i record sono meno di quanto dicevano gli aggregati: ci si ferma qui
+            self._total = end
+        if end > self._loaded:
+            self.beginInsertRows(QtCore.QModelIndex(), self._loaded, end - 1)
+            self._loaded = end
+            self.endInsertRows()
+
+    def row_at(self, row: int) -> Molitura:
+        """Record della riga; se la sua finestra non è in memoria la legge aspettando
+        il lock (serve per un'azione dell'utente sulla selezione)."""
+        if not 0 <= row < self._loaded:
+            raise IndexError(f"riga {row} fuori dalla vista (0-{self._loaded - 1})")
+        rows = self._load(row // self._window)
+        i = row % self._window
+        if i >= len(rows):
+            raise IndexError(f"riga {row} non più presente nell'archivio")
+        return rows[i]
+
+    def row_index(self, rid: Optional[str]) -> Optional[int]:
+        """Posizione della riga con questo id, cercata solo nelle finestre in memoria."""
+        for k, rows in self._windows.items():
+            for i, r in enumerate(rows):
+                if r.id == rid:
+                    return k * self._window + i
+        return None
+
+    def _positions(self, ids: Iterable[str]) -> Dict[int, Molitura]:
+        wanted = set(ids)
+        return {k * self._window + i: r for k, rows in self._windows.items()
+                for i, r in enumerate(rows) if r.id in wanted}
+
+    def set_pagamento(self, ids: List[str], pagamento: str):
+        found = self._positions(ids)
+        if not found:
+            return
+        for r in found.values():
+            r.pagamento = pagamento
+        self.dataChanged.emit(self.index(min(found), 4), self.index(max(found), 4),
+                              [QtCore.Qt.ItemDataRole.DisplayRole])
+
+    def set_show_date(self, on: bool):
+        pass  # vista su più giorni: la data si mostra sempre
+
+    # ---- QAbstractTableModel ----
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(COLS)
+
+    def headerData(self, section, orientation, role):
+        return _header(section, orientation, role, True)
+
+    def data(self, index, role):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.ItemDataRole.DisplayRole:
+            rows = self._load(index.row() // self._window, blocking=False)
+            if rows is None:
+                return self.PLACEHOLDER if index.column() == 0 else None
+            i = index.row() % self._window
+            return _display(rows[i], index.column(), True) if i < len(rows) else None
+        if role == QtCore.Qt.ItemDataRole.TextAlignmentRole:
+            return int(QtCore.Qt.AlignmentFlag.AlignCenter)
+        return None
+
+    def flags(self, index):
+        return _flags(index)
+
+    def setData(self, index, value, role):
+        if role == QtCore.Qt.ItemDataRole.EditRole and index.column() == 4:
+            self.row_at(index.row()).pagamento = str(value)
+            self.dataChanged.emit(index, index, [QtCore.Qt.ItemDataRole.DisplayRole])
+            return True
+        return False
@@ -0,0 +1,131 @@
+"""Sync Firebase -> archivio SQLite senza interfaccia (PC d'ufficio sempre acceso).
+
+    python -m app_frantoio.sync_daemon once
+    python -m app_frantoio.sync_daemon sync --interval 300
+
+Se c'è una sessione salvata (token.json accanto a config.json) il login non serve;
+altrimenti --email (o "sync_email" in config.json) e password dalla variabile
+d'ambiente FRANTOIO_PASSWORD, o chiesta da terminale.
+"""
+import time
+_T0 = time.perf_counter()
+
+import argparse
+import getpass
+import logging
+import os
+import signal
+import sys
+import threading
+from app_frantoio.util.config import load_config
+from app_frantoio.core.bootstrap import make_auth, make_repository, make_transport, setup_metrics
+
+log = logging.getLogger("app_frantoio.sync")
+
+def _sync_once(repo):
+    t = time.perf_counter()
+    res = repo.mirror_and_cleanup(progress=lambda n: log.info("pulizia: %d record cancellati da Firebase", n))
+    log.info("sync: copiati %s, cancellati %s, letti %s (%.0f ms)",
+             res.get("mirrored"), res.get("deleted"), res.get("fetched"),
+             (time.perf_counter() - t) * 1000)
+    if not res.get("leader", True):
+        log.info("pulizia lasciata a %s, che tiene la lease", (repo.lease.current or {}).get("holder"))
+    return res
+
+
+def _release_lease(repo):
+    if repo.lease is None:
+        return
+    try:
+        repo.lease.release()
+    except Exception as e:
+        log.warning("Rilascio della lease fallito (scadrà da sola): %s", e)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Sync Firebase -> archivio SQLite senza interfaccia")
+    p.add_argument("command", choices=("sync", "once"),
+                   help="once: un solo sync; sync: ripete ogni --interval secondi")
+    p.add_argument("--interval", type=float, default=None,
+                   help="secondi tra due sync (default: mirror_interval_minutes della configurazione)")
+    p.add_argument("--email", help="utente Firebase (default: sync_email della configurazione)")
+    p.add_argument("-v", "--verbose", action="store_true")
+    args = p.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    cfg = load_config()
+    if not cfg.get("api_key", "").strip() or not cfg.get("database_url", "").strip():
+        log.error("Imposta 'api_key' e 'database_url' in config.json")
+        return 1
+
+    setup_metrics(cfg, "sync_metrics.jsonl")
+    http = make_transport(cfg)
+    auth = make_auth(cfg, http)
+    if not auth.try_restore():
+        email = args.email or cfg.get("sync_email", "")
+        if not email:
+            log.error("Utente mancante: usa --email o 'sync_email' in config.json")
+            return 1
+        password = os.environ.get("FRANTOIO_PASSWORD") or getpass.getpass(f"Password per {email}: ")
+        try:
+            auth.sign_in_password(email, password)
+        except Exception as e:
+            log.error("Login fallito: %s", e)
+            return 1
+    auth.start_auto_refresh()
+    repo = make_repository(cfg, auth, http)
+
+    budget_ms = float(cfg.get("startup_budget_ms", 0) or 0)
+    ms = (time.perf_counter() - _T0) * 1000
+    if budget_ms and ms > budget_ms:
+        log.warning("Avvio in %.0f ms (budget %.0f ms)", ms, budget_ms)
+    else:
+        log.info("Avvio in %.0f ms", ms)
+
+    if args.command == "once":
+        try:
+            _sync_once(repo)
+            return 0
+        except Exception as e:
+            log.error("Sync fallito: %s", e)
+            return 2
+        finally:
+            _release_lease(repo)
+            auth.stop_auto_refresh()
+            repo.sql.close()
+
+    interval = args.interval
+    if interval is None:
+        interval = max(1, int(cfg.get("mirror_interval_minutes", 5))) * 60
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    def _auth_failed(e):
+        # sessione revocata: senza login ogni giro fallirebbe
+        log.error("Rinnovo della sessione rifiutato (%s): rieseguire il login", e)
+        stop.set()
+    auth.on_auth_error = _auth_failed
+    log.info("Sync ogni %.0f s (Ctrl+C per uscire)", interval)
+    while not stop.is_set():
+        try:
+            _sync_once(repo)
+        except Exception as e:
+            # errori di rete/Firebase: si riprova al giro successivo
+            log.error("Sync fallito: %s", e)
+        if repo.maintenance_due():
+            try:
+                log.info("Manutenzione archivio: %s", repo.run_maintenance())
+            except Exception as e:
+                log.error("Manutenzione fallita: %s", e)
+        stop.wait(max(1.0, interval))
+    _release_lease(repo)
+    auth.stop_auto_refresh()
+    repo.sql.close()
+    log.info("Terminato")
+    return 1 if auth.auth_error is not None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
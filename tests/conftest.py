@@ -0,0 +1,57 @@
+"""Fixture comuni: RTDB finto (bench.fake_rtdb) e archivio SQLite in una cartella
+temporanea, senza rete reale.
+
+    python -m pytest -q
+"""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = Path(__file__).resolve().parents[1]
+try:
+    import app_frantoio  # noqa: F401
+except ImportError:
+    # checkout in una cartella che non si chiama app_frantoio: la si registra con quel nome
+    spec = importlib.util.spec_from_file_location("app_frantoio", ROOT / "__init__.py",
+                                                  submodule_search_locations=[str(ROOT)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["app_frantoio"] = module
+    spec.loader.exec_module(module)
+
+import pytest
+from app_frantoio.bench.fake_rtdb import FakeRTDB
+from app_frantoio.core.fb_client import FirebaseRestClient
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.core.transport import HttpTransport
+
+COLLECTION = "molitura"
+
+
+@pytest.fixture
+def rtdb():
+    srv = FakeRTDB().start()
+    yield srv
+    srv.stop()
+
+
+@pytest.fixture
+def make_fb(rtdb):
+    """FirebaseRestClient sul server finto (uno per PC simulato)."""
+    def make() -> FirebaseRestClient:
+        return FirebaseRestClient(rtdb.url, COLLECTION, lambda: "test", transport=HttpTransport(retries=0))
+    return make
+
+
+@pytest.fixture
+def fb(make_fb):
+    return make_fb()
+
+
+@pytest.fixture
+def sql(tmp_path):
+    client = SQLiteClient(str(tmp_path / "archivio.db"))
+    yield client
+    client.close()
@@ -0,0 +1,53 @@
+import json
+import pytest
+from app_frantoio.core.fb_client import iter_children
+
+NODES = {
+    "-Nabc": {"name": "Però {Rossi}", "weight": 1.5e3, "pagamento": "", "dataOra": 1700000000000},
+    "-Nabd": {"name": "Bianchi \"B\"", "weight": 12, "pagamento": "POS", "dataOra": 1700000000001},
+    "-Nabe": {"name": "Verdi", "weight": 0.25, "nested": {"a": [1, {"b": "}"}]}, "dataOra": 1},
+}
+
+
+def _split(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_iter_children_any_chunking(separators):
+    body = json.dumps(NODES, ensure_ascii=False, separators=separators).encode("utf-8")
+    # ogni taglio possibile, anche a metà di un carattere UTF-8 o di un numero
+    for size in range(1, 12):
+        assert dict(iter_children(_split(body, size))) == NODES
+    for cut in range(1, len(body)):
+        assert dict(iter_children([body[:cut], body[cut:]])) == NODES
+
+
+@pytest.mark.parametrize("body", [b"null", b" null ", b"{}", b" { } ", b""])
+def test_iter_children_empty(body):
+    assert list(iter_children(_split(body, 1) or [b""])) == []
+
+
+def test_iter_children_number_at_chunk_end():
+    # "1.5" potrebbe continuare in "1.5e3": si aspetta il pezzo successivo
+    assert list(iter_children([b'{"a":1.5', b'e3}'])) == [("a", 1500.0)]
+
+
+@pytest.mark.parametrize("body", [b'{"a": 1, "b": ', b'{"a": {"b": 1}', b"[1, 2]", b'"x"'])
+def test_iter_children_invalid(body):
+    with pytest.raises(ValueError):
+        list(iter_children([body]))
+
+
+def test_fetch_reads_all_nodes(rtdb, fb):
+    rtdb.load("molitura", [(k, v) for k, v in NODES.items() if "nested" not in v])
+    rows = {r.id: r for r in fb.fetch()}
+    assert set(rows) == {"-Nabc", "-Nabd"}
+    assert rows["-Nabc"].name == "Però {Rossi}" and rows["-Nabc"].weight == 1500.0
+
+
+def test_existing_ids_single_request(rtdb, fb):
+    rtdb.load("molitura", [("a", {"dataOra": 1}), ("b", {"dataOra": 2})])
+    before = len(rtdb.requests)
+    assert fb.existing_ids(["a", "b", "gone"] + [f"x{i}" for i in range(30)]) == {"a", "b"}
+    assert len(rtdb.requests) - before == 1
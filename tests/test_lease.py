@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+import requests
+from app_frantoio.core.lease import LeaderLease, LeaseLost
+from app_frantoio.core.repository import HybridRepository
+from app_frantoio.core.sqlite_client import SQLiteClient
+from app_frantoio.util.time_utils import TZ
+
+PATH = "locks/mirror"
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status}", response=resp)
+
+
+def test_one_winner(rtdb, make_fb):
+    leases = [LeaderLease(make_fb(), PATH, holder=f"pc{i}", ttl_s=60) for i in range(8)]
+    won = [False] * len(leases)
+    start = threading.Barrier(len(leases))
+
+    def run(i):
+        start.wait()
+        won[i] = leases[i].acquire()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(leases))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(won) == 1
+    winner = won.index(True)
+    assert rtdb.get(PATH.split("/"))["holder"] == f"pc{winner}"
+    assert leases[winner].acquire()  # rinnovo
+    assert not leases[(winner + 1) % len(leases)].acquire()
+
+
+def test_failover_and_release(rtdb, make_fb):
+    a = LeaderLease(make_fb(), PATH, holder="A", ttl_s=2)
+    b = LeaderLease(make_fb(), PATH, holder="B", ttl_s=2)
+    assert a.acquire() and not b.acquire()
+    time.sleep(3.1)  # A non rinnova; l'header Date è al secondo
+    assert b.acquire()
+    with pytest.raises(LeaseLost):
+        a.ensure()
+    a.release()  # non è più sua: il nodo resta di B
+    assert rtdb.get(PATH.split("/"))["holder"] == "B"
+    b.release()
+    assert rtdb.get(PATH.split("/")) is None
+    assert a.acquire()
+
+
+def test_denied_node_disables_lease(fb, monkeypatch):
+    lease = LeaderLease(fb, PATH, holder="A")
+
+    def denied(path):
+        raise _http_error(403)
+    monkeypatch.setattr(fb, "read_node", denied)
+    assert lease.acquire() and not lease.enabled and lease.last_error is None
+
+
+def _repo(fb, path, **kw) -> HybridRepository:
+    return HybridRepository(fb, SQLiteClient(str(path)), 7, 7, cleanup_pause_s=0, **kw)
+
+
+def test_lease_error_still_mirrors(rtdb, fb, tmp_path, monkeypatch):
+    now = datetime.now(TZ)
+    old_ms = int((now - timedelta(days=30)).timestamp() * 1000)
+    new_ms = int((now - timedelta(hours=1)).timestamp() * 1000)
+    rtdb.load("molitura", [("old", {"name": "A", "weight": 1.0, "dataOra": old_ms}),
+                           ("new", {"name": "B", "weight": 2.0, "dataOra": new_ms})])
+    repo = _repo(fb, tmp_path / "a.db")
+    repo.attach_lease(LeaderLease(fb, PATH, holder="A", ttl_s=60))
+    real = fb.read_node
+
+    def unavailable(path):
+        raise _http_error(503)
+    monkeypatch.setattr(fb, "read_node", unavailable)
+    res = repo.mirror_and_cleanup()
+    assert not res["leader"] and res["mirrored"] == 2 and res["deleted"] == 0
+    assert "503" in repo.lease.last_error and rtdb.get(["molitura", "old"]) is not None
+
+    monkeypatch.setattr(fb, "read_node", real)
+    res = repo.mirror_and_cleanup()
+    assert res["leader"] and res["deleted"] == 1 and repo.lease.last_error is None
+    repo.sql.close()
+
+
+def test_follower_full_mirror(rtdb, make_fb, tmp_path):
+    now = datetime.now(TZ)
+    old_ms = int((now - timedelta(days=4)).timestamp() * 1000)
+    new_ms = int((now - timedelta(hours=1)).timestamp() * 1000)
+    rtdb.load("molitura", [("old", {"name": "A", "weight": 1.0, "pagamento": "", "dataOra": old_ms}),
+                           ("new", {"name": "B", "weight": 2.0, "pagamento": "", "dataOra": new_ms})])
+    repos = []
+    for name in ("leader", "follower"):
+        fb = make_fb()
+        repo = _repo(fb, tmp_path / f"{name}.db", mirror_lookback_hours=48)
+        repo.attach_lease(LeaderLease(fb, PATH, holder=name, ttl_s=60))
+        repos.append(repo)
+    leader, follower = repos
+    assert leader.mirror_and_cleanup()["leader"]
+    assert not follower.mirror_and_cleanup()["leader"]
+
+    # pagamento cambiato su un record oltre il margine incrementale (48 h)
+    rtdb.write(["molitura", "old", "pagamento"], "POS", "put")
+    follower.mirror_and_cleanup()
+    assert follower.sql.fetch_range(old_ms, old_ms)[0].pagamento == ""
+    follower.sql.set_state("mirror_full_at", 0)  # è ora della copia completa
+    follower.mirror_and_cleanup()
+    assert follower.sql.fetch_range(old_ms, old_ms)[0].pagamento == "POS"
+    for repo in repos:
+        repo.sql.close()
@@ -0,0 +1,78 @@
+import pytest
+
+QtCore = pytest.importorskip("PyQt6.QtCore")
+from app_frantoio.core.record import Molitura  # noqa: E402
+from app_frantoio.models.moliture_model import MolitureModel  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def qt_app():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    yield app
+
+
+def _row(i: int, pagamento: str = "") -> Molitura:
+    return Molitura(f"r{i:03d}", f"Cliente {i}", 100.0 + i, pagamento, 1_000_000 + i * 1000, "firebase")
+
+
+class _Signals:
+    """Registra i segnali del modello: (tipo, primo, ultimo)."""
+
+    def __init__(self, model):
+        self.events = []
+        model.rowsInserted.connect(lambda _p, a, b: self.events.append(("ins", a, b)))
+        model.rowsRemoved.connect(lambda _p, a, b: self.events.append(("rem", a, b)))
+        model.dataChanged.connect(lambda a, b, _r: self.events.append(("chg", a.row(), b.row())))
+        model.modelReset.connect(lambda: self.events.append(("reset", -1, -1)))
+
+
+def _ids(model):
+    return [model.row_at(i).id for i in range(model.rowCount())]
+
+
+def test_unchanged_rows_emit_nothing():
+    model = MolitureModel([_row(i) for i in range(10)], 0.3)
+    sig = _Signals(model)
+    assert not model.set_rows([_row(i) for i in range(10)])
+    assert sig.events == []
+
+
+def test_insert_remove_update_without_reset():
+    model = MolitureModel([_row(i) for i in range(10)], 0.3)
+    sig = _Signals(model)
+    new = [_row(i) for i in range(10) if i not in (2, 3, 7)]  # rimossi 2, 3 e 7
+    new[0] = _row(0, "POS")                                     # modificato
+    new += [_row(10), _row(11)]                                  # aggiunti in coda
+    new.sort(key=lambda r: r.dataOra)
+    assert model.set_rows(new)
+    assert _ids(model) == [r.id for r in new]
+    kinds = [e[0] for e in sig.events]
+    assert "reset" not in kinds
+    assert ("rem", 7, 7) in sig.events and ("rem", 2, 3) in sig.events
+    assert ("ins", 7, 8) in sig.events and ("chg", 0, 0) in sig.events
+    assert model.row_at(0).pagamento == "POS" and model.row_index("r011") == 8
+
+
+def test_reorder_falls_back_to_reset():
+    model = MolitureModel([_row(i) for i in range(5)], 0.3)
+    sig = _Signals(model)
+    model.set_rows(list(reversed([_row(i) for i in range(5)])))
+    assert [e[0] for e in sig.events] == ["reset"]
+    assert _ids(model) == [f"r{i:03d}" for i in reversed(range(5))]
+
+
+def test_apply_changes_and_totals():
+    model = MolitureModel([_row(i) for i in range(5)], 0.3)
+    model.apply_changes([_row(1, "Contanti"), _row(9)], ["r003"])
+    assert _ids(model) == ["r000", "r001", "r002", "r004", "r009"]
+    assert model.row_at(1).pagamento == "Contanti"
+    n, kg = model.totals()
+    assert n == 5 and kg == pytest.approx(sum(100.0 + i for i in (0, 1, 2, 4, 9)))
+
+
+def test_set_pagamento_single_signal():
+    model = MolitureModel([_row(i) for i in range(5)], 0.3)
+    sig = _Signals(model)
+    model.set_pagamento(["r001", "r003", "assente"], "POS")
+    assert sig.events == [("chg", 1, 3)]
+    assert [model.row_at(i).pagamento for i in range(5)] == ["", "POS", "", "POS", ""]
@@ -0,0 +1,92 @@
+import pytest
+import requests
+from app_frantoio.core.outbox import DELETE, PAGAMENTO, Outbox
+from app_frantoio.core.record import Molitura
+
+
+def _node(ts: int, pagamento: str = ""):
+    return {"name": "Rossi", "weight": 100.0, "pagamento": pagamento, "dataOra": ts}
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status}", response=resp)
+
+
+@pytest.fixture
+def outbox(rtdb, fb, sql):
+    rtdb.load("molitura", [(f"r{i}", _node(1000 + i)) for i in range(10)])
+    return Outbox(fb, sql)
+
+
+def test_coalesce():
+    merged = Outbox._coalesce([
+        (1, "a", PAGAMENTO, "POS"), (2, "a", PAGAMENTO, "Contanti"),   # vince l'ultimo
+        (3, "b", DELETE, None), (4, "b", PAGAMENTO, "POS"),            # la cancellazione prevale
+        (5, "c", PAGAMENTO, "POS"), (6, "c", DELETE, None),
+    ])
+    assert merged == {"a": (2, PAGAMENTO, "Contanti"), "b": (4, DELETE, None), "c": (6, DELETE, None)}
+
+
+def test_overlay(outbox):
+    outbox.add_many([("r1", PAGAMENTO, "POS"), ("r2", DELETE, None)])
+    rows = [Molitura(f"r{i}", "Rossi", 100.0, "", 1000 + i, "firebase") for i in range(4)]
+    out = outbox.overlay(rows)
+    assert [r.id for r in out] == ["r0", "r1", "r3"]
+    assert out[1].pagamento == "POS" and rows[1].pagamento == ""  # copia, non modifica
+
+
+def test_flush_one_patch(rtdb, outbox):
+    outbox.add_many([(f"r{i}", PAGAMENTO, "POS") for i in range(9)] + [("r9", DELETE, None)])
+    before = len(rtdb.requests)
+    res = outbox.flush()
+    assert res == {"sent": 10, "pending": 0, "rejected": [], "gone": []}
+    # controllo delle chiavi + un solo PATCH multi-path
+    assert [m for m, _ in rtdb.requests[before:]] == ["GET", "PATCH"]
+    assert rtdb.get(["molitura", "r3", "pagamento"]) == "POS"
+    assert rtdb.get(["molitura", "r9"]) is None
+    assert outbox.pending_count() == 0
+
+
+def test_flush_skips_deleted_nodes(rtdb, outbox):
+    rtdb.write(["molitura", "r1"], None, "put")  # cancellato da un altro PC
+    outbox.add_many([("r1", PAGAMENTO, "POS"), ("r2", PAGAMENTO, "POS")])
+    res = outbox.flush()
+    assert res["gone"] == ["r1"] and res["sent"] == 1
+    assert rtdb.get(["molitura", "r1"]) is None  # non ricreato con il solo pagamento
+
+
+def test_flush_rejected_one_by_one(rtdb, fb, outbox, monkeypatch):
+    real = fb.patch_multi
+
+    def patch(updates):
+        if "r1/pagamento" in updates:
+            raise _http_error(400)
+        return real(updates)
+    monkeypatch.setattr(fb, "patch_multi", patch)
+    outbox.add_many([("r1", PAGAMENTO, "X"), ("r2", PAGAMENTO, "POS"), ("r3", DELETE, None)])
+    res = outbox.flush()
+    assert res["rejected"] == ["r1"] and res["sent"] == 2
+    assert rtdb.get(["molitura", "r2", "pagamento"]) == "POS" and rtdb.get(["molitura", "r3"]) is None
+    assert outbox.pending_count() == 0 and outbox.last_error
+
+
+def test_flush_network_error_keeps_queue(rtdb, fb, outbox, monkeypatch):
+    outbox.add_many([("r1", PAGAMENTO, "POS")])
+    real = fb.patch_multi
+
+    def down(updates):
+        raise requests.ConnectionError("rete assente")
+    monkeypatch.setattr(fb, "patch_multi", down)
+    with pytest.raises(requests.ConnectionError):
+        outbox.flush()
+    assert outbox.pending_count() == 1 and "rete" in outbox.last_error
+    monkeypatch.setattr(fb, "patch_multi", real)
+    assert outbox.flush()["sent"] == 1
+    assert rtdb.get(["molitura", "r1", "pagamento"]) == "POS" and outbox.last_error is None
+
+
+def test_queue_survives_restart(fb, sql, outbox):
+    outbox.add_many([("r1", PAGAMENTO, "POS")])
+    assert Outbox(fb, sql).pending_count() == 1
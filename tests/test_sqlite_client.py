@@ -0,0 +1,137 @@
+import sqlite3
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import pytest
+from app_frantoio.core.record import Molitura
+from app_frantoio.core.sqlite_client import _MIGRATIONS, SQLiteClient, _sql_giorno, _sql_stagione
+from app_frantoio.util.time_utils import TZ, season_of
+
+LATEST = _MIGRATIONS[-1][0]
+
+
+def _ms(*args) -> int:
+    return int(datetime(*args, tzinfo=TZ).timestamp() * 1000)
+
+
+# attorno ai cambi d'ora (ultima domenica di marzo e di ottobre), alla mezzanotte
+# e al cambio di stagione (1 settembre)
+EDGES = [
+    _ms(2023, 3, 26, 0, 30), _ms(2023, 3, 26, 3, 30), _ms(2023, 10, 29, 0, 30), _ms(2023, 10, 29, 2, 30),
+    _ms(2024, 3, 31, 1, 59), _ms(2024, 10, 27, 23, 59), _ms(2024, 8, 31, 23, 59), _ms(2024, 9, 1, 0, 0),
+    _ms(2025, 1, 1, 0, 0), _ms(2025, 12, 31, 23, 59),
+]
+
+
+def _py_day(ts: int) -> date:
+    return datetime.fromtimestamp(ts / 1000, TZ).date()
+
+
+def _records():
+    rows = [Molitura(f"e{i}", f"Cliente {i % 3}", 10.0 + i, ("POS", "")[i % 2], ts, "sqlite")
+            for i, ts in enumerate(EDGES)]
+    t = _ms(2024, 10, 1, 8, 0)
+    rows += [Molitura(f"h{i}", "Rossi", 1.0, "Contanti", t + i * 3_600_000, "sqlite") for i in range(500)]
+    return rows
+
+
+def test_sql_keys_match_python():
+    con = sqlite3.connect(":memory:")
+    hour = 3_600_000
+    stamps = list(EDGES) + [ts + k * hour // 4 for ts in EDGES for k in range(-8, 9)]
+    for ts in stamps:
+        giorno, stagione = con.execute(f"SELECT {_sql_giorno('?1')}, {_sql_stagione('?1')}", (ts,)).fetchone()
+        assert giorno == _py_day(ts).isoformat(), ts
+        assert stagione == season_of(_py_day(ts)), ts
+
+
+def _legacy_db(path, rows):
+    """Archivio di una versione senza migrazioni: solo la tabella moliture."""
+    con = sqlite3.connect(str(path))
+    con.execute("CREATE TABLE moliture (id TEXT PRIMARY KEY, name TEXT, weight REAL, pagamento TEXT, dataOra INTEGER)")
+    con.executemany("INSERT INTO moliture VALUES (?,?,?,?,?)", [r.as_tuple() for r in rows])
+    con.commit()
+    con.close()
+
+
+def _expected(rows):
+    by_day, by_name = defaultdict(lambda: [0.0, 0]), defaultdict(lambda: [0.0, 0])
+    for r in rows:
+        d = _py_day(r.dataOra)
+        by_day[d.isoformat()][0] += r.weight
+        by_day[d.isoformat()][1] += 1
+        by_name[(season_of(d), r.name)][0] += r.weight
+        by_name[(season_of(d), r.name)][1] += 1
+    return by_day, by_name
+
+
+@pytest.mark.parametrize("start_version", [0, 1, 3, 6])
+def test_migrations_from_old_versions(tmp_path, start_version):
+    rows = _records()
+    path = tmp_path / "old.db"
+    _legacy_db(path, rows)
+    con = sqlite3.connect(str(path))
+    for target, statements in _MIGRATIONS:
+        if target > start_version:
+            break
+        for stmt in statements:
+            stmt(con) if callable(stmt) else con.execute(stmt)
+        con.execute(f"PRAGMA user_version={target}")
+    con.commit()
+    con.close()
+
+    sql = SQLiteClient(str(path))
+    assert sql._con.execute("PRAGMA user_version").fetchone()[0] == LATEST
+    by_day, by_name = _expected(rows)
+    got = {g: [kg, n] for g, kg, n in sql.totals_by_day(date(2023, 1, 1), date(2025, 12, 31))}
+    assert got == pytest.approx(dict(by_day))
+    for season in {s for s, _ in by_name}:
+        expected = {name: v for (s, name), v in by_name.items() if s == season}
+        assert {name: [kg, n] for name, kg, n in sql.totals_by_name(season)} == pytest.approx(expected)
+    sql.close()
+
+
+def test_plain_sqlite_writer_keeps_aggregates(sql):
+    # un altro programma che scrive su moliture senza passare dal client
+    con = sqlite3.connect(sql.db_path)
+    ts = _ms(2024, 10, 27, 2, 30)
+    con.execute("INSERT INTO moliture VALUES ('x', 'Neri', 5.0, 'POS', ?)", (ts,))
+    con.execute("UPDATE moliture SET weight = 7.0 WHERE id = 'x'")
+    con.commit()
+    con.close()
+    assert sql.totals_by_day(_py_day(ts), _py_day(ts)) == [(_py_day(ts).isoformat(), 7.0, 1)]
+
+
+def test_upsert_update_delete_aggregates(sql):
+    rows = _records()
+    assert sql.upsert_many(rows) == len(rows)
+    assert sql.upsert_many(rows) == 0  # invariati: nessuna scrittura
+    sql.update_pagamento_many(["h0", "h1"], "POS")
+    sql.delete_many(["h2"])
+    season = season_of(date(2024, 10, 1))
+    pag = {p: (kg, n) for p, kg, n in sql.totals_by_pagamento(season)}
+    assert pag["Contanti"] == (497.0, 497) and pag["POS"][1] >= 2
+
+
+def test_fetch_page_keyset(sql):
+    rows = _records()
+    sql.upsert_many(rows)
+    expected = sorted((r.dataOra, r.id) for r in rows)
+    got, after = [], None
+    while True:
+        page = sql.fetch_page(0, 2 ** 62, after, 37)
+        got += [(r.dataOra, r.id) for r in page]
+        if len(page) < 37:
+            break
+        after = (page[-1].dataOra, page[-1].id)
+    assert got == expected
+
+
+def test_rollover_partitions(sql):
+    rows = _records()
+    sql.upsert_many(rows)
+    before = {s: sql.season_totals(s) for s in sql.seasons()}
+    moved = sql.rollover(2023)
+    assert moved == sum(1 for r in rows if season_of(_py_day(r.dataOra)) == 2023)
+    assert {s: sql.season_totals(s) for s in sql.seasons()} == before
+    assert len(sql.fetch_range(0, 2 ** 62)) == len(rows)
+    assert sum(len(c) for c in sql.iter_chunks()) == len(rows)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+from datetime import date, datetime
+from typing import TYPE_CHECKING, List, Sequence
+from PyQt6 import QtWidgets, QtCore
+from app_frantoio.ui.workers import BackgroundJob
+from app_frantoio.util.time_utils import TZ, season_of
+if TYPE_CHECKING:
+    from app_frantoio.core.repository import HybridRepository
+
+
+def _season_label(season: int) -> str:
+    return f"{season}/{(season + 1) % 100:02d}"
+
+
+class DashboardDialog(QtWidgets.QDialog):
+    """Statistiche di stagione lette dalle tabelle aggregate dell'archivio
+    (kg, conferimenti e incasso per giorno, cliente e metodo di pagamento).
+    L'incasso è kg × euro_per_kg, calcolato alla lettura."""
+
+    def __init__(self, repo: HybridRepository, euro_per_kg: float, parent=None):
+        super().__init__(parent)
+        self.repo = repo
+        self.euro_per_kg = float(euro_per_kg)
+        self.setWindowTitle("Statistiche stagione")
+        self.resize(640, 480)
+        layout = QtWidgets.QVBoxLayout(self)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addWidget(QtWidgets.QLabel("Stagione:"))
+        self.cmb_season = QtWidgets.QComboBox()
+        top.addWidget(self.cmb_season)
+        top.addStretch(1)
+        self.lbl_kg = QtWidgets.QLabel("")
+        self.lbl_n = QtWidgets.QLabel("")
+        self.lbl_euro = QtWidgets.QLabel("")
+        for lbl in (self.lbl_kg, self.lbl_n, self.lbl_euro):
+            top.addWidget(lbl)
+        layout.addLayout(top)
+
+        self.tabs = QtWidgets.QTabWidget()
+        self.tbl_name = self._make_table("Cliente")
+        self.tbl_pagamento = self._make_table("Pagamento")
+        self.tbl_day = self._make_table("Giorno")
+        self.tabs.addTab(self.tbl_name, "Per cliente")
+        self.tabs.addTab(self.tbl_pagamento, "Per pagamento")
+        self.tabs.addTab(self.tbl_day, "Per giorno")
+        layout.addWidget(self.tabs)
+
+        btns = QtWidgets.QHBoxLayout()
+        btns.addStretch(1)
+        btn_close = QtWidgets.QPushButton("Chiudi")
+        btn_close.clicked.connect(self.accept)
+        btns.addWidget(btn_close)
+        layout.addLayout(btns)
+
+        self._job = BackgroundJob(parent=self)
+        self._job.finished.connect(self._on_loaded)
+        self._job.failed.connect(self._on_failed)
+
+        current = season_of(datetime.now(TZ).date())
+        seasons = sorted(set(repo.seasons()) | {current}, reverse=True)
+        for s in seasons:
+            self.cmb_season.addItem(_season_label(s), s)
+        self.cmb_season.setCurrentIndex(seasons.index(current))
+        self.cmb_season.currentIndexChanged.connect(self.reload)
+        self.reload()
+
+    @staticmethod
+    def _make_table(first_header: str) -> QtWidgets.QTableWidget:
+        t = QtWidgets.QTableWidget(0, 4)
+        t.setHorizontalHeaderLabels([first_header, "Kg", "Conferimenti", "Incasso €"])
+        t.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        t.verticalHeader().setVisible(False)
+        t.horizontalHeader().setStretchLastSection(True)
+        return t
+
+    def reload(self, *_):
+        season = self.cmb_season.currentData()
+        if season is None:
+            return
+        self._job.submit(season, lambda: self.repo.season_summary(season))
+
+    def _on_loaded(self, season, res):
+        self.lbl_kg.setText(f"Totale kg: {res['kg']:.2f}")
+        self.lbl_n.setText(f"Conferimenti: {res['n']}")
+        self.lbl_euro.setText(f"Incasso: € {res['kg'] * self.euro_per_kg:.2f}")
+        self._fill(self.tbl_name, res["by_name"])
+        self._fill(self.tbl_pagamento, [(p or "(non indicato)", kg, n) for p, kg, n in res["by_pagamento"]])
+        self._fill(self.tbl_day, [(date.fromisoformat(g).strftime("%d/%m/%Y"), kg, n)
+                                  for g, kg, n in res["by_day"]])
+
+    def _on_failed(self, _season, e):
+        QtWidgets.QMessageBox.critical(self, "Errore", f"Lettura statistiche fallita:\n{e}")
+
+    def _fill(self, table: QtWidgets.QTableWidget, rows: List[Sequence]):
+        table.setSortingEnabled(False)
+        table.setRowCount(len(rows))
+        right = QtCore.Qt.AlignmentFlag.AlignRight | QtCore.Qt.AlignmentFlag.AlignVCenter
+        for i, (label, kg, n) in enumerate(rows):
+            cells = [
+                QtWidgets.QTableWidgetItem(str(label)),
+                QtWidgets.QTableWidgetItem(),
+                QtWidgets.QTableWidgetItem(),
+                QtWidgets.QTableWidgetItem(),
+            ]
+            # valori numerici (non testo): l'ordinamento per colonna resta numerico
+            cells[1].setData(QtCore.Qt.ItemDataRole.DisplayRole, round(float(kg), 2))
+            cells[2].setData(QtCore.Qt.ItemDataRole.DisplayRole, int(n))
+            cells[3].setData(QtCore.Qt.ItemDataRole.DisplayRole, round(float(kg) * self.euro_per_kg, 2))
+            for c, item in enumerate(cells):
+                if c:
+                    item.setTextAlignment(right)
+                table.setItem(i, c, item)
+        table.setSortingEnabled(True)
+        table.resizeColumnsToContents()
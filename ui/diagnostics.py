@@ -0,0 +1,107 @@
+from __future__ import annotations
+import time
+from typing import TYPE_CHECKING
+from PyQt6 import QtWidgets, QtCore, QtGui
+from app_frantoio.util.metrics import Metrics, Profiler
+if TYPE_CHECKING:
+    from app_frantoio.core.repository import HybridRepository
+
+_COLS = ["Tipo", "Nome", "N", "Errori", "Media ms", "p50 ms", "p95 ms", "Max ms", "Righe", "KB"]
+
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    """Misure raccolte da METRICS (repository, HTTP, SQLite, modello e vista),
+    aggiornate ogni secondo, più l'interruttore della profilazione cProfile su
+    refresh_data/auto_sync e il report dell'ultima profilazione."""
+
+    def __init__(self, metrics: Metrics, profiler: Profiler, repo: HybridRepository, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.profiler = profiler
+        self.repo = repo
+        self.setWindowTitle("Diagnostica")
+        self.resize(900, 600)
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.lbl = QtWidgets.QLabel("")
+        self.lbl.setTextInteractionFlags(QtCore.Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(self.lbl)
+
+        self.table = QtWidgets.QTableWidget(0, len(_COLS))
+        self.table.setHorizontalHeaderLabels(_COLS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(
+            1, QtWidgets.QHeaderView.ResizeMode.Stretch)
+
+        self.report = QtWidgets.QPlainTextEdit()
+        self.report.setReadOnly(True)
+        self.report.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.SystemFont.FixedFont))
+        self.report.setPlaceholderText("Attiva la profilazione e aggiorna i dati o attendi una sync.")
+        split = QtWidgets.QSplitter(QtCore.Qt.Orientation.Vertical)
+        split.addWidget(self.table)
+        split.addWidget(self.report)
+        split.setSizes([380, 200])
+        layout.addWidget(split)
+
+        btns = QtWidgets.QHBoxLayout()
+        self.chk_profile = QtWidgets.QCheckBox("Profila refresh e sync (cProfile)")
+        self.chk_profile.setChecked(profiler.enabled)
+        self.btn_reset = QtWidgets.QPushButton("Azzera")
+        self.btn_close = QtWidgets.QPushButton("Chiudi")
+        btns.addWidget(self.chk_profile)
+        btns.addStretch(1)
+        btns.addWidget(self.btn_reset)
+        btns.addWidget(self.btn_close)
+        layout.addLayout(btns)
+
+        self.chk_profile.toggled.connect(self.profiler.set_enabled)
+        self.btn_reset.clicked.connect(self._reset)
+        self.btn_close.clicked.connect(self.close)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(1000)
+        self._timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self._timer.start()
+        self.refresh()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._timer.stop()
+        super().hideEvent(event)
+
+    def _reset(self):
+        self.metrics.reset()
+        self.refresh()
+
+    def refresh(self):
+        rows = self.metrics.summary()
+        self.table.setRowCount(len(rows))
+        for i, s in enumerate(rows):
+            timed = s["kind"] != "count"
+            values = [s["kind"], s["name"], s["n"], s["errors"] if timed else "",
+                      *(f"{s[k]:.1f}" if timed else "" for k in ("avg_ms", "p50_ms", "p95_ms", "max_ms")),
+                      s["rows"] if timed else "", f"{s['bytes'] / 1024:.1f}" if timed else ""]
+            for c, v in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(str(v))
+                if c >= 2:
+                    item.setTextAlignment(int(QtCore.Qt.AlignmentFlag.AlignRight |
+                                              QtCore.Qt.AlignmentFlag.AlignVCenter))
+                self.table.setItem(i, c, item)
+
+        cache = self.repo.cache_stats()
+        parts = [f"Dal {time.strftime('%H:%M:%S', time.localtime(self.metrics.since))}",
+                 f"cache giorni: {cache.get('hits', 0)} hit / {cache.get('misses', 0)} miss",
+                 f"modifiche in coda: {self.repo.outbox.pending_count()}"]
+        if self.metrics.log_path is not None:
+            parts.append(f"log: {self.metrics.log_path}")
+        self.lbl.setText("  ·  ".join(parts))
+
+        report = self.profiler.last_report
+        if self.profiler.last_file is not None:
+            report = f"{self.profiler.last_file}\n{report}"
+        if report != self.report.toPlainText():
+            self.report.setPlainText(report)
@@ -1,13 +1,20 @@
 from __future__ import annotations
 import os
+import threading
+import time
+from collections import deque
 from datetime import date, datetime
 from PyQt6 import QtWidgets, QtCore, QtGui
 from pathlib import Path
-import pandas as pd
 from app_frantoio.resources import resource_path
-from app_frantoio.models.moliture_model import MolitureModel
-from app_frantoio.util.time_utils import fmt_ts
-from typing import TYPE_CHECKING, Optional
+from app_frantoio.core.excel_export import ExportCancelled, export_sheets, sheets_by_day
+from app_frantoio.models.moliture_model import MolitureModel, PagedMolitureModel
+from app_frantoio.ui.refresh_scheduler import RefreshScheduler
+from app_frantoio.ui.workers import BackgroundJob
+from app_frantoio.util.config import appdata_dir
+from app_frantoio.util.metrics import METRICS, Profiler
+from app_frantoio.util.time_utils import day_bounds_ts_ms
+from typing import TYPE_CHECKING, Callable, Deque, Optional, Tuple
 if TYPE_CHECKING:
     from app_frantoio.core.repository import HybridRepository
     
@@ -78,6 +85,21 @@ class LoginDialog(QtWidgets.QDialog):
     def get_credentials(self):
         return self.email.text().strip(), self.passw.text().strip()
 
+class _StreamBridge(QtCore.QObject):
+    """Porta i delta dello stream SSE (thread di rete) nel thread della GUI."""
+    changed = QtCore.pyqtSignal(list, list)
+
+class _ProgressBridge(QtCore.QObject):
+    """Avanzamento dell'export (thread del pool) verso la barra di progresso."""
+    progress = QtCore.pyqtSignal(int, int)
+
+class _TimedTableView(QtWidgets.QTableView):
+    """QTableView che registra in METRICS la durata di ogni repaint."""
+    def paintEvent(self, event):
+        t0 = time.perf_counter()
+        super().paintEvent(event)
+        METRICS.record("ui", "view.paint", (time.perf_counter() - t0) * 1000, log=False)
+
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self, cfg, repo: HybridRepository):
         super().__init__()
@@ -85,6 +107,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.repo = repo
         self.euro_per_kg = float(cfg.get("euro_per_kg", 0.30))
         self.poll_ms = int(cfg.get("poll_ms", 3000))
+        # intervalli d'archivio con più record di così si sfogliano a pagine
+        self.paged_min_rows = int(cfg.get("paged_min_rows", 5000))
         self._export_path = None
 
         self.setWindowTitle("Gestione Moliture - PC")
@@ -94,26 +118,44 @@ class MainWindow(QtWidgets.QMainWindow):
         central = QtWidgets.QWidget(self)
         vbox = QtWidgets.QVBoxLayout(central)
 
-        # Barra controlli (solo data)
+        # Barra controlli: data singola o intervallo da/a
         controls = QtWidgets.QHBoxLayout()
         controls.addWidget(QtWidgets.QLabel("Data:"))
         self.date_edit = QtWidgets.QDateEdit(calendarPopup=True)
         self.date_edit.setDate(QtCore.QDate.currentDate())
         self.date_edit.setDisplayFormat("dd/MM/yyyy")
         controls.addWidget(self.date_edit)
+        self.chk_range = QtWidgets.QCheckBox("fino a")
+        self.date_to = QtWidgets.QDateEdit(calendarPopup=True)
+        self.date_to.setDate(QtCore.QDate.currentDate())
+        self.date_to.setDisplayFormat("dd/MM/yyyy")
+        self.date_to.setEnabled(False)
+        controls.addWidget(self.chk_range)
+        controls.addWidget(self.date_to)
         controls.addStretch(1)
         self.btn_refresh = QtWidgets.QPushButton("Aggiorna")
         self.btn_export = QtWidgets.QPushButton("Export Excel")
+        self.btn_stats = QtWidgets.QPushButton("Statistiche")
+        self.btn_search = QtWidgets.QPushButton("Cerca cliente")
+        self.btn_search.setShortcut(QtGui.QKeySequence.StandardKey.Find)
+        self.btn_diag = QtWidgets.QPushButton("Diagnostica")
+        self.btn_diag.setShortcut(QtGui.QKeySequence("F12"))
+        controls.addWidget(self.btn_search)
         controls.addWidget(self.btn_refresh)
         controls.addWidget(self.btn_export)
+        controls.addWidget(self.btn_stats)
+        controls.addWidget(self.btn_diag)
         vbox.addLayout(controls)
 
         # Tabella
-        self.table = QtWidgets.QTableView()
-        self.model = MolitureModel([], self.euro_per_kg, self)
+        self.table = _TimedTableView()
+        self._list_model = MolitureModel([], self.euro_per_kg, self)
+        self._paged_model = PagedMolitureModel(self.euro_per_kg, int(cfg.get("page_rows", 500)), parent=self)
+        self._paged_key = None  # (vista, righe, kg) mostrati dal modello a pagine
+        self.model = self._list_model
         self.table.setModel(self.model)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
         self.table.horizontalHeader().setStretchLastSection(True)
         vbox.addWidget(self.table)
 
@@ -125,9 +167,9 @@ class MainWindow(QtWidgets.QMainWindow):
         footer.addWidget(QtWidgets.QLabel("Pagamento rapido:"))
         self.cmb_pagamento_quick = QtWidgets.QComboBox()
         self.cmb_pagamento_quick.addItems(["", "Contanti", "POS", "Assegno", "Olio"])
-        self.btn_set_pagamento = QtWidgets.QPushButton("Imposta su riga selezionata")
-        # Pulsante Cancella record
-        self.btn_delete_row = QtWidgets.QPushButton("Cancella record selezionato")
+        self.btn_set_pagamento = QtWidgets.QPushButton("Imposta sulle righe selezionate")
+        # Pulsante Cancella record (anche più righe selezionate)
+        self.btn_delete_row = QtWidgets.QPushButton("Cancella record selezionati")
 
         footer.addWidget(self.cmb_pagamento_quick)
         footer.addWidget(self.btn_set_pagamento)
@@ -136,10 +178,48 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.setCentralWidget(central)
 
-        # Timer: refresh tabella
-        self.timer = QtCore.QTimer(self)
-        self.timer.setInterval(self.poll_ms)
-        self.timer.timeout.connect(self.refresh_data)
+        # Lavori in background: lettura del giorno e sync non bloccano la GUI
+        self._refresh_job = BackgroundJob(parent=self)
+        self._refresh_job.finished.connect(self._on_refresh_done)
+        self._refresh_job.failed.connect(self._on_refresh_failed)
+        self._sync_job = BackgroundJob(parent=self)
+        self._sync_job.finished.connect(self._on_sync_done)
+        self._sync_job.failed.connect(self._on_sync_failed)
+        self._sync_progress = _ProgressBridge(self)
+        self._sync_progress.progress.connect(self._on_sync_progress)
+        self._export_job = BackgroundJob(parent=self)
+        self._export_job.finished.connect(self._on_export_done)
+        self._export_job.failed.connect(self._on_export_failed)
+        self._export_progress: Optional[QtWidgets.QProgressDialog] = None
+        self._maint_job = BackgroundJob(parent=self)
+        self._maint_job.finished.connect(self._on_maintenance_done)
+        self._maint_job.failed.connect(self._on_maintenance_failed)
+        self._outbox_job = BackgroundJob(parent=self)
+        self._outbox_job.finished.connect(self._on_flush_done)
+        self._outbox_job.failed.connect(self._on_flush_failed)
+        # modifiche dell'utente: la vista cambia subito, archivio e coda vengono
+        # scritti in ordine da un thread (il lock di SQLite può tenerlo una sync)
+        self._writes: Deque[Callable[[], bool]] = deque()
+        self._write_job = BackgroundJob(parent=self)
+        self._write_job.finished.connect(self._on_writes_done)
+        self._write_job.failed.connect(self._on_write_failed)
+
+        # Outbox: le modifiche ravvicinate partono insieme dopo una breve pausa;
+        # se l'invio fallisce si riprova periodicamente
+        self.flush_timer = QtCore.QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(int(cfg.get("outbox_flush_delay_ms", 500)))
+        self.flush_timer.timeout.connect(self.flush_outbox)
+        self.retry_timer = QtCore.QTimer(self)
+        self.retry_timer.setInterval(int(cfg.get("outbox_retry_s", 15)) * 1000)
+        self.retry_timer.timeout.connect(self._on_outbox_retry)
+
+        # Refresh tabella: polling adattivo (fermo con la finestra nascosta, più rado
+        # senza novità, sull'archivio solo quando cambia); con lo stream niente polling
+        self.scheduler = RefreshScheduler(self.poll_ms, int(cfg.get("poll_max_ms", 30000)),
+                                          repo.archive_version,
+                                          remote=getattr(repo, "stream", None) is None, parent=self)
+        self.scheduler.due.connect(self._on_poll)
 
         # Timer: mirror + cleanup automatico
         self.sync_timer = QtCore.QTimer(self)
@@ -147,145 +227,301 @@ class MainWindow(QtWidgets.QMainWindow):
         self.sync_timer.setInterval(minutes * 60 * 1000)
         self.sync_timer.timeout.connect(self.auto_sync)
 
+        # Timer: manutenzione dell'archivio (fuori orario di lavoro, una volta al giorno)
+        self.maint_timer = QtCore.QTimer(self)
+        self.maint_timer.setInterval(15 * 60 * 1000)
+        self.maint_timer.timeout.connect(self.maybe_maintenance)
+
         # Signals
         self.date_edit.dateChanged.connect(self.refresh_data)
+        self.date_to.dateChanged.connect(self.refresh_data)
+        self.chk_range.toggled.connect(self._on_range_toggled)
         self.btn_refresh.clicked.connect(self.refresh_data)
         self.btn_export.clicked.connect(self.export_excel)
+        self.btn_stats.clicked.connect(self.show_dashboard)
+        self.btn_search.clicked.connect(self.show_search)
+        self._search_dialog = None
+        self.btn_diag.clicked.connect(self.show_diagnostics)
+        self._diag_dialog = None
+        # profilazione a campione di refresh/sync, attivabile dal pannello Diagnostica
+        self.profiler = Profiler(appdata_dir() / "profiles", every=int(cfg.get("profile_every", 1)))
         self.btn_set_pagamento.clicked.connect(self.on_set_pagamento_clicked)
         self.btn_delete_row.clicked.connect(self.on_delete_clicked)
 
+        # Streaming SSE (opzionale): i giorni su Firebase si aggiornano a delta, senza polling
+        self._stream = getattr(repo, "stream", None)
+        if self._stream is not None:
+            self._stream_bridge = _StreamBridge(self)
+            self._stream_bridge.changed.connect(self._on_stream_change)
+            self._stream.on_change = self._stream_bridge.changed.emit
+            self._stream.start()
+
         # Avvio
         QtCore.QTimer.singleShot(200, self.refresh_data)
         QtCore.QTimer.singleShot(1000, self.auto_sync)  # prima sync subito dopo l'avvio
-        self.timer.start()
+        QtCore.QTimer.singleShot(500, self.flush_outbox)  # modifiche rimaste in coda
         self.sync_timer.start()
+        self.retry_timer.start()
+        self.maint_timer.start()
+
+    # ---- visibilità: a finestra nascosta o ridotta a icona non si rilegge nulla ----
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.scheduler.set_active(not self.isMinimized())
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.scheduler.set_active(False)
+
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.Type.WindowStateChange:
+            self.scheduler.set_active(self.isVisible() and not self.isMinimized())
+        super().changeEvent(event)
+
+    def _on_stream_change(self, changed, removed):
+        if self.model is not self._list_model:
+            return  # vista a pagine sull'archivio: i delta di Firebase non la riguardano
+        if self._writes_pending():
+            return  # finite le scritture locali si rilegge comunque tutto
+        start, end = self._view_range()
+        if not self.repo.is_firebase_day(end):
+            return
+        a_ms, b_ms = day_bounds_ts_ms(start)[0], day_bounds_ts_ms(end)[1]
+        # le modifiche non ancora inviate valgono anche sui delta dello stream
+        visible = self.repo.outbox.overlay(changed)
+        kept = {r.id for r in visible}
+        upserts, gone = [], list(removed) + [r.id for r in changed if r.id not in kept]
+        for r in visible:
+            if a_ms <= r.dataOra <= b_ms:
+                upserts.append(r)
+            else:
+                gone.append(r.id)
+        if upserts or gone:
+            self.model.apply_changes(upserts, gone)
+            self.update_total()
+
+    def closeEvent(self, event):
+        if self._stream is not None:
+            self._stream.stop()
+        if not self._write_job.is_running():
+            self._run_writes()  # modifiche in coda non ancora partite
+        if self.repo.lease is not None and not self._sync_job.is_running():
+            try:
+                self.repo.lease.release()  # un altro PC può subentrare subito
+            except Exception:
+                pass
+        super().closeEvent(event)
 
     # ---- Helpers per preservare selezione/scroll ----
     def _current_selected_id(self) -> Optional[str]:
         sel = self.table.selectionModel().selectedRows()
         if not sel:
             return None
-        row = self.model.row_at(sel[0].row())
-        return row.get("id")
+        return self.model.row_at(sel[0].row()).id
 
     def _reselect_by_id(self, rid: Optional[str]):
-        if not rid:
+        r_idx = self.model.row_index(rid) if rid else None
+        if r_idx is None:
             return
-        rows = self.model.all_rows()
-        for r_idx, r in enumerate(rows):
-            if r.get("id") == rid:
-                idx = self.model.index(r_idx, 0)
-                sm = self.table.selectionModel()
-                sm.select(
-                    idx,
-                    QtCore.QItemSelectionModel.SelectionFlag.ClearAndSelect |
-                    QtCore.QItemSelectionModel.SelectionFlag.Rows
-                )
-                self.table.setCurrentIndex(idx)
-                self.table.scrollTo(idx, QtWidgets.QAbstractItemView.ScrollHint.PositionAtCenter)
-                break
+        idx = self.model.index(r_idx, 0)
+        sm = self.table.selectionModel()
+        sm.select(
+            idx,
+            QtCore.QItemSelectionModel.SelectionFlag.ClearAndSelect |
+            QtCore.QItemSelectionModel.SelectionFlag.Rows
+        )
+        self.table.setCurrentIndex(idx)
+        self.table.scrollTo(idx, QtWidgets.QAbstractItemView.ScrollHint.PositionAtCenter)
 
     def _selected_date(self) -> date:
         qd = self.date_edit.date()
         return date(qd.year(), qd.month(), qd.day())
 
-    def refresh_data(self):
-        # memorizza selezione e scroll prima del reset
-        prev_id = self._current_selected_id()
-        vscroll = self.table.verticalScrollBar().value()
-
+    def _view_range(self) -> Tuple[date, date]:
+        """(da, a) della vista corrente; in modalità giorno singolo da == a."""
         d = self._selected_date()
-        try:
-            self._rows_for_day = self.repo.fetch_day(d)
-        except Exception as e:
-            self._rows_for_day = []
-            QtWidgets.QMessageBox.warning(self, "Lettura dati", f"Errore: {e}")
+        if not self.chk_range.isChecked():
+            return d, d
+        qd = self.date_to.date()
+        d2 = date(qd.year(), qd.month(), qd.day())
+        return (d, d2) if d <= d2 else (d2, d)
+
+    def _on_range_toggled(self, on: bool):
+        self.date_to.setEnabled(on)
+        self._list_model.set_show_date(on)
+        self.refresh_data()
 
-        rows = list(self._rows_for_day)
-        try:
-            rows.sort(key=lambda r: int(float(r.get("dataOra") or 0)))
-        except Exception:
-            pass
-
-        # aggiorna model
-        self.model.set_rows(rows)
-        self.update_total(rows)
-
-        # ripristina scroll e selezione
-        self.table.verticalScrollBar().setValue(vscroll)
-        self._reselect_by_id(prev_id)
-
-    def update_total(self, rows):
-        total = 0.0
-        for r in rows:
-            w = r.get("weight") or r.get("peso") or 0
-            try:
-                total += float(w)
-            except Exception:
-                pass
-        self.lbl_tot.setText(f"Totale kg: {total:.2f}")
+    def refresh_data(self, *_):
+        """Ricarica il giorno selezionato in background. Se una lettura è già in corso
+        la richiesta parte subito dopo; il risultato di un'altra data viene scartato."""
+        self._request_refresh(coalesce=True)
+
+    def _on_poll(self):
+        # tick dello scheduler: se la lettura precedente non è finita si salta
+        self._request_refresh(coalesce=False)
+
+    def _request_refresh(self, coalesce: bool):
+        start, end = self._view_range()
+        repo = self.repo
+        self.scheduler.set_archive(repo.is_archive_range(start, end))
+        if coalesce:
+            self.scheduler.kick()
+        paged_min = self.paged_min_rows
+
+        def fetch():
+            if start != end and repo.is_archive_range(start, end):
+                n, kg = repo.archive_totals(start, end)
+                if n > paged_min:
+                    return n, kg  # troppi record per una lista: vista a pagine
+            return repo.fetch_range(start, end)
+        fn = self.profiler.wrap("refresh_data", fetch)
+        self._refresh_job.submit((start, end), fn, coalesce=coalesce)
+
+    def _on_refresh_done(self, view, rows):
+        if view != self._view_range() or self._writes_pending():
+            return
+        if isinstance(rows, tuple):
+            changed = self._apply_paged(view, *rows)
+        else:
+            changed = self._apply_rows(list(rows))
+        self.scheduler.notify(changed)
+
+    def _use_model(self, model):
+        if self.model is not model:
+            self.model = model
+            old = self.table.selectionModel()
+            self.table.setModel(model)
+            old.deleteLater()
+            if model is not self._paged_model:
+                self._paged_key = None
+                self._paged_model.set_source(None)  # libera le finestre
+
+    def _on_refresh_failed(self, view, e: Exception):
+        if view != self._view_range() or self._writes_pending():
+            return
+        self._apply_rows([])
+        self.scheduler.notify(False)  # rete giù: si riprova sempre più di rado
+        self.statusBar().showMessage(f"Lettura dati: errore: {e}", 5000)
+
+    def _apply_rows(self, rows) -> bool:
+        self._use_model(self._list_model)
+        prev_id = self._current_selected_id()
+
+        rows.sort(key=lambda r: r.dataOra)
+
+        # aggiorna model: diff per id, selezione e scroll restano dove sono
+        changed = self.model.set_rows(rows)
+        self.update_total()
+
+        # solo se il modello ha dovuto fare un reset la selezione va ripristinata
+        if prev_id and self._current_selected_id() != prev_id:
+            self._reselect_by_id(prev_id)
+        return changed
+
+    def _apply_paged(self, view, n: int, kg: float) -> bool:
+        """Intervallo d'archivio grande: righe lette a finestre mentre si scorre.
+        Se righe e kg non sono cambiati dall'ultimo refresh la vista resta com'è."""
+        if self.model is self._paged_model and self._paged_key == (view, n, kg):
+            return False
+        start, end = view
+        repo = self.repo
+        self._paged_model.set_source(
+            lambda after, limit, blocking: repo.archive_page(start, end, after, limit, blocking), n, kg)
+        self._paged_key = (view, n, kg)
+        self._use_model(self._paged_model)
+        self.update_total()
+        return True
+
+    def update_total(self):
+        n, total = self.model.totals()
+        self.lbl_tot.setText(f"Totale kg: {total:.2f} ({n} conferimenti)")
 
     def auto_sync(self):
-        """Duplica tutto FB -> SQLite e cancella da FB > retention_days."""
-        try:
-            res = self.repo.mirror_and_cleanup()
-            self.statusBar().showMessage(
-                f"Sync eseguito: salvati {res['mirrored']} record su SQLite, "
-                f"cancellati {res['deleted']} oltre retention.",
-                5000
-            )
-        except Exception as e:
-            self.statusBar().showMessage(f"Sync fallito: {e}", 5000)
+        """Duplica tutto FB -> SQLite e cancella da FB > retention_days.
+        Gira in background; se una sync è già in corso questa viene saltata."""
+        if self._sync_job.is_running():
+            return
+        progress = self._sync_progress.progress.emit
+        fn = self.profiler.wrap("auto_sync", lambda: self.repo.mirror_and_cleanup(
+            progress=lambda n: progress(n, 0)))
+        self._sync_job.submit("sync", fn, coalesce=False)
+
+    def _on_sync_progress(self, deleted, _total):
+        self.statusBar().showMessage(f"Pulizia Firebase: {deleted} record spostati in archivio...", 5000)
+
+    def _on_sync_done(self, _key, res):
+        if res.get("leader", True):
+            msg = (f"Sync eseguito: salvati {res['mirrored']} record su SQLite, "
+                   f"cancellati {res['deleted']} oltre retention.")
+        elif self.repo.lease.last_error:
+            msg = (f"Sync eseguito: salvati {res['mirrored']} record su SQLite "
+                   f"(pulizia di Firebase saltata, lease non disponibile: {self.repo.lease.last_error}).")
+        else:
+            holder = (self.repo.lease.current or {}).get("host", "un altro PC")
+            msg = (f"Sync eseguito: salvati {res['mirrored']} record su SQLite "
+                   f"(pulizia di Firebase affidata a {holder}).")
+        self.statusBar().showMessage(msg, 5000)
+
+    def _on_sync_failed(self, _key, e):
+        self.statusBar().showMessage(f"Sync fallito: {e}", 5000)
+
+    def maybe_maintenance(self):
+        if self._maint_job.is_running() or self._sync_job.is_running():
+            return
+        if self.repo.maintenance_due():
+            self.statusBar().showMessage("Manutenzione archivio in corso...", 5000)
+            self._maint_job.submit("maintenance", self.repo.run_maintenance, coalesce=False)
+
+    def _on_maintenance_done(self, _key, res):
+        rolled = ", ".join(f"{s}/{s + 1}" for s in res["rolled"])
+        msg = f"Manutenzione archivio completata ({res['size_kb']} KB)"
+        if rolled:
+            msg += f"; stagioni archiviate: {rolled}"
+        self.statusBar().showMessage(msg, 8000)
+
+    def _on_maintenance_failed(self, _key, e):
+        self.statusBar().showMessage(f"Manutenzione archivio fallita: {e}", 8000)
+
+    def _selected_records(self):
+        return [self.model.row_at(i.row()) for i in self.table.selectionModel().selectedRows()]
 
     def on_set_pagamento_clicked(self):
         # Pausa auto-refresh per evitare flicker mentre aggiorni
-        self.timer.stop()
+        self.scheduler.stop()
         try:
-            idxs = self.table.selectionModel().selectedRows()
-            if not idxs:
+            rows = self._selected_records()
+            if not rows:
                 QtWidgets.QMessageBox.information(self, "Pagamento", "Seleziona una riga prima.")
                 return
-            idx = idxs[0]
-            row = self.model.row_at(idx.row())
             pagamento = self.cmb_pagamento_quick.currentText()
-            rid = row.get("id")
-            if not rid:
-                raise ValueError("ID mancante")
-            source = row.get("_source", "firebase")
-            self.repo.update_pagamento(rid, pagamento, source)
-            row["pagamento"] = pagamento
-            self.model.dataChanged.emit(
-                self.model.index(idx.row(), 4),
-                self.model.index(idx.row(), 4),
-                [QtCore.Qt.ItemDataRole.DisplayRole]
-            )
+            items = [(r.id, r.source) for r in rows]
+            self.model.set_pagamento([r.id for r in rows], pagamento)
+
+            def write():
+                # scrittura locale + coda: Firebase viene aggiornato dal flush in background
+                self.repo.update_pagamento_many(items, pagamento)
+                return any(source == "firebase" for _, source in items)
+            self._queue_write(write)
         except Exception as e:
             QtWidgets.QMessageBox.warning(self, "Errore aggiornamento", f"{e}")
         finally:
-            self.timer.start()
+            self.scheduler.start()
 
     def on_delete_clicked(self):
-        idxs = self.table.selectionModel().selectedRows()
-        if not idxs:
+        rows = self._selected_records()
+        if not rows:
             QtWidgets.QMessageBox.information(self, "Cancella", "Seleziona una riga prima.")
             return
-
-        idx = idxs[0]
-        row = self.model.row_at(idx.row())
-        rid = row.get("id")
-        if not rid:
+        if any(not r.id for r in rows):
             QtWidgets.QMessageBox.warning(self, "Cancella", "ID record mancante.")
             return
 
-        name = row.get("name") or row.get("nome") or ""
-        w = row.get("weight") or row.get("peso") or 0
-        try:
-            w = float(w)
-        except Exception:
-            w = 0.0
-        when = fmt_ts(row.get("dataOra"))
-
-        msg = f"Vuoi cancellare il record selezionato?\n\nNome: {name}\nPeso: {w:.2f} kg\nOra: {when}"
+        if len(rows) == 1:
+            row = rows[0]
+            msg = f"Vuoi cancellare il record selezionato?\n\nNome: {row.name}\nPeso: {row.weight:.2f} kg\nOra: {row.ora}"
+        else:
+            kg = sum(r.weight for r in rows)
+            msg = f"Vuoi cancellare i {len(rows)} record selezionati?\n\nPeso totale: {kg:.2f} kg"
         reply = QtWidgets.QMessageBox.question(
             self,
             "Conferma cancellazione",
@@ -295,36 +531,129 @@ class MainWindow(QtWidgets.QMainWindow):
         if reply != QtWidgets.QMessageBox.StandardButton.Yes:
             return
 
-        try:
-            source = row.get("_source", "firebase")
-            self.repo.delete_record(rid, source)
-        except Exception as e:
-            QtWidgets.QMessageBox.warning(self, "Errore cancellazione", str(e))
-            return
-
-        self.refresh_data()
-        self.statusBar().showMessage("Record cancellato.", 3000)
-
-    # Export (stesso file, foglio = data selezionata, celle centrate + autofit)
+        items = [(r.id, r.source) for r in rows]
+
+        def write():
+            self.repo.delete_many(items)
+            return any(source == "firebase" for _, source in items)
+        self._queue_write(write)
+        # la vista a pagine si rilegge dagli aggregati quando la cancellazione è scritta
+        if self.model is not self._paged_model:
+            self.model.apply_changes([], [r.id for r in rows])
+            self.update_total()
+        self.statusBar().showMessage(
+            "Record cancellato." if len(rows) == 1 else f"{len(rows)} record cancellati.", 3000)
+
+    # ---- Scritture locali (archivio + outbox) in background ----
+    def _queue_write(self, write: Callable[[], bool]):
+        """Accoda una modifica dell'utente (già mostrata nella vista). write() torna
+        True se tocca record su Firebase, da inviare poi con il flush."""
+        self._writes.append(write)
+        self._refresh_job.invalidate()  # una lettura in volo avrebbe i valori vecchi
+        self._write_job.submit("write", self._run_writes, coalesce=True)
+
+    def _writes_pending(self) -> bool:
+        return bool(self._writes) or self._write_job.is_running()
+
+    def _run_writes(self) -> bool:
+        """Nel thread di lavoro: esegue le modifiche in coda nell'ordine dei clic."""
+        firebase = False
+        while self._writes:
+            firebase = self._writes.popleft()() or firebase
+        return firebase
+
+    def _on_writes_done(self, _key, firebase):
+        if firebase:
+            self.flush_timer.start()
+        if not self._writes_pending():
+            self.refresh_data()  # le letture scartate nel frattempo
+
+    def _on_write_failed(self, _key, e):
+        QtWidgets.QMessageBox.warning(self, "Errore salvataggio", f"Modifica non salvata: {e}")
+        if self.repo.outbox.pending_count():
+            self.flush_timer.start()  # quelle scritte prima dell'errore
+        if self._writes:
+            self._write_job.submit("write", self._run_writes, coalesce=True)
+        else:
+            self.refresh_data()  # la vista torna ai valori dell'archivio
+
+    # ---- Outbox (modifiche a Firebase in coda) ----
+    def flush_outbox(self):
+        if self.repo.outbox.pending_count():
+            self._outbox_job.submit("flush", self.repo.flush_outbox, coalesce=True)
+
+    def _on_outbox_retry(self):
+        if not self._outbox_job.is_running():
+            self.flush_outbox()
+
+    def _on_flush_done(self, _key, res):
+        if res["rejected"]:
+            QtWidgets.QMessageBox.warning(
+                self, "Modifiche non salvate",
+                f"Firebase ha rifiutato {len(res['rejected'])} modifiche:\n{self.repo.outbox.last_error}")
+            self.refresh_data()
+        elif res["gone"]:
+            self.statusBar().showMessage(
+                f"{len(res['gone'])} pagamenti non inviati: record non più presenti su Firebase.", 10000)
+            self.refresh_data()
+        elif res["sent"]:
+            self.statusBar().showMessage(f"Inviate {res['sent']} modifiche a Firebase.", 3000)
+
+    def _on_flush_failed(self, _key, e):
+        n = self.repo.outbox.pending_count()
+        self.statusBar().showMessage(f"{n} modifiche in attesa di invio (nuovo tentativo a breve): {e}", 10000)
+
+    def show_search(self):
+        if self._search_dialog is None:
+            from app_frantoio.ui.search_dialog import SearchDialog
+            self._search_dialog = SearchDialog(self.repo, self.euro_per_kg, self)
+            self._search_dialog.day_selected.connect(self._go_to_day)
+        self._search_dialog.show()
+        self._search_dialog.raise_()
+        self._search_dialog.activateWindow()
+
+    def _go_to_day(self, d: date):
+        self.chk_range.setChecked(False)
+        self.date_edit.setDate(QtCore.QDate(d.year, d.month, d.day))
+
+    def show_diagnostics(self):
+        if self._diag_dialog is None:
+            from app_frantoio.ui.diagnostics import DiagnosticsDialog
+            self._diag_dialog = DiagnosticsDialog(METRICS, self.profiler, self.repo, self)
+        self._diag_dialog.show()
+        self._diag_dialog.raise_()
+        self._diag_dialog.activateWindow()
+
+    def show_dashboard(self):
+        from app_frantoio.ui.dashboard import DashboardDialog
+        DashboardDialog(self.repo, self.euro_per_kg, self).exec()
+
+    # Export (stesso file, un foglio per giorno, celle centrate + autofit)
     def export_excel(self):
-        rows = self.model.all_rows()
-        if not rows:
+        fallback = self._view_range()[0].strftime("%d.%m.%Y")
+        if self.model is self._paged_model:
+            # vista a pagine: i record si estraggono a blocchi nel thread dell'export,
+            # un giorno alla volta in memoria
+            n = self.model.totals()[0]
+            (start, end), repo = self._paged_key[0], self.repo
+
+            def sheets():
+                return sheets_by_day(repo.iter_archive(start, end), fallback)
+        else:
+            rows = self.model.all_rows()
+            n = len(rows)
+            # vista su più giorni: un foglio per giorno, tutti nello stesso passaggio
+            by_day = {}
+            for r in rows:
+                by_day.setdefault(r.giorno.replace("/", ".") or fallback, []).append(r)
+
+            def sheets():
+                return list(by_day.items())
+        if not n:
             QtWidgets.QMessageBox.information(self, "Export", "Nessun dato da esportare.")
             return
-
-        d = self._selected_date()
-        sheet_name = d.strftime("%d.%m.%Y")
-
-        df = pd.DataFrame(rows)
-        if "name" not in df.columns and "nome" in df.columns:
-            df["name"] = df["nome"]
-        if "weight" not in df.columns and "peso" in df.columns:
-            df["weight"] = df["peso"]
-
-        df["Ora"] = df.get("dataOra", "").apply(fmt_ts)
-        cols = [c for c in ["name", "weight", "Ora", "pagamento"] if c in df.columns]
-        df = df[cols]
-        df.columns = ["Nome", "Peso (Kg)", "Ora", "Metodo di Pagamento"]
+        if self._export_job.is_running():
+            return
 
         if not self._export_path:
             path, _ = QtWidgets.QFileDialog.getSaveFileName(
@@ -337,40 +666,37 @@ class MainWindow(QtWidgets.QMainWindow):
             self._export_path = path
         file_path = self._export_path
 
-        try:
-            from openpyxl import load_workbook
-            from openpyxl.utils import get_column_letter
-            from openpyxl.styles import Alignment
+        cancel = threading.Event()
+        progress = QtWidgets.QProgressDialog("Esportazione in corso...", "Annulla", 0, n, self)
+        progress.setWindowTitle("Export")
+        progress.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.canceled.connect(cancel.set)
+        bridge = _ProgressBridge(progress)
+        bridge.progress.connect(lambda done, _total: progress.setValue(done))
+        self._export_progress = progress
+
+        def _run():
+            return export_sheets(file_path, sheets(), progress=bridge.progress.emit,
+                                 cancelled=cancel.is_set, total=n)
+        self._export_job.submit(file_path, _run, coalesce=False)
+
+    def _close_export_progress(self):
+        if self._export_progress is not None:
+            self._export_progress.reset()
+            self._export_progress.deleteLater()
+            self._export_progress = None
+
+    def _on_export_done(self, file_path, names):
+        self._close_export_progress()
+        what = f"nel foglio '{names[0]}'" if len(names) == 1 else f"in {len(names)} fogli"
+        QtWidgets.QMessageBox.information(
+            self, "Export", f"Esportato {what} di {os.path.basename(file_path)}"
+        )
 
-            if os.path.exists(file_path):
-                with pd.ExcelWriter(file_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-                    df.to_excel(writer, index=False, sheet_name=sheet_name)
-            else:
-                with pd.ExcelWriter(file_path, engine="openpyxl") as writer:
-                    df.to_excel(writer, index=False, sheet_name=sheet_name)
-
-            wb = load_workbook(file_path)
-            ws = wb[sheet_name]
-
-            # Centra celle
-            for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-                for cell in row:
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-
-            # Auto-fit larghezza colonne
-            for col_idx in range(1, ws.max_column + 1):
-                col_letter = get_column_letter(col_idx)
-                max_len = 0
-                for cell in ws[col_letter]:
-                    text = "" if cell.value is None else str(cell.value)
-                    if len(text) > max_len:
-                        max_len = len(text)
-                ws.column_dimensions[col_letter].width = max_len + 2
-
-            wb.save(file_path)
-            QtWidgets.QMessageBox.information(
-                self, "Export",
-                f"Esportato nel foglio '{sheet_name}' di {os.path.basename(file_path)}"
-            )
-        except Exception as e:
-            QtWidgets.QMessageBox.warning(self, "Errore export", str(e))
+    def _on_export_failed(self, _file_path, e):
+        self._close_export_progress()
+        if isinstance(e, ExportCancelled):
+            self.statusBar().showMessage("Export annullato", 5000)
+            return
+        QtWidgets.QMessageBox.warning(self, "Errore export", str(e))
@@ -0,0 +1,98 @@
+from typing import Any, Callable
+from PyQt6 import QtCore
+
+
+class RefreshScheduler(QtCore.QObject):
+    """Decide quando rileggere la vista al posto di un timer fisso a poll_ms.
+
+    - finestra nascosta o ridotta a icona (set_active(False)): nessun tick; quando
+      torna visibile si rilegge subito;
+    - giorni su Firebase: polling a base_ms, che raddoppia a ogni lettura senza
+      novità (notify(False)) fino a max_ms e torna a base_ms alla prima novità;
+      con lo stream SSE (remote=False) il polling non serve;
+    - giorni d'archivio (set_archive(True)): ogni base_ms si confronta version()
+      (PRAGMA data_version + scritture locali), che non costa nulla, e si rilegge
+      solo se è cambiata.
+
+    Il segnale due chiede una lettura."""
+
+    due = QtCore.pyqtSignal()
+
+    def __init__(self, base_ms: int, max_ms: int, version: Callable[[], Any],
+                 remote: bool = True, parent=None):
+        super().__init__(parent)
+        self.base_ms = max(100, int(base_ms))
+        self.max_ms = max(self.base_ms, int(max_ms))
+        self.remote = remote
+        self._version = version
+        self._token: Any = None
+        self._archive = False
+        self._active = False
+        self._interval = self.base_ms
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._on_timeout)
+
+    @property
+    def interval_ms(self) -> int:
+        return self._interval
+
+    def set_active(self, on: bool):
+        """Finestra visibile o no; al ritorno si rilegge subito a ritmo pieno."""
+        if on == self._active:
+            return
+        self._active = on
+        if on:
+            self._interval = self.base_ms
+            self.due.emit()
+            self._arm()
+        else:
+            self._timer.stop()
+
+    def set_archive(self, on: bool):
+        """Vista tutta su giorni d'archivio (SQLite) o no."""
+        if on == self._archive:
+            return
+        self._archive = on
+        self._interval = self.base_ms
+        self._arm()
+
+    def kick(self):
+        """Lettura appena chiesta (cambio data, Aggiorna): si riparte da base_ms e,
+        per l'archivio, dalla versione attuale."""
+        self._interval = self.base_ms
+        if self._archive:
+            self._token = self._version()
+        self._arm()
+
+    def notify(self, changed: bool):
+        """Esito di una lettura: con novità si torna subito a base_ms, altrimenti
+        l'attesa raddoppia (fino a max_ms)."""
+        if changed:
+            if self._interval != self.base_ms:
+                self._interval = self.base_ms
+                self._arm()
+        elif not self._archive:
+            self._interval = min(self.max_ms, self._interval * 2)
+
+    def stop(self):
+        self._timer.stop()
+
+    def start(self):
+        self._arm()
+
+    def _arm(self):
+        if not self._active or not (self._archive or self.remote):
+            self._timer.stop()
+            return
+        self._timer.start(self.base_ms if self._archive else self._interval)
+
+    def _on_timeout(self):
+        if self._archive:
+            token = self._version()
+            if token is not None and token != self._token:
+                self._token = token
+                self.due.emit()
+        else:
+            self.due.emit()
+        self._arm()
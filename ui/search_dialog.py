@@ -0,0 +1,106 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+from PyQt6 import QtWidgets, QtCore
+from app_frantoio.models.moliture_model import MolitureModel
+from app_frantoio.ui.workers import BackgroundJob
+from app_frantoio.util.time_utils import TZ
+if TYPE_CHECKING:
+    from app_frantoio.core.repository import HybridRepository
+
+MIN_CHARS = 2
+LIMIT = 1000
+
+
+class SearchDialog(QtWidgets.QDialog):
+    """Ricerca dei conferimenti di un cliente su tutto l'archivio e sui giorni
+    ancora su Firebase.
+
+    La query parte (in background, dopo una breve pausa di digitazione) solo quando
+    il testo non è un'estensione dell'ultima ricerca completa: "ross" -> "rossi"
+    filtra i risultati già in memoria con il proxy, senza interrogare il database."""
+
+    # giorno scelto con doppio clic su un risultato
+    day_selected = QtCore.pyqtSignal(object)
+
+    def __init__(self, repo: HybridRepository, euro_per_kg: float, parent=None):
+        super().__init__(parent)
+        self.repo = repo
+        self.setWindowTitle("Cerca cliente")
+        self.resize(700, 500)
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.edit = QtWidgets.QLineEdit()
+        self.edit.setPlaceholderText(f"Nome del cliente (almeno {MIN_CHARS} caratteri)")
+        self.edit.setClearButtonEnabled(True)
+        layout.addWidget(self.edit)
+
+        self.model = MolitureModel([], euro_per_kg, self)
+        self.model.set_show_date(True)
+        self.proxy = QtCore.QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterKeyColumn(0)
+        self.proxy.setFilterCaseSensitivity(QtCore.Qt.CaseSensitivity.CaseInsensitive)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        self.lbl = QtWidgets.QLabel("")
+        layout.addWidget(self.lbl)
+
+        # testo per cui il modello contiene TUTTI i risultati (None: nessuno o troncati)
+        self._cached_query: Optional[str] = None
+        self._job = BackgroundJob(parent=self)
+        self._job.finished.connect(self._on_results)
+        self._job.failed.connect(self._on_failed)
+        self._debounce = QtCore.QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(250)
+        self._debounce.timeout.connect(self._query)
+
+        self.edit.textChanged.connect(self._on_text)
+        self.table.doubleClicked.connect(self._on_double_click)
+
+    def _on_text(self, text: str):
+        text = text.strip()
+        self.proxy.setFilterFixedString(text)
+        if len(text) < MIN_CHARS:
+            self._debounce.stop()
+            self._update_label()
+            return
+        cached = self._cached_query
+        if cached is not None and text.casefold().startswith(cached.casefold()):
+            # raffinamento: bastano i risultati già caricati
+            self._debounce.stop()
+            self._job.invalidate()
+            self._update_label()
+            return
+        self._debounce.start()
+
+    def _query(self):
+        text = self.edit.text().strip()
+        self.lbl.setText("Ricerca...")
+        self._job.submit(text, lambda: self.repo.search(text, LIMIT))
+
+    def _on_results(self, text, rows):
+        self.model.set_rows(rows)
+        self._cached_query = text if len(rows) < LIMIT else None
+        self._update_label()
+
+    def _on_failed(self, _text, e):
+        self.lbl.setText(f"Ricerca fallita: {e}")
+
+    def _update_label(self):
+        n = self.proxy.rowCount()
+        rows = [self.model.row_at(self.proxy.mapToSource(self.proxy.index(i, 0)).row()) for i in range(n)]
+        kg = sum(r.weight for r in rows)
+        more = "+" if self._cached_query is None and self.model.rowCount() >= LIMIT else ""
+        self.lbl.setText(f"{n}{more} conferimenti, {kg:.2f} kg")
+
+    def _on_double_click(self, index):
+        r = self.model.row_at(self.proxy.mapToSource(index).row())
+        if r.dataOra:
+            self.day_selected.emit(datetime.fromtimestamp(r.dataOra / 1000, TZ).date())
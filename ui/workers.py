@@ -0,0 +1,86 @@
+from typing import Any, Callable, Optional, Tuple
+from PyQt6 import QtCore
+
+
+class _TaskSignals(QtCore.QObject):
+    # key, epoch, risultato, eccezione
+    done = QtCore.pyqtSignal(object, int, object, object)
+
+
+class _Task(QtCore.QRunnable):
+    def __init__(self, key, epoch: int, fn: Callable[[], Any]):
+        super().__init__()
+        self.key = key
+        self.epoch = epoch
+        self.fn = fn
+        self.signals = _TaskSignals()
+
+    def run(self):
+        try:
+            res, exc = self.fn(), None
+        except Exception as e:
+            res, exc = None, e
+        try:
+            self.signals.done.emit(self.key, self.epoch, res, exc)
+        except RuntimeError:
+            pass  # finestra già chiusa: nessuno attende il risultato
+
+
+class BackgroundJob(QtCore.QObject):
+    """Esegue fn() su un QThreadPool, al massimo una alla volta, e consegna il
+    risultato nel thread della GUI tramite i segnali finished/failed.
+
+    - submit(coalesce=False): se un'esecuzione è in corso la richiesta viene scartata
+      (tick del timer, sync).
+    - submit(coalesce=True): la richiesta resta in attesa e parte appena finisce quella
+      in corso; più richieste in attesa si fondono nell'ultima.
+    - una richiesta con key diversa (es. altra data) rende obsoleto il risultato in
+      volo, che non viene consegnato; lo stesso fa invalidate()."""
+
+    finished = QtCore.pyqtSignal(object, object)  # key, risultato
+    failed = QtCore.pyqtSignal(object, object)    # key, eccezione
+
+    def __init__(self, pool: Optional[QtCore.QThreadPool] = None, parent=None):
+        super().__init__(parent)
+        self._pool = pool or QtCore.QThreadPool.globalInstance()
+        self._running: Optional[_Task] = None
+        self._pending: Optional[Tuple[Any, Callable[[], Any]]] = None
+        self._epoch = 0
+
+    def is_running(self) -> bool:
+        return self._running is not None
+
+    def invalidate(self):
+        """Scarta il risultato dell'esecuzione in corso (es. dopo una scrittura locale)."""
+        self._epoch += 1
+
+    def submit(self, key, fn: Callable[[], Any], coalesce: bool = True) -> bool:
+        """Avvia fn(); False se la richiesta è stata scartata o messa in attesa."""
+        if self._running is None:
+            self._start(key, fn)
+            return True
+        if self._running.key != key:
+            self.invalidate()
+        if coalesce:
+            self._pending = (key, fn)
+        return False
+
+    def _start(self, key, fn):
+        task = _Task(key, self._epoch, fn)
+        task.setAutoDelete(False)  # la vita del task la gestisce Python (self._running)
+        task.signals.done.connect(self._on_task_done)
+        self._running = task
+        self._pool.start(task)
+
+    @QtCore.pyqtSlot(object, int, object, object)
+    def _on_task_done(self, key, epoch, result, exc):
+        self._running = None
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self._start(*pending)
+        if epoch != self._epoch:
+            return
+        if exc is not None:
+            self.failed.emit(key, exc)
+        else:
+            self.finished.emit(key, result)
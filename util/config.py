@@ -26,7 +26,37 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "retention_days": 7,
     "euro_per_kg": 0.30,
     "poll_ms": 3000,
-    "mirror_interval_minutes": 5
+    "poll_max_ms": 30000,  # senza novità il polling rallenta fino a questo intervallo
+    "mirror_interval_minutes": 5,
+    "mirror_lookback_hours": 48,  # margine del sync incrementale (pagamenti modificati)
+    "full_mirror_hours": 24,      # ogni quanto rileggere tutta la collection
+    "cache_days": 32,             # giorni tenuti in cache (LRU)
+    "cache_ttl_s": 600,
+    "streaming": False,  # True: stream SSE al posto del polling ogni poll_ms
+    "http_pool_size": 4,
+    "http_retries": 3,
+    "http_backoff_s": 0.5,
+    "http_timeouts": {"read": 30, "write": 15, "auth": 15, "stream": [15, 90]},
+    "startup_budget_ms": 1500,  # oltre, l'avvio viene segnalato nel log
+    "sync_email": "",           # utente per sync_daemon.py (password da FRANTOIO_PASSWORD)
+    "token_cache": True,        # salva i token in token.json: all'avvio niente login
+    "token_refresh_margin_s": 300,
+    "outbox_flush_delay_ms": 500,  # modifiche entro questa pausa partono in un solo PATCH
+    "outbox_retry_s": 15,
+    "metrics_log": True,           # misure in logs/metrics.jsonl (a rotazione)
+    "metrics_log_kb": 1024,
+    "metrics_log_backups": 3,
+    "profile_every": 1,            # con la profilazione attiva: una chiamata ogni N
+    "work_hours": [7, 20],         # manutenzione dell'archivio (VACUUM...) fuori da questo orario
+    "rollover_days": 60,           # dopo quanti giorni dalla fine una stagione va nel suo file
+    "fb_page_size": 1000,          # record per pagina nella copia completa da Firebase
+    "cleanup_batch": 500,          # record cancellati da Firebase per ogni PATCH
+    "cleanup_pause_ms": 200,       # pausa tra un blocco di cancellazioni e il successivo
+    "paged_min_rows": 5000,        # intervalli d'archivio più grandi si sfogliano a pagine
+    "page_rows": 500,              # record per pagina nella vista a pagine
+    "lease_path": "locks/mirror",  # nodo RTDB della lease (vuoto: ogni PC fa anche la pulizia)
+    "lease_holder": "",            # nome di questo PC nella lease (default: host:pid)
+    "lease_ttl_s": 900             # senza rinnovo la lease passa a un altro PC dopo questo tempo
 }
 
 def _migrate_legacy_file(target: Path):
@@ -0,0 +1,234 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import logging.handlers
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+# Misure leggere sui percorsi caldi (repository, HTTP, SQLite, modello/vista Qt):
+# per ogni nome si tengono conteggi e gli ultimi tempi in memoria, e ogni evento
+# può finire in un log JSON-lines a rotazione. Niente Qt qui: lo usa anche sync_daemon.
+
+_WINDOW = 200  # tempi recenti per nome (percentili nel pannello di diagnostica)
+
+_log = logging.getLogger("app_frantoio.metrics")
+_log.propagate = False
+
+
+class Measure:
+    """Valori riempiti dentro `with METRICS.timer(...) as m:`."""
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self):
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+
+
+class _Stat:
+    __slots__ = ("kind", "n", "errors", "total_ms", "max_ms", "rows", "bytes", "recent")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.n = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.recent: Deque[float] = deque(maxlen=_WINDOW)
+
+
+class Metrics:
+    """Registro thread-safe delle misure.
+
+    - record(kind, name, ms, rows, bytes): un evento (es. "http", "GET read");
+    - timer(name) / timed(name): misurano un blocco o una funzione;
+    - count(name): contatori senza tempo (es. reset del modello);
+    - summary(): righe aggregate per il pannello; configure_log() attiva il JSONL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _Stat] = {}
+        self._counters: Dict[str, int] = {}
+        self.since = time.time()
+        self.log_path: Optional[Path] = None
+
+    def configure_log(self, path: Path, max_bytes: int = 1024 * 1024, backups: int = 3):
+        """Scrive ogni evento come riga JSON in path (ruotato a max_bytes)."""
+        for h in list(_log.handlers):
+            _log.removeHandler(h)
+            h.close()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            str(path), maxBytes=max(1, int(max_bytes)), backupCount=max(0, int(backups)),
+            encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _log.addHandler(handler)
+        _log.setLevel(logging.INFO)
+        self.log_path = path
+
+    def record(self, kind: str, name: str, ms: float, rows: Optional[int] = None,
+               nbytes: Optional[int] = None, error: Optional[str] = None, log: bool = True,
+               **extra):
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None:
+                st = self._stats[name] = _Stat(kind)
+            st.n += 1
+            st.total_ms += ms
+            st.max_ms = max(st.max_ms, ms)
+            st.rows += rows or 0
+            st.bytes += nbytes or 0
+            st.recent.append(ms)
+            if error is not None:
+                st.errors += 1
+        if log and _log.handlers:
+            ev = {"ts": datetime.now().isoformat(timespec="milliseconds"), "kind": kind,
+                  "name": name, "ms": round(ms, 2)}
+            if rows is not None:
+                ev["rows"] = rows
+            if nbytes is not None:
+                ev["bytes"] = nbytes
+            if error is not None:
+                ev["error"] = error
+            ev.update(extra)
+            _log.info(json.dumps(ev, ensure_ascii=False, default=str))
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str, kind: str = "repo", log: bool = True) -> Iterator[Measure]:
+        m = Measure()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield m
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(kind, name, (time.perf_counter() - t0) * 1000, m.rows, m.bytes,
+                        error=error, log=log)
+
+    def timed(self, name: str, kind: str = "repo"):
+        """Decoratore: misura la funzione; le righe sono la lunghezza della lista
+        ritornata o l'intero ritornato (es. record scritti da upsert_many)."""
+        def deco(fn: Callable):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, kind) as m:
+                    res = fn(*args, **kwargs)
+                    if isinstance(res, list):
+                        m.rows = len(res)
+                    elif isinstance(res, int) and not isinstance(res, bool):
+                        m.rows = res
+                    return res
+            return wrapper
+        return deco
+
+    def http_request(self, info: Dict[str, Any]):
+        """Callback on_request di HttpTransport."""
+        status = info.get("status")
+        error = info.get("error") or (f"HTTP {status}" if status and status >= 400 else None)
+        self.record("http", f"{info['method']} {info['op']}", info["ms"],
+                    nbytes=(info.get("bytes_in") or 0) + (info.get("bytes_out") or 0),
+                    error=error, status=status, url=info.get("url"))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(name, st, sorted(st.recent)) for name, st in self._stats.items()]
+            counters = dict(self._counters)
+        out = []
+        for name, st, recent in sorted(items, key=lambda t: (t[1].kind, t[0])):
+            out.append({
+                "kind": st.kind, "name": name, "n": st.n, "errors": st.errors,
+                "avg_ms": st.total_ms / st.n if st.n else 0.0,
+                "p50_ms": recent[len(recent) // 2] if recent else 0.0,
+                "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0,
+                "max_ms": st.max_ms, "rows": st.rows, "bytes": st.bytes,
+            })
+        for name, n in sorted(counters.items()):
+            out.append({"kind": "count", "name": name, "n": n, "errors": 0, "avg_ms": 0.0,
+                        "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0, "rows": 0, "bytes": 0})
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._counters.clear()
+            self.since = time.time()
+
+
+class Profiler:
+    """cProfile a campione: quando è attivo profila una chiamata ogni `every` di
+    ciascun nome e salva il .prof in `folder` (tiene gli ultimi `keep`).
+    Una sola profilazione alla volta: le altre chiamate girano normalmente."""
+
+    def __init__(self, folder: Optional[Path] = None, every: int = 1, keep: int = 20):
+        self.folder = folder
+        self.every = max(1, int(every))
+        self.keep = max(1, int(keep))
+        self.enabled = False
+        self.last_report = ""
+        self.last_file: Optional[Path] = None
+        self._calls: Dict[str, int] = {}
+        self._busy = threading.Lock()
+
+    def set_enabled(self, on: bool):
+        self.enabled = bool(on)
+        self._calls.clear()
+
+    def wrap(self, name: str, fn: Callable[[], Any]) -> Callable[[], Any]:
+        """fn() da eseguire (anche in un altro thread), profilata se tocca a lei."""
+        if not self.enabled:
+            return fn
+        n = self._calls.get(name, 0)
+        self._calls[name] = n + 1
+        if n % self.every:
+            return fn
+
+        def run():
+            if not self._busy.acquire(blocking=False):
+                return fn()
+            try:
+                prof = cProfile.Profile()
+                prof.enable()
+                try:
+                    return fn()
+                finally:
+                    prof.disable()
+                    self._save(name, prof)
+            finally:
+                self._busy.release()
+        return run
+
+    def _save(self, name: str, prof: cProfile.Profile):
+        buf = io.StringIO()
+        stats = pstats.Stats(prof, stream=buf)
+        stats.sort_stats("cumulative").print_stats(25)
+        self.last_report = f"{name} @ {datetime.now():%H:%M:%S}\n{buf.getvalue()}"
+        if self.folder is None:
+            return
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            path = self.folder / f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+            stats.dump_stats(str(path))
+            self.last_file = path
+            for old in sorted(self.folder.glob("*.prof"), key=lambda p: p.stat().st_mtime)[:-self.keep]:
+                old.unlink()
+        except OSError:
+            pass
+
+
+# istanza di processo, come il logger: la usano repository, client e GUI
+METRICS = Metrics()
@@ -1,4 +1,4 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Any
 
 try:
@@ -8,6 +8,9 @@ except Exception:
     from datetime import timezone, timedelta as _td
     TZ = timezone(_td(hours=2))
 
+# La campagna olearia parte a settembre: la stagione 2025 va dal 01/09/2025 al 31/08/2026
+SEASON_START_MONTH = 9
+
 def fmt_ts(ts_ms: Any) -> str:
         """Converte timestamp (ms) -> 'HH:MM' (solo ora, fuso Europe/Rome)."""
         if ts_ms is None or isinstance(ts_ms, dict):
@@ -18,6 +21,14 @@ def fmt_ts(ts_ms: Any) -> str:
             return ""
         return datetime.fromtimestamp(ts / 1000, TZ).strftime("%H:%M")
 
+def fmt_day(ts_ms: Any) -> str:
+        """Converte timestamp (ms) -> 'dd/mm/YYYY' (fuso Europe/Rome)."""
+        try:
+            ts = int(float(ts_ms))
+        except Exception:
+            return ""
+        return datetime.fromtimestamp(ts / 1000, TZ).strftime("%d/%m/%Y")
+
 def day_bounds_ts_ms(d: date):
         start = datetime(d.year, d.month, d.day, 0, 0, tzinfo=TZ)
         end   = datetime(d.year, d.month, d.day, 23, 59, 59, 999000, tzinfo=TZ)
@@ -30,3 +41,13 @@ def in_day(ts_ms: Any, d: date) -> bool:
             return False
         a, b = day_bounds_ts_ms(d)
         return a <= ts <= b
+
+def season_of(d: date) -> int:
+        """Anno di inizio della stagione a cui appartiene il giorno d."""
+        return d.year if d.month >= SEASON_START_MONTH else d.year - 1
+
+def season_bounds(season: int):
+        """(primo giorno, ultimo giorno) della stagione."""
+        start = date(season, SEASON_START_MONTH, 1)
+        end = date(season + 1, SEASON_START_MONTH, 1) - timedelta(days=1)
+        return start, end